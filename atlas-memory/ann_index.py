@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Atlas ANN Index
+Persistent inverted-file (IVF) index for approximate nearest-neighbour recall.
+
+Vectors are clustered around spherical k-means centroids. A query scores the
+centroids, probes the `nprobe` closest lists and runs one small mat-vec per
+list, so cost grows with the probed lists rather than the whole corpus.
+
+The index lives in a directory next to the database
+(e.g. atlas_memory.facts.ivf/) as plain .npy files that are memory-mapped on
+load. It is kept in step with the embedding tables incrementally: rows added
+since the last save are inserted, and items logged in vector_removals since
+then (by triggers on the embedding and parent tables) are removed, so a sync
+costs the size of the change rather than the corpus.
+"""
+
+import json
+import shutil
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from embedding_store import VECTOR_SOURCES, ensure_storage_schema, has_table, load_engine, source_sql
+from vector_engine import VectorEngine, decode_vector, normalize
+
+# Corpora at least this large get an IVF index instead of exact search
+ANN_MIN_VECTORS = 50000
+# Unsaved in-process changes tolerated before close() persists the index
+ANN_SAVE_THRESHOLD = 1024
+MIN_NPROBE = 16
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 32
+
+
+def default_nlist(count: int) -> int:
+    """Number of inverted lists for a corpus of `count` vectors."""
+    return int(max(1, min(65536, round(4 * count ** 0.5))))
+
+
+def default_nprobe(nlist: int) -> int:
+    """Lists probed per query: about 3% of the lists, never fewer than 16."""
+    return min(nlist, max(MIN_NPROBE, nlist // 32))
+
+
+def spherical_kmeans(vectors: np.ndarray, nlist: int,
+                     iterations: int = KMEANS_ITERATIONS,
+                     seed: int = 0) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity, returning unit centroids."""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(vectors))
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros((nlist, sample.shape[1]), dtype=np.float32)
+        np.add.at(sums, assign, sample)
+        norms = np.linalg.norm(sums, axis=1)
+        # Re-seed lists that lost every member (or cancel out) from random sample points
+        empty = (np.bincount(assign, minlength=nlist) == 0) | (norms == 0)
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms[empty] = np.linalg.norm(sums[empty], axis=1)
+        centroids = (sums / norms[:, None]).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index with one contiguous vector block per list."""
+
+    def __init__(self, centroids: np.ndarray, nprobe: Optional[int] = None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.dimensions = self.centroids.shape[1]
+        self.nprobe = nprobe or default_nprobe(len(self.centroids))
+        nlist = len(self.centroids)
+        self._list_ids: List[np.ndarray] = [np.empty(0, dtype=np.int64)] * nlist
+        self._list_vectors: List[np.ndarray] = [
+            np.empty((0, self.dimensions), dtype=np.float32)
+        ] * nlist
+        self._list_sizes = np.zeros(nlist, dtype=np.int64)
+        self._owned = np.zeros(nlist, dtype=bool)
+        self._where: Dict[int, Tuple[int, int]] = {}
+        self.source_max_rowid = 0
+        # Last vector_removals seq applied (None: unknown, rescan live ids)
+        self.removal_seq: Optional[int] = None
+        self.dirty = 0
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, item_id: int) -> bool:
+        return int(item_id) in self._where
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    # ==================== BUILD / PERSIST ====================
+
+    @classmethod
+    def build(cls, ids: np.ndarray, matrix: np.ndarray,
+              nlist: Optional[int] = None, nprobe: Optional[int] = None) -> "IVFIndex":
+        """Train centroids on `matrix` (unit rows) and add every vector."""
+        nlist = nlist or default_nlist(len(ids))
+        if len(ids) == 0:
+            dims = matrix.shape[1] if matrix.ndim == 2 else 1536
+            return cls(np.zeros((1, dims), dtype=np.float32), nprobe)
+        index = cls(spherical_kmeans(matrix, nlist), nprobe)
+        assign = index._assign(matrix)
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(index.nlist + 1))
+        for list_no in range(index.nlist):
+            rows = order[bounds[list_no]:bounds[list_no + 1]]
+            index._set_list(list_no, ids[rows].astype(np.int64), matrix[rows])
+        return index
+
+    def _set_list(self, list_no: int, ids: np.ndarray, vectors: np.ndarray, owned: bool = True):
+        self._list_ids[list_no] = ids
+        self._list_vectors[list_no] = vectors
+        self._list_sizes[list_no] = len(ids)
+        self._owned[list_no] = owned
+        for offset, item_id in enumerate(ids.tolist()):
+            self._where[item_id] = (list_no, offset)
+
+    def save(self, path: Union[str, Path]):
+        """Write the index as memory-mappable .npy files under `path`."""
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+
+        sizes = self._list_sizes
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        ids = np.empty(int(offsets[-1]), dtype=np.int64)
+        vectors = np.lib.format.open_memmap(
+            tmp / 'vectors.npy', mode='w+', dtype=np.float32,
+            shape=(int(offsets[-1]), self.dimensions)
+        )
+        for list_no in range(self.nlist):
+            n = int(sizes[list_no])
+            lo = int(offsets[list_no])
+            ids[lo:lo + n] = self._list_ids[list_no][:n]
+            vectors[lo:lo + n] = self._list_vectors[list_no][:n]
+        vectors.flush()
+        del vectors
+
+        np.save(tmp / 'centroids.npy', self.centroids)
+        np.save(tmp / 'ids.npy', ids)
+        np.save(tmp / 'offsets.npy', offsets)
+        (tmp / 'meta.json').write_text(json.dumps({
+            'nprobe': self.nprobe,
+            'source_max_rowid': self.source_max_rowid,
+            'removal_seq': self.removal_seq,
+            'count': len(self),
+        }))
+
+        if path.exists():
+            shutil.rmtree(path)
+        tmp.rename(path)
+        self.dirty = 0
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "IVFIndex":
+        """Load a saved index; list blocks stay memory-mapped until written."""
+        path = Path(path)
+        meta = json.loads((path / 'meta.json').read_text())
+        index = cls(np.load(path / 'centroids.npy'), meta.get('nprobe'))
+        ids = np.load(path / 'ids.npy')
+        offsets = np.load(path / 'offsets.npy')
+        vectors = np.load(path / 'vectors.npy', mmap_mode='r')
+        for list_no in range(index.nlist):
+            lo, hi = int(offsets[list_no]), int(offsets[list_no + 1])
+            index._set_list(list_no, ids[lo:hi], vectors[lo:hi], owned=False)
+        index.source_max_rowid = meta.get('source_max_rowid', 0)
+        index.removal_seq = meta.get('removal_seq')
+        return index
+
+    # ==================== UPDATES ====================
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def _writable(self, list_no: int, capacity: int):
+        """Make list `list_no` an owned, growable block with room for `capacity` rows."""
+        ids = self._list_ids[list_no]
+        vectors = self._list_vectors[list_no]
+        if self._owned[list_no] and len(ids) >= capacity:
+            return
+        size = int(self._list_sizes[list_no])
+        new_capacity = max(capacity, 2 * len(ids), 16)
+        new_ids = np.empty(new_capacity, dtype=np.int64)
+        new_vectors = np.empty((new_capacity, self.dimensions), dtype=np.float32)
+        new_ids[:size] = ids[:size]
+        new_vectors[:size] = vectors[:size]
+        self._list_ids[list_no] = new_ids
+        self._list_vectors[list_no] = new_vectors
+        self._owned[list_no] = True
+
+    def upsert(self, item_id: int, embedding):
+        """Insert or replace the vector for `item_id`."""
+        vector = normalize(embedding)
+        if len(vector) != self.dimensions:
+            return
+        item_id = int(item_id)
+        self.remove(item_id)
+        list_no = int(self._assign(vector[None, :])[0])
+        size = int(self._list_sizes[list_no])
+        self._writable(list_no, size + 1)
+        self._list_ids[list_no][size] = item_id
+        self._list_vectors[list_no][size] = vector
+        self._list_sizes[list_no] = size + 1
+        self._where[item_id] = (list_no, size)
+        self.dirty += 1
+
+    def remove(self, item_id: int) -> bool:
+        """Drop `item_id` from its list. Returns True if it was present."""
+        location = self._where.pop(int(item_id), None)
+        if location is None:
+            return False
+        list_no, offset = location
+        last = int(self._list_sizes[list_no]) - 1
+        self._writable(list_no, last + 1)
+        if offset != last:
+            ids = self._list_ids[list_no]
+            vectors = self._list_vectors[list_no]
+            ids[offset] = ids[last]
+            vectors[offset] = vectors[last]
+            self._where[int(ids[offset])] = (list_no, offset)
+        self._list_sizes[list_no] = last
+        self.dirty += 1
+        return True
+
+    # ==================== SEARCH ====================
+
+    def get(self, item_id: int) -> Optional[np.ndarray]:
+        """Return the stored unit vector for `item_id`, if any."""
+        location = self._where.get(int(item_id))
+        if location is None:
+            return None
+        list_no, offset = location
+        return self._list_vectors[list_no][offset]
+
+    def similarities(self, query, item_ids: Iterable[int]) -> Dict[int, float]:
+        """Exact cosine similarity of `query` against just the given ids."""
+        q = normalize(query)
+        out = {}
+        for item_id in item_ids:
+            vector = self.get(item_id)
+            if vector is not None:
+                out[int(item_id)] = float(vector @ q)
+        return out
+
+    def search(self, query, k: int = 10, min_score: float = -1.0,
+               candidates: Optional[Iterable[int]] = None,
+               nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Return up to `k` approximate (id, similarity) pairs, best first.
+        With `candidates`, probing widens until k eligible hits are found.
+        """
+        if len(self) == 0 or k <= 0:
+            return []
+        q = normalize(query)
+        allowed = None
+        if candidates is not None:
+            allowed = np.fromiter(candidates, dtype=np.int64)
+            if len(allowed) == 0:
+                return []
+
+        order = np.argsort(-(self.centroids @ q))
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probed = 0
+        all_ids = []
+        all_scores = []
+        found = 0
+        while probed < self.nlist:
+            for list_no in order[probed:nprobe]:
+                size = int(self._list_sizes[list_no])
+                if size == 0:
+                    continue
+                ids = self._list_ids[list_no][:size]
+                scores = self._list_vectors[list_no][:size] @ q
+                if allowed is not None:
+                    mask = np.isin(ids, allowed)
+                    ids, scores = ids[mask], scores[mask]
+                all_ids.append(ids)
+                all_scores.append(scores)
+                found += int(np.count_nonzero(scores >= min_score))
+            probed = nprobe
+            if allowed is None or found >= k:
+                break
+            nprobe = min(nprobe * 4, self.nlist)
+
+        if not all_ids:
+            return []
+        ids = np.concatenate(all_ids)
+        scores = np.concatenate(all_scores)
+        if len(ids) == 0:
+            return []
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(ids[pos]), float(scores[pos]))
+            for pos in top
+            if scores[pos] >= min_score
+        ]
+
+
+# ==================== OPEN / SYNC ====================
+
+def index_path(db_path: Union[str, Path], name: str) -> Path:
+    """Directory holding the IVF index for `name` next to the database."""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}.{name}.ivf")
+
+
+def _source_max_rowid(conn: sqlite3.Connection, name: str) -> int:
+    table = VECTOR_SOURCES[name][0]
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+
+def _removal_seq(conn: sqlite3.Connection) -> Optional[int]:
+    """Last seq issued to vector_removals (None on databases without the log)."""
+    if not has_table(conn, 'vector_removals'):
+        return None
+    row = conn.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'vector_removals'"
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def _pruned_key(name: str) -> str:
+    return f"vector_removals_pruned.{name}"
+
+
+def sync_index(conn: sqlite3.Connection, index: IVFIndex, name: str) -> int:
+    """Apply rows written and removed since the index was saved. Returns the change count."""
+    _, id_column, _ = VECTOR_SOURCES[name]
+    changes = 0
+    # Bounds first: anything committed after them is picked up next time
+    max_rowid = _source_max_rowid(conn, name)
+    removal_seq = _removal_seq(conn)
+
+    pruned = conn.execute(
+        "SELECT value FROM atlas_settings WHERE key = ?", (_pruned_key(name),)
+    ).fetchone()
+    if (removal_seq is not None and index.removal_seq is not None
+            and index.removal_seq >= (int(pruned[0]) if pruned else 0)):
+        # Items whose embedding or parent row was deleted since the last sync
+        removed = conn.execute(
+            """SELECT DISTINCT item_id FROM vector_removals
+               WHERE source = ? AND seq > ? AND seq <= ?""",
+            (name, index.removal_seq, removal_seq)
+        ).fetchall()
+        for (item_id,) in removed:
+            changes += index.remove(item_id)
+    else:
+        # No usable removal log: compare against every live id once
+        live = {
+            row[0] for row in conn.execute(source_sql(name, f"e.{id_column}")).fetchall()
+        }
+        for item_id in [i for i in index._where if i not in live]:
+            index.remove(item_id)
+            changes += 1
+
+    # Rows (re)written after the saved high-water mark (re-adds included)
+    rows = conn.execute(
+        source_sql(name, f"e.{id_column}, e.embedding, e.dtype, e.scale",
+                   "WHERE e.id > ? AND e.id <= ?"),
+        (index.source_max_rowid, max_rowid)
+    ).fetchall()
+    for item_id, blob, dtype, scale in rows:
+        index.upsert(item_id, decode_vector(blob, dtype, scale))
+        changes += 1
+
+    index.source_max_rowid = max_rowid
+    index.removal_seq = removal_seq
+    return changes
+
+
+def save_index(conn: sqlite3.Connection, index: IVFIndex,
+               db_path: Union[str, Path], name: str):
+    """
+    Save `index` and drop the removal log entries it has absorbed. Indexes
+    synced to an older seq see the pruned mark and rescan live ids instead.
+    """
+    index.save(index_path(db_path, name))
+    if index.removal_seq is None:
+        return
+    opened = not conn.in_transaction
+    conn.execute("DELETE FROM vector_removals WHERE source = ? AND seq <= ?",
+                 (name, index.removal_seq))
+    conn.execute("INSERT OR REPLACE INTO atlas_settings (key, value) VALUES (?, ?)",
+                 (_pruned_key(name), str(index.removal_seq)))
+    if opened:
+        conn.commit()
+
+
+def rebuild_index(conn: sqlite3.Connection, db_path: Union[str, Path], name: str,
+                  nlist: Optional[int] = None, dimensions: int = 1536) -> IVFIndex:
+    """Train a fresh IVF index over every live embedding of `name` and save it."""
+    max_rowid = _source_max_rowid(conn, name)
+    removal_seq = _removal_seq(conn)
+    exact = load_engine(conn, name, dimensions, dtype='float32')
+    index = IVFIndex.build(exact.ids, exact.matrix, nlist)
+    index.source_max_rowid = max_rowid
+    index.removal_seq = removal_seq
+    save_index(conn, index, db_path, name)
+    return index
+
+
+def open_vector_index(conn: sqlite3.Connection, db_path: Union[str, Path], name: str,
+                      dimensions: int = 1536) -> Union[VectorEngine, IVFIndex]:
+    """
+    Open the best vector index for `name`.
+    A saved IVF index is loaded and synced; large corpora without one get
+    an index built on the spot; small corpora use the exact engine.
+    """
+    ensure_storage_schema(conn)
+    path = index_path(db_path, name)
+    if path.exists():
+        index = IVFIndex.load(path)
+        if sync_index(conn, index, name) >= ANN_SAVE_THRESHOLD:
+            save_index(conn, index, db_path, name)
+        return index
+
+    count = conn.execute(source_sql(name, "COUNT(*)")).fetchone()[0]
+    if count >= ANN_MIN_VECTORS:
+        return rebuild_index(conn, db_path, name, dimensions=dimensions)
+    return load_engine(conn, name, dimensions)
+
+
+def recall_at_k(index: IVFIndex, exact: VectorEngine, k: int = 10,
+                queries: int = 200, seed: int = 0) -> float:
+    """Mean recall@k of `index` against exact search, using stored vectors as queries."""
+    if len(exact) == 0:
+        return 1.0
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(exact), min(queries, len(exact)), replace=False)
+    total = 0.0
+    for pos in sample:
+        q = exact.matrix[pos]
+        truth = {i for i, _ in exact.search(q, k)}
+        approx = {i for i, _ in index.search(q, k)}
+        total += len(truth & approx) / max(len(truth), 1)
+    return total / len(sample)
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+Atlas Message Archive
+Cold storage for old conversation messages, still searchable.
+
+Messages older than ARCHIVE_AFTER_DAYS leave the `messages` table (with
+their embeddings and chunks) for one segment per calendar month under
+`<db stem>.archive/` next to the database:
+
+    messages-2026-03.jsonl.zst      the rows, one JSON object per line
+                                    (gzip when zstandard is not installed)
+    messages-2026-03.vectors.npz    float32 vectors plus the message id of
+                                    each row (a long message's chunks too)
+
+The `message_segments` manifest records each segment's month, files, id
+and time range, sessions and embedding space, and a summary of its vectors:
+up to SUMMARY_CENTROIDS spherical k-means centroids, each with the smallest
+cosine of its rows to it. Every row lies within that angle of its centroid,
+so cos(angle(q, centroid) - angle) bounds the best score a segment can give
+a query. search() visits segments from the highest bound down and stops once
+no remaining segment can beat the k-th hit, so a query only opens the months
+it can match.
+
+Only messages already covered by a level-0 summary are archived: recall
+(summarizer.py) keeps reading the frontier, and nothing unsummarised goes
+cold. Message ids are AUTOINCREMENT, so archived ids are never reused.
+"""
+
+import gzip
+import heapq
+import io
+import json
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from chunked_embeddings import split_chunks
+from connections import apply_schema
+from embedding_store import (
+    delete_embeddings, embedding_model, exact_vectors, has_table, matches_embedding_model
+)
+from embeddings import mean_pool
+from vector_engine import blob_to_vector
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ATLAS_ARCHIVE_DAYS", "90"))
+ZSTD_LEVEL = 10
+# Segments kept decoded in memory between searches
+SEGMENT_CACHE_SIZE = 8
+# Summary vectors per segment, and k-means passes to place them
+SUMMARY_CENTROIDS = 8
+SUMMARY_ITERATIONS = 10
+
+_RECORD_COLUMNS = ('id', 'role', 'content', 'session_id', 'token_count', 'timestamp')
+
+
+def ensure_archive_schema(conn: sqlite3.Connection):
+    """Create the segment manifest (see schema.sql) on older databases."""
+    apply_schema(conn)
+
+
+def _segment_names(month: str) -> Tuple[str, str]:
+    """Fresh (records, vectors) file names for a new version of a month's segment."""
+    version = f"{time.time_ns():x}"
+    return (f"messages-{month}.{version}.jsonl.{_codec()}",
+            f"messages-{month}.{version}.vectors.npz")
+
+
+def archive_dir(db_path: Union[str, Path]) -> Path:
+    """Directory holding the archive segments of a database."""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}.archive")
+
+
+# ==================== SEGMENT FILES ====================
+
+def _codec() -> str:
+    return 'zst' if zstandard is not None else 'gz'
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_records(path: Path, records: Sequence[Dict]):
+    """Write records as compressed JSONL (zstd or gzip, by suffix)."""
+    raw = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records).encode('utf-8')
+    if path.suffix == '.zst':
+        data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    else:
+        data = gzip.compress(raw, mtime=0)
+    _write_atomic(path, data)
+
+
+def read_records(path: Path) -> List[Dict]:
+    """Records of a segment file."""
+    data = path.read_bytes()
+    if path.suffix == '.zst':
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path.name} needs zstandard (pip install zstandard)")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        raw = gzip.decompress(data)
+    return [json.loads(line) for line in raw.decode('utf-8').splitlines() if line]
+
+
+def write_vectors(path: Path, owners: np.ndarray, vectors: np.ndarray):
+    buffer = io.BytesIO()
+    np.savez(buffer, ids=owners.astype(np.int64), vectors=vectors.astype(np.float32))
+    _write_atomic(path, buffer.getvalue())
+
+
+def read_vectors(path: Path) -> Tuple[np.ndarray, np.ndarray]:
+    """(message id per row, float32 row vectors) of a segment."""
+    if not path.exists():
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.float32)
+    with np.load(path) as data:
+        return data['ids'], data['vectors']
+
+
+def summarize_vectors(vectors: np.ndarray, count: int = SUMMARY_CENTROIDS
+                      ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Spherical k-means centroids of unit rows, and for each the smallest
+    cosine of a row assigned to it. (None, None) for an empty segment.
+    """
+    if not len(vectors):
+        return None, None
+    count = min(count, len(vectors))
+    rng = np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), count, replace=False)].copy()
+    for _ in range(SUMMARY_ITERATIONS):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for j in range(count):
+            mean = vectors[assign == j].sum(axis=0)
+            norm = float(np.linalg.norm(mean))
+            if norm:
+                centroids[j] = mean / norm
+    similarity = vectors @ centroids.T
+    assign = np.argmax(similarity, axis=1)
+    used = np.unique(assign)
+    min_similarities = np.array([similarity[assign == j, j].min() for j in used], dtype=np.float32)
+    return centroids[used].astype(np.float32), min_similarities
+
+
+def score_bound(query: np.ndarray, centroids: np.ndarray, min_similarities: np.ndarray) -> float:
+    """Upper bound on the cosine of `query` to any row of a segment."""
+    to_centroid = np.arccos(np.clip(centroids @ query, -1.0, 1.0))
+    spread = np.arccos(np.clip(min_similarities, -1.0, 1.0))
+    return float(np.cos(np.maximum(to_centroid - spread, 0.0)).max())
+
+
+def embed_texts(texts: Sequence[str], embed_batch: Callable[[List[str]], List[List[float]]]
+                ) -> List[List[List[float]]]:
+    """
+    Vectors of each text in one embedding call: the text's own vector, plus
+    its chunk vectors when it is long (as chunked_embeddings stores them).
+    """
+    pieces = [split_chunks(text) for text in texts]
+    flat = embed_batch([chunk for chunks in pieces for chunk in chunks])
+    out = []
+    position = 0
+    for chunks in pieces:
+        vectors = flat[position:position + len(chunks)]
+        position += len(chunks)
+        out.append(vectors if len(vectors) == 1 else [mean_pool(vectors)] + vectors)
+    return out
+
+
+def _pack(owners: List[int], vectors: List) -> Tuple[np.ndarray, np.ndarray]:
+    """Owner ids and unit-normalised row matrix of collected vectors."""
+    if not owners:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.float32)
+    matrix = np.asarray(np.stack([np.asarray(v, dtype=np.float32) for v in vectors]))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.asarray(owners, dtype=np.int64), matrix / np.where(norms == 0, 1, norms)
+
+
+def _summary_blobs(centroids: Optional[np.ndarray], min_similarities: Optional[np.ndarray]
+                   ) -> Tuple[Optional[bytes], Optional[bytes]]:
+    if centroids is None:
+        return None, None
+    return centroids.astype(np.float32).tobytes(), min_similarities.astype(np.float32).tobytes()
+
+
+class Segment:
+    """One month of archived messages, decoded."""
+
+    def __init__(self, root: Path, row):
+        self.month = row['month']
+        self.path = root / row['path']
+        self.vectors_path = root / row['vectors_path']
+        self.owners, self.vectors = read_vectors(self.vectors_path)
+        self._records = None
+
+    @property
+    def records(self) -> Dict[int, Dict]:
+        """Archived messages by id (decompressed on first use)."""
+        if self._records is None:
+            self._records = {r['id']: r for r in read_records(self.path)}
+        return self._records
+
+    def search(self, query: np.ndarray, k: int, min_score: float,
+               allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k messages by their best row (own vector or chunk)."""
+        if not len(self.vectors):
+            return []
+        scores = self.vectors @ query
+        keep = scores > min_score
+        if allowed is not None:
+            keep &= np.isin(self.owners, allowed)
+        rows = np.flatnonzero(keep)
+        if not len(rows):
+            return []
+        rows = rows[np.argsort(-scores[rows], kind='stable')]
+        _, first = np.unique(self.owners[rows], return_index=True)
+        best = rows[np.sort(first)][:k]
+        return [(int(self.owners[i]), float(scores[i])) for i in best]
+
+
+# ==================== ARCHIVE ====================
+
+class MessageArchive:
+    """The cold tier of `messages` for one database."""
+
+    def __init__(self, conn: sqlite3.Connection, db_path: Union[str, Path]):
+        self.conn = conn
+        self.root = archive_dir(db_path)
+        self._segments: "OrderedDict[str, Tuple[Tuple, Segment]]" = OrderedDict()
+
+    def _manifest(self, where: str = "", params: tuple = ()) -> List[Dict]:
+        if not has_table(self.conn, 'message_segments'):
+            return []
+        cursor = self.conn.execute(f"SELECT * FROM message_segments {where} ORDER BY month", params)
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def segments(self) -> List[Dict]:
+        """Manifest rows, oldest month first (without the summary vectors)."""
+        out = []
+        for row in self._manifest():
+            row.pop('centroids')
+            row['summary_vectors'] = len(row.pop('min_similarities') or b'') // 4
+            row['sessions'] = json.loads(row['sessions'])
+            row['bytes'] = sum(
+                (self.root / row[key]).stat().st_size
+                for key in ('path', 'vectors_path') if (self.root / row[key]).exists()
+            )
+            out.append(row)
+        return out
+
+    def _segment(self, row: Dict) -> Segment:
+        """A decoded segment, from the cache while its files are unchanged."""
+        path = self.root / row['path']
+        stamp = (row['path'], row['vectors_path'], path.stat().st_mtime_ns if path.exists() else 0)
+        cached = self._segments.get(row['month'])
+        if cached is not None and cached[0] == stamp:
+            self._segments.move_to_end(row['month'])
+            return cached[1]
+        segment = Segment(self.root, row)
+        self._segments[row['month']] = (stamp, segment)
+        while len(self._segments) > SEGMENT_CACHE_SIZE:
+            self._segments.popitem(last=False)
+        return segment
+
+    # ==================== ARCHIVAL ====================
+
+    def candidate_months(self, older_than_days: int) -> List[str]:
+        """Months holding summarised messages older than `older_than_days`."""
+        rows = self.conn.execute(f"""
+            SELECT DISTINCT substr(m.timestamp, 1, 7) FROM messages m
+            WHERE {self._archivable_sql()}
+            ORDER BY 1
+        """, (f'-{int(older_than_days)} days',)).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _archivable_sql() -> str:
+        return """m.timestamp < strftime('%Y-%m-%dT%H:%M:%fZ', 'now', ?)
+                  AND m.id <= COALESCE((SELECT MAX(s.end_message_id) FROM summaries s
+                                        WHERE s.session_id = m.session_id AND s.level = 0), 0)"""
+
+    def archive(self, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                embed_batch: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                model: Optional[str] = None) -> Dict:
+        """
+        Move summarised messages older than `older_than_days` into their
+        monthly segments, one transaction per month. Messages without a
+        stored vector are embedded with `embed_batch` (when `model` is the
+        database's embedding space) so they stay searchable.
+        """
+        ensure_archive_schema(self.conn)
+        self.root.mkdir(parents=True, exist_ok=True)
+        stats = {'months': [], 'archived': 0, 'embedded': 0, 'skipped_months': []}
+        for month in self.candidate_months(older_than_days):
+            try:
+                archived, embedded = self._archive_month(month, older_than_days, embed_batch, model)
+            except Exception:
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                raise
+            if archived is None:
+                stats['skipped_months'].append(month)
+                continue
+            if not archived:
+                continue
+            stats['months'].append(month)
+            stats['archived'] += archived
+            stats['embedded'] += embedded
+        return stats
+
+    def _archive_month(self, month: str, older_than_days: int, embed_batch, model) -> Tuple[Optional[int], int]:
+        if self.conn.in_transaction:
+            self.conn.commit()
+        select = f"""
+            SELECT {', '.join('m.' + c for c in _RECORD_COLUMNS)} FROM messages m
+            WHERE substr(m.timestamp, 1, 7) = ? AND {self._archivable_sql()}
+            ORDER BY m.id
+        """
+        params = (month, f'-{int(older_than_days)} days')
+
+        # Embed messages without a stored vector before taking the write
+        # lock, so other writers never wait on the provider
+        fresh_vectors: Dict[int, Tuple[str, List]] = {}
+        embedding = embed_batch is not None and model and matches_embedding_model(self.conn, model)
+        if embedding:
+            rows = self.conn.execute(select, params).fetchall()
+            ids = [row[0] for row in rows]
+            have = set(self._hot_vectors(ids)[0])
+            missing = [dict(zip(_RECORD_COLUMNS, row)) for row in rows if row[0] not in have]
+            if self.conn.in_transaction:
+                self.conn.commit()
+            if missing:
+                for record, rows_of in zip(missing, embed_texts([r['content'] for r in missing], embed_batch)):
+                    fresh_vectors[record['id']] = (record['content'], rows_of)
+
+        # Hold the write lock while the manifest moves, so concurrent
+        # archivers cannot interleave on one month
+        self.conn.execute("BEGIN IMMEDIATE")
+        records = [dict(zip(_RECORD_COLUMNS, row)) for row in self.conn.execute(select, params).fetchall()]
+        space = embedding_model(self.conn) or model
+        owners, vectors = self._hot_vectors([r['id'] for r in records])
+        have = set(owners)
+        if embedding:
+            # Messages that lost their vector or changed since embedding wait for the next run
+            records = [r for r in records if r['id'] in have
+                       or fresh_vectors.get(r['id'], (None,))[0] == r['content']]
+        if not records:
+            self.conn.rollback()
+            return 0, 0
+        ids = [r['id'] for r in records]
+
+        existing = self._manifest("WHERE month = ?", (month,))
+        existing = existing[0] if existing else None
+        if existing and existing['embedding_model'] not in (None, space):
+            print(f"[Memory] Archive segment {month} holds {existing['embedding_model']} vectors, "
+                  f"not {space}; skipped until the archive is re-embedded")
+            self.conn.rollback()
+            return None, 0
+
+        embedded = 0
+        for record in records:
+            if record['id'] not in have and record['id'] in fresh_vectors:
+                rows_of = fresh_vectors[record['id']][1]
+                owners.extend([record['id']] * len(rows_of))
+                vectors.extend(rows_of)
+                embedded += 1
+        if embedded:
+            space = space or model
+        owners, vectors = _pack(owners, vectors)
+
+        if existing:
+            old = Segment(self.root, existing)
+            fresh = set(ids)
+            records = [r for r in old.records.values() if r['id'] not in fresh] + records
+            keep = ~np.isin(old.owners, ids)
+            if keep.any():
+                if len(owners):
+                    owners = np.concatenate([old.owners[keep], owners])
+                    vectors = np.vstack([old.vectors[keep], vectors])
+                else:
+                    owners, vectors = old.owners[keep], old.vectors[keep]
+            records.sort(key=lambda r: r['id'])
+
+        # New files go under a name of their own: the manifest switches to
+        # them only if the commit succeeds, and the old files stay intact until then
+        path, vectors_path = _segment_names(month)
+        written = [self.root / path, self.root / vectors_path]
+        try:
+            write_records(self.root / path, records)
+            write_vectors(self.root / vectors_path, owners, vectors)
+            centroids, min_similarities = summarize_vectors(vectors)
+            self.conn.execute(
+                """INSERT OR REPLACE INTO message_segments
+                   (month, path, vectors_path, message_count, first_message_id, last_message_id,
+                    first_timestamp, last_timestamp, sessions, embedding_model, centroids,
+                    min_similarities, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))""",
+                (month, path, vectors_path, len(records), records[0]['id'], records[-1]['id'],
+                 min(r['timestamp'] for r in records), max(r['timestamp'] for r in records),
+                 json.dumps(sorted({r['session_id'] for r in records})), space,
+                 *_summary_blobs(centroids, min_similarities))
+            )
+            delete_embeddings(self.conn, 'messages', ids)
+            # Chunks and their vectors follow through the messages_chunks_ad trigger
+            self.conn.executemany("DELETE FROM messages WHERE id = ?", [(i,) for i in ids])
+            self.conn.commit()
+        except BaseException:
+            for file in written:
+                file.unlink(missing_ok=True)
+            raise
+
+        if existing:
+            for key in ('path', 'vectors_path'):
+                (self.root / existing[key]).unlink(missing_ok=True)
+        self._segments.pop(month, None)
+        return len(ids), embedded
+    
+    def _hot_vectors(self, ids: List[int]) -> Tuple[List[int], List]:
+        """Stored message and chunk vectors of `ids` as (owner ids, rows)."""
+        owners, vectors = [], []
+        for message_id, vector in exact_vectors(self.conn, 'messages', ids).items():
+            owners.append(message_id)
+            vectors.append(vector)
+        if has_table(self.conn, 'message_chunks'):
+            chunk_owner = {}
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                chunk_owner.update(self.conn.execute(
+                    f"SELECT id, message_id FROM message_chunks WHERE message_id IN ({placeholders})",
+                    chunk
+                ).fetchall())
+            for chunk_id, vector in exact_vectors(self.conn, 'message_chunks', list(chunk_owner)).items():
+                owners.append(chunk_owner[chunk_id])
+                vectors.append(vector)
+        return owners, vectors
+
+    def reembed(self, embed_batch: Callable[[List[str]], List[List[float]]], model: str) -> int:
+        """Re-embed every segment into `model`'s space (after `embeddings switch`). Returns messages."""
+        done = 0
+        for row in self._manifest():
+            if row['embedding_model'] == model:
+                continue
+            records = read_records(self.root / row['path'])
+            owners, vectors = [], []
+            for record, rows_of in zip(records, embed_texts([r['content'] for r in records], embed_batch)):
+                owners.extend([record['id']] * len(rows_of))
+                vectors.extend(rows_of)
+            owners, vectors = _pack(owners, vectors)
+            vectors_path = _segment_names(row['month'])[1]
+            write_vectors(self.root / vectors_path, owners, vectors)
+            try:
+                with self.conn:
+                    self.conn.execute(
+                        """UPDATE message_segments SET vectors_path = ?, embedding_model = ?, centroids = ?,
+                                  min_similarities = ?, updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+                           WHERE month = ?""",
+                        (vectors_path, model, *_summary_blobs(*summarize_vectors(vectors)), row['month'])
+                    )
+            except BaseException:
+                (self.root / vectors_path).unlink(missing_ok=True)
+                raise
+            (self.root / row['vectors_path']).unlink(missing_ok=True)
+            self._segments.pop(row['month'], None)
+            done += len(records)
+        return done
+
+    # ==================== SEARCH ====================
+
+    def search(self, query: Sequence[float], k: int = 10, min_score: float = -1.0,
+               session_id: Optional[str] = None, floor: float = -1.0,
+               model: Optional[str] = None) -> List[Dict]:
+        """
+        Top-k archived messages for `query`, visiting segments by score bound.
+        Segments that cannot beat `floor` (e.g. the k-th hot hit) are skipped.
+        """
+        rows = [
+            row for row in self._manifest("WHERE centroids IS NOT NULL")
+            if (model is None or row['embedding_model'] == model)
+            and (session_id is None or session_id in json.loads(row['sessions']))
+        ]
+        if not rows:
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if not norm:
+            return []
+        q = q / norm
+        bounds = np.full(len(rows), -1.0)
+        for i, row in enumerate(rows):
+            min_similarities = np.frombuffer(row['min_similarities'], dtype=np.float32)
+            centroids = blob_to_vector(row['centroids'])
+            if len(centroids) == len(min_similarities) * len(q):
+                bounds[i] = score_bound(q, centroids.reshape(len(min_similarities), -1), min_similarities)
+
+        hits: List[Tuple[float, int, str]] = []  # min-heap of the best k
+        segments = {}
+        for i in np.argsort(-bounds, kind='stable'):
+            cutoff = max(min_score, floor, hits[0][0] if len(hits) == k else -math.inf)
+            if bounds[i] <= cutoff:
+                break
+            segment = self._segment(rows[i])
+            segments[segment.month] = segment
+            allowed = None
+            if session_id is not None:
+                allowed = np.array([r['id'] for r in segment.records.values()
+                                    if r['session_id'] == session_id], dtype=np.int64)
+            for message_id, score in segment.search(q, k, max(min_score, floor), allowed):
+                entry = (score, message_id, segment.month)
+                if len(hits) < k:
+                    heapq.heappush(hits, entry)
+                elif entry > hits[0]:
+                    heapq.heapreplace(hits, entry)
+
+        results = []
+        for score, message_id, month in sorted(hits, reverse=True):
+            record = segments[month].records.get(message_id)
+            if record is None:
+                continue
+            results.append({
+                'id': message_id,
+                'role': record['role'],
+                'content': record['content'],
+                'timestamp': record['timestamp'],
+                'session_id': record['session_id'],
+                'similarity': score,
+            })
+        return results
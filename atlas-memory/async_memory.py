@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Atlas Async Memory
+asyncio facade over AtlasMemory that overlaps network and database work.
+
+A context lookup needs the query embedding (an HTTP round trip with the
+OpenAI provider) several times: hybrid fact search, message search and MMR
+for both. AsyncAtlasMemory starts that request once per query on a network
+executor and hands the same in-flight future to every consumer, so:
+
+    embedding request  |==========|
+    soul + FTS page    |===|      |
+    vector searches               |=|=|
+
+and a lookup takes about as long as its slowest part instead of the sum.
+
+All SQLite work runs on one dedicated thread that owns the AtlasMemory: its
+connection, resident vector indexes and caches are not safe to share between
+threads, and one thread keeps their warm state without locking. Coroutines
+issued together (search(), or concurrent callers) are queued onto it in order
+while the embedding is in flight.
+
+Usage:
+    async with AsyncAtlasMemory() as memory:
+        context = await memory.get_relevant_context("what did we decide about the deploy?")
+        both = await memory.search("lisbon trip", fact_limit=5, msg_limit=3)
+        await memory.run(memory.memory.save_fact, "travel", "lisbon", "Flights booked for May")
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+import retrieval
+from context_packer import CONTEXT_TOKEN_BUDGET, pack_context
+from memory_manager import AtlasMemory
+
+# Concurrent embedding requests
+EMBED_WORKERS = 4
+# Recent query embeddings kept (futures, so concurrent callers share one request)
+QUERY_EMBEDDINGS_KEPT = 128
+
+
+class AsyncAtlasMemory:
+    """AtlasMemory behind a database thread plus shared in-flight query embeddings."""
+
+    def __init__(self, db_path: str = None, memory: Optional[AtlasMemory] = None,
+                 embed_workers: int = EMBED_WORKERS, **kwargs):
+        self._db = ThreadPoolExecutor(max_workers=1, thread_name_prefix='atlas-async-db')
+        self._network = ThreadPoolExecutor(max_workers=embed_workers,
+                                           thread_name_prefix='atlas-async-embed')
+        # A given memory must be usable from our database thread (check_same_thread=False)
+        self._owns_memory = memory is None
+        self.memory = memory or self._db.submit(
+            partial(AtlasMemory, db_path, check_same_thread=False, **kwargs)
+        ).result()
+        self._queries: "OrderedDict[tuple, Future]" = OrderedDict()
+        self._queries_lock = threading.Lock()
+
+    async def __aenter__(self) -> "AsyncAtlasMemory":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call on the database thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._db, partial(fn, *args, **kwargs))
+
+    # ==================== QUERY EMBEDDINGS ====================
+
+    def _query_future(self, text: str) -> Future:
+        """The (possibly in-flight) embedding request for `text`, started on first use."""
+        key = (self.memory.provider.tag, text)
+        with self._queries_lock:
+            future = self._queries.get(key)
+            if future is not None:
+                self._queries.move_to_end(key)
+                return future
+            future = self._network.submit(self.memory._embed_detached, text)
+            self._queries[key] = future
+            while len(self._queries) > QUERY_EMBEDDINGS_KEPT:
+                self._queries.popitem(last=False)
+        future.add_done_callback(partial(self._forget_failed, key))
+        return future
+
+    def _forget_failed(self, key: tuple, future: Future):
+        """Drop a failed request so the next caller retries."""
+        if not future.cancelled() and future.exception() is None:
+            return
+        with self._queries_lock:
+            if self._queries.get(key) is future:
+                del self._queries[key]
+
+    def _shared_embed(self, text: str) -> List[float]:
+        """Blocking embed for worker threads, served by the shared request."""
+        return self._query_future(text).result()
+
+    def _prefetch(self, query: str):
+        """Start the query embedding before any database work is queued."""
+        if query and query.strip():
+            self._query_future(query)
+
+    async def embed(self, text: str) -> List[float]:
+        """Embedding of `text` (one request however many callers ask at once)."""
+        return await asyncio.wrap_future(self._query_future(text))
+
+    # ==================== SEARCH ====================
+
+    async def search_facts_hybrid(self, query: str, limit: int = 10,
+                                  fusion: str = retrieval.DEFAULT_FUSION) -> List[Dict]:
+        """Hybrid fact search; the keyword pages are read while the embedding is in flight."""
+        self._prefetch(query)
+        return await self.run(self.memory.search_facts_hybrid, query, limit, fusion,
+                              embed=self._shared_embed)
+
+    async def search_messages(self, query: str, session_id: str = None,
+                              limit: int = 10) -> List[Dict]:
+        """Semantic message search (live and archived)."""
+        self._prefetch(query)
+        return await self.run(self.memory.search_messages, query, session_id, limit,
+                              embed=self._shared_embed)
+
+    async def search(self, query: str, fact_limit: int = 5, msg_limit: int = 3,
+                     session_id: str = None) -> Dict[str, List[Dict]]:
+        """Fact and message search for one query, gathered over one embedding request."""
+        facts, messages = await asyncio.gather(
+            self.search_facts_hybrid(query, fact_limit),
+            self.search_messages(query, session_id, msg_limit)
+        )
+        return {'facts': facts, 'messages': messages}
+
+    async def get_relevant_context(self, query: str, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                                   include_soul: bool = True, include_facts: bool = True,
+                                   include_messages: bool = True, fact_limit: int = 5,
+                                   msg_limit: int = 3) -> Dict[str, Any]:
+        """
+        Packed context for `query` (see context_packer.py). Soul summaries and
+        the first keyword page are read while the query is being embedded.
+        """
+        self._prefetch(query)
+        packed = await self.run(
+            pack_context, self.memory, query, token_budget,
+            include_soul=include_soul, include_facts=include_facts,
+            include_messages=include_messages, fact_limit=fact_limit, msg_limit=msg_limit,
+            embed=self._shared_embed
+        )
+        return {"success": True, "context": packed.pop("context"), **packed}
+
+    # ==================== LIFECYCLE ====================
+
+    async def close(self):
+        """Close the memory (if we opened it) and stop both executors."""
+        if self._owns_memory:
+            await self.run(self.memory.close)
+        self._db.shutdown(wait=True)
+        self._network.shutdown(wait=False, cancel_futures=True)
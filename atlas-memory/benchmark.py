@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Atlas Memory Benchmark
+Scaling numbers for the memory stack on synthetic corpora.
+
+For each corpus size a fresh database is seeded with facts, messages,
+memory links and daily log files. Embeddings are random unit vectors
+clustered around per-topic centroids. A fake embedding provider hands out
+vectors from the same distribution, so nothing touches the network and
+searches still find neighbours above the score thresholds.
+
+Every operation runs once cold (first call: engines load, indexes build)
+and then `--iterations` times. The report is JSON: per-operation
+p50/p95/p99 in milliseconds, plus RSS and database size per corpus.
+
+Usage:
+    benchmark.py [--sizes 1k,10k,100k,1m] [--iterations 50] [--output report.json]
+
+A 1M-row corpus holds ~12 GB of float32 vectors (facts and messages);
+size it to the machine.
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import zlib
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+import memory_manager
+import query
+from connections import connect
+from embedding_providers import OPENAI_DIMENSIONS, EmbeddingProvider, set_default_provider
+from embedding_store import use_embedding_model, write_embeddings
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+from memory_evolution import MemoryEvolution
+
+DEFAULT_SIZES = [1000, 10000]
+DEFAULT_ITERATIONS = 50
+DIMENSIONS = OPENAI_DIMENSIONS
+
+TOPICS = 64
+# Per-vector noise norm around the topic centroid: same-topic cosine ~ 1 / (1 + NOISE^2)
+NOISE = 1.0
+VOCABULARY = 2000
+WORDS_PER_FACT = 12
+WORDS_PER_MESSAGE = 30
+MESSAGES_PER_SESSION = 200
+LINKS_PER_FACT = 3
+ROWS_PER_DAILY_LOG = 100
+MAX_DAILY_LOGS = 3650
+SEED_BATCH = 10000
+
+
+def parse_size(text: str) -> int:
+    """'10k' -> 10000, '1m' -> 1000000."""
+    text = text.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+# ==================== SYNTHETIC DATA ====================
+
+class SyntheticCorpus:
+    """Topic-clustered texts and embeddings, deterministic for a seed."""
+
+    def __init__(self, seed: int = 0, dimensions: int = DIMENSIONS):
+        self.dimensions = dimensions
+        self.rng = np.random.default_rng(seed)
+        centroids = self.rng.standard_normal((TOPICS, dimensions)).astype(np.float32)
+        self.centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.topics = [f"topic{t:02d}" for t in range(TOPICS)]
+        self.vocabulary = np.array([f"w{n:04d}" for n in range(VOCABULARY)])
+
+    def vectors(self, topics: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """Unit vectors scattered around the centroids of `topics`."""
+        rng = rng or self.rng
+        noise = rng.standard_normal((len(topics), self.dimensions)).astype(np.float32)
+        noise *= NOISE / np.sqrt(self.dimensions)
+        vectors = self.centroids[topics] + noise
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def texts(self, topics: np.ndarray, words: int) -> List[str]:
+        picks = self.vocabulary[self.rng.integers(0, VOCABULARY, (len(topics), words))]
+        return [f"{self.topics[t]} " + ' '.join(row) for t, row in zip(topics, picks)]
+
+    def topic_of(self, text: str) -> int:
+        """Topic named in `text`, or one picked by its hash."""
+        for word in text.split():
+            if word.startswith('topic') and word[5:].isdigit():
+                return int(word[5:]) % TOPICS
+        return zlib.crc32(text.encode('utf-8')) % TOPICS
+
+    def query(self) -> str:
+        t = int(self.rng.integers(TOPICS))
+        return f"{self.topics[t]} " + ' '.join(self.rng.choice(self.vocabulary, 3))
+
+
+class FakeEmbeddingProvider(EmbeddingProvider):
+    """Offline stand-in for the embeddings API: deterministic, topic-aware vectors."""
+
+    name = 'fake'
+
+    def __init__(self, corpus: SyntheticCorpus):
+        super().__init__('topics-v1', corpus.dimensions)
+        self.corpus = corpus
+        self.calls = 0
+        self.texts = 0
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        out = []
+        for text in texts:
+            rng = np.random.default_rng(zlib.crc32(text.encode('utf-8')))
+            topic = np.array([self.corpus.topic_of(text)])
+            out.append(self.corpus.vectors(topic, rng)[0].tolist())
+        return out
+
+
+def seed_database(db_path: Path, memory_dir: Path, corpus: SyntheticCorpus, size: int) -> Dict:
+    """Fill a fresh database with `size` facts and messages plus links and daily logs."""
+    started = time.perf_counter()
+    memory = memory_manager.AtlasMemory(str(db_path), auto_summarize=False)
+    conn = memory.conn
+    rng = corpus.rng
+
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    use_embedding_model(conn, memory.provider.tag)
+    for start in range(0, size, SEED_BATCH):
+        n = min(SEED_BATCH, size - start)
+        topics = rng.integers(0, TOPICS, n)
+        with conn:
+            first = conn.execute("SELECT COALESCE(MAX(id), 0) FROM facts").fetchone()[0] + 1
+            conn.executemany(
+                "INSERT INTO facts (category, subject, content, source) VALUES (?, ?, ?, 'benchmark')",
+                [(corpus.topics[t], f"fact {start + i}", text)
+                 for i, (t, text) in enumerate(zip(topics, corpus.texts(topics, WORDS_PER_FACT)))]
+            )
+            write_embeddings(conn, 'facts', zip(range(first, first + n), corpus.vectors(topics)))
+
+        topics = rng.integers(0, TOPICS, n)
+        with conn:
+            first = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0] + 1
+            texts = corpus.texts(topics, WORDS_PER_MESSAGE)
+            conn.executemany(
+                "INSERT INTO messages (role, content, session_id, token_count) VALUES (?, ?, ?, ?)",
+                [('user' if (start + i) % 2 == 0 else 'assistant', text,
+                  f"session-{(start + i) // MESSAGES_PER_SESSION}", len(text) // 4)
+                 for i, text in enumerate(texts)]
+            )
+            write_embeddings(conn, 'messages', zip(range(first, first + n), corpus.vectors(topics)))
+    memory.close()
+
+    # memory_links lives in the evolution tables
+    MemoryEvolution(db_path)
+    conn = connect(db_path)
+    sources = np.repeat(np.arange(1, size + 1), LINKS_PER_FACT)
+    targets = rng.integers(1, size + 1, len(sources))
+    with conn:
+        conn.executemany(
+            """INSERT OR IGNORE INTO memory_links (source_fact_id, target_fact_id, link_type, strength)
+               VALUES (?, ?, 'related', ?)""",
+            [(int(s), int(t), float(w)) for s, t, w in
+             zip(sources, targets, rng.uniform(0.3, 1.0, len(sources))) if s != t]
+        )
+    conn.close()
+
+    logs = min(max(size // ROWS_PER_DAILY_LOG, 1), MAX_DAILY_LOGS)
+    memory_dir.mkdir(parents=True, exist_ok=True)
+    for day in range(logs):
+        write_daily_log(memory_dir, corpus, date(2020, 1, 1) + timedelta(days=day))
+
+    return {'facts': size, 'messages': size, 'links': len(sources), 'daily_logs': logs,
+            'seconds': round(time.perf_counter() - started, 3)}
+
+
+def write_daily_log(memory_dir: Path, corpus: SyntheticCorpus, day: date, sections: int = 4):
+    topics = corpus.rng.integers(0, TOPICS, sections * 2)
+    texts = corpus.texts(topics, 8)
+    lines = [f"# {day.isoformat()}", ""]
+    for s in range(sections):
+        lines += [f"## {9 + s}:00 - {texts[2 * s]}", "", f"**Note:** {texts[2 * s + 1]}", ""]
+    (memory_dir / f"{day.isoformat()}.md").write_text('\n'.join(lines))
+
+
+# ==================== MEASUREMENT ====================
+
+def measure(operation: Callable[[int], object], iterations: int) -> Dict[str, float]:
+    """Time one cold call, then `iterations` warm calls of operation(i)."""
+    started = time.perf_counter()
+    operation(0)
+    cold = time.perf_counter() - started
+
+    samples = []
+    for i in range(1, iterations + 1):
+        started = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - started)
+    ms = np.array(samples) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+    return {
+        'iterations': iterations,
+        'cold_ms': round(cold * 1000, 3),
+        'mean_ms': round(float(ms.mean()), 3) if len(ms) else 0.0,
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+    }
+
+
+def rss_mb() -> Dict[str, float]:
+    """Current and peak resident set size of this process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+    current = None
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        pass
+    return {'rss_mb': round(current, 1) if current is not None else None,
+            'peak_rss_mb': round(peak, 1)}
+
+
+def db_bytes(db_path: Path) -> int:
+    """Database size including its WAL."""
+    return sum(
+        os.path.getsize(p) for p in (str(db_path), f"{db_path}-wal") if os.path.exists(p)
+    )
+
+
+@contextlib.contextmanager
+def fake_provider(provider: FakeEmbeddingProvider, db_path: Path, memory_dir: Path):
+    """Route every embedding call and path used by the benchmarked code to the sandbox."""
+    saved = (query.DB_PATH, memory_manager.MEMORY_DIR)
+    set_default_provider(provider)
+    query.DB_PATH = db_path
+    memory_manager.MEMORY_DIR = memory_dir
+    try:
+        yield
+    finally:
+        set_default_provider(None)
+        query.DB_PATH, memory_manager.MEMORY_DIR = saved
+
+
+def run_size(size: int, workdir: Path, iterations: int, seed: int = 0) -> Dict:
+    """Seed a corpus of `size` rows and time every operation on it."""
+    db_path = workdir / f"bench_{size}.db"
+    memory_dir = workdir / f"memory_{size}"
+    corpus = SyntheticCorpus(seed)
+    provider = FakeEmbeddingProvider(corpus)
+    result = {'size': size}
+
+    with fake_provider(provider, db_path, memory_dir):
+        result['seed'] = seed_database(db_path, memory_dir, corpus, size)
+        ops = {}
+
+        def open_db(i):
+            memory_manager.AtlasMemory(str(db_path), auto_summarize=False).close()
+        ops['db_open'] = measure(open_db, iterations)
+
+        memory = memory_manager.AtlasMemory(str(db_path), auto_summarize=False, provider=provider)
+
+        def init_schema(i):
+            memory.conn.execute("PRAGMA user_version = 0")
+            memory._init_schema()
+        ops['schema_init'] = measure(init_schema, iterations)
+
+        queries = [corpus.query() for _ in range(iterations + 1)]
+        ops['save_fact'] = measure(
+            lambda i: memory.save_fact(corpus.topics[i % TOPICS], f"bench {i}", queries[i]),
+            iterations
+        )
+        ops['search_facts_hybrid'] = measure(
+            lambda i: memory.search_facts_hybrid(queries[i], limit=10), iterations
+        )
+        ops['search_messages'] = measure(
+            lambda i: memory.search_messages(queries[i], limit=10), iterations
+        )
+        ops['query.semantic_search'] = measure(
+            lambda i: query.semantic_search(queries[i], limit=10), iterations
+        )
+        ops['query.keyword_search'] = measure(
+            lambda i: query.keyword_search(queries[i], limit=10), iterations
+        )
+
+        evolution = MemoryEvolution(db_path)
+        starts = corpus.rng.integers(1, size + 1, iterations + 1)
+        ops['find_connections'] = measure(
+            lambda i: evolution.find_connections(int(starts[i]), max_hops=2), iterations
+        )
+
+        # Cold call syncs every log; warm calls each follow an edit to one log
+        logs = sorted(memory_dir.glob('*.md'))
+
+        def sync_logs(i):
+            if i:
+                with open(logs[i % len(logs)], 'a') as f:
+                    f.write(f"\n**Edit {i}:** {queries[i]}\n")
+            with contextlib.redirect_stdout(io.StringIO()):
+                memory.sync_daily_logs()
+        ops['sync_daily_logs'] = measure(sync_logs, iterations)
+        memory.close()
+
+        result['operations'] = ops
+        result['embedding_calls'] = provider.calls
+    result['db_bytes'] = db_bytes(db_path)
+    result.update(rss_mb())
+    return result
+
+
+def run(sizes: List[int], iterations: int = DEFAULT_ITERATIONS, seed: int = 0,
+        workdir: Optional[Path] = None, keep: bool = False) -> Dict:
+    """Benchmark every corpus size and return the JSON-ready report."""
+    own_dir = workdir is None
+    workdir = Path(workdir or tempfile.mkdtemp(prefix='atlas-bench-'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    report = {
+        'benchmark': 'atlas-memory',
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'numpy': np.__version__,
+        'dimensions': DIMENSIONS,
+        'iterations': iterations,
+        'seed': seed,
+        'results': [],
+    }
+    try:
+        for size in sizes:
+            print(f"[Benchmark] {size} rows...", file=sys.stderr)
+            report['results'].append(run_size(size, workdir, iterations, seed))
+    finally:
+        if own_dir and not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+# ==================== CLI ====================
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Atlas Memory Benchmark")
+    parser.add_argument("--sizes", default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated corpus sizes (e.g. 1k,10k,100k,1m)")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS,
+                        help="Warm calls per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, help="Where to build the corpora (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp corpora")
+    parser.add_argument("--output", type=Path, help="Write the JSON report here")
+
+    args = parser.parse_args()
+    report = run([parse_size(s) for s in args.sizes.split(',')], args.iterations,
+                 args.seed, args.workdir, args.keep)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + '\n')
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
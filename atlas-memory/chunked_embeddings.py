@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Atlas Chunked Embeddings
+Retrieval over long facts and messages by their best-matching chunk.
+
+An item whose embedding text runs past CHUNK_TOKENS is split into
+overlapping token windows (fact_chunks / message_chunks), each embedded on
+its own in fact_chunk_embeddings / message_chunk_embeddings. The item's
+regular embedding becomes the normalised mean of its chunk vectors, so
+every single-vector consumer (MMR, linking, evolution) keeps working.
+
+At query time max_sim_search() scores each item by the best of its own
+vector and its best chunk (max-sim). Chunks live in their own resident
+vector index, so a query costs one extra index search whatever the length
+of the stored documents.
+
+Chunks of an item are dropped by triggers when its text changes or it is
+deleted; the next embed or backfill rebuilds them.
+"""
+
+import sqlite3
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from connections import apply_schema
+from context_packer import get_counter
+from embedding_store import has_table, write_embeddings
+from embeddings import mean_pool
+
+CHUNK_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 64
+# Chunk hits fetched per requested item (an item can own several hits)
+CHUNK_SEARCH_FACTOR = 3
+
+# parent vector source -> (chunk table, parent id column, chunk vector source)
+CHUNKED_SOURCES = {
+    'facts': ('fact_chunks', 'fact_id', 'fact_chunks'),
+    'messages': ('message_chunks', 'message_id', 'message_chunks'),
+}
+
+
+def ensure_chunked_schema(conn: sqlite3.Connection):
+    """Create the chunk tables and triggers (see schema.sql) on older databases."""
+    apply_schema(conn)
+
+
+def split_chunks(text: str, max_tokens: int = CHUNK_TOKENS,
+                 overlap: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """Overlapping token windows of `text` (just [text] when it is short)."""
+    return get_counter().split(text, max_tokens, overlap)
+
+
+def has_chunks(conn: sqlite3.Connection, name: str) -> bool:
+    """Whether any item of `name` is stored as chunks."""
+    chunk_table = CHUNKED_SOURCES[name][0]
+    if not has_table(conn, chunk_table):
+        return False
+    return conn.execute(f"SELECT EXISTS (SELECT 1 FROM {chunk_table})").fetchone()[0] == 1
+
+
+def store_chunks(conn: sqlite3.Connection, name: str, item_id: int,
+                 chunks: Sequence[str]) -> List[int]:
+    """Replace the chunk rows of an item. Returns the new chunk ids in order."""
+    chunk_table, parent_column, _ = CHUNKED_SOURCES[name]
+    conn.execute(f"DELETE FROM {chunk_table} WHERE {parent_column} = ?", (item_id,))
+    return [
+        conn.execute(
+            f"INSERT INTO {chunk_table} ({parent_column}, position, content) VALUES (?, ?, ?)",
+            (item_id, position, chunk)
+        ).lastrowid
+        for position, chunk in enumerate(chunks)
+    ]
+
+
+def write_document(conn: sqlite3.Connection, name: str, item_id: int, text: str,
+                   embed_batch: Callable[[List[str]], List[List[float]]]
+                   ) -> Tuple[List[float], List[Tuple[int, List[float]]]]:
+    """
+    Embed and store an item of any length (no commit).
+    Returns (item vector, [(chunk id, chunk vector)]); no chunks for short items.
+    """
+    chunks = split_chunks(text)
+    if len(chunks) == 1:
+        store_chunks(conn, name, item_id, [])
+        vector = embed_batch([text])[0]
+        write_embeddings(conn, name, [(item_id, vector)])
+        return vector, []
+
+    vectors = embed_batch(chunks)
+    chunk_rows = list(zip(store_chunks(conn, name, item_id, chunks), vectors))
+    write_embeddings(conn, CHUNKED_SOURCES[name][2], chunk_rows)
+    vector = mean_pool(vectors)
+    write_embeddings(conn, name, [(item_id, vector)])
+    return vector, chunk_rows
+
+
+def chunk_long_rows(conn: sqlite3.Connection, name: str,
+                    rows: Sequence[Tuple[int, str]]) -> Tuple[List[Tuple[int, str]], int]:
+    """
+    Split (id, text) rows awaiting an embedding: long ones get chunk rows
+    (unless they already have them) and are left to aggregate_parents().
+    Returns (short rows to embed directly, number of long rows).
+    """
+    chunk_table, parent_column, _ = CHUNKED_SOURCES[name]
+    short = []
+    long_rows = 0
+    for item_id, text in rows:
+        chunks = split_chunks(text)
+        if len(chunks) == 1:
+            short.append((item_id, text))
+            continue
+        long_rows += 1
+        stored = conn.execute(
+            f"SELECT COUNT(*) FROM {chunk_table} WHERE {parent_column} = ?", (item_id,)
+        ).fetchone()[0]
+        if stored != len(chunks):
+            store_chunks(conn, name, item_id, chunks)
+    conn.commit()
+    return short, long_rows
+
+
+def aggregate_parents(conn: sqlite3.Connection, name: str) -> int:
+    """Write mean item vectors for items whose chunks are all embedded. Returns items written."""
+    from embedding_store import VECTOR_SOURCES, exact_vectors
+
+    chunk_table, parent_column, chunk_source = CHUNKED_SOURCES[name]
+    table, id_column, _ = VECTOR_SOURCES[name]
+    rows = conn.execute(f"""
+        SELECT c.{parent_column}, c.id FROM {chunk_table} c
+        WHERE NOT EXISTS (SELECT 1 FROM {table} e WHERE e.{id_column} = c.{parent_column})
+        ORDER BY c.{parent_column}, c.position
+    """).fetchall()
+    by_item: Dict[int, List[int]] = {}
+    for item_id, chunk_id in rows:
+        by_item.setdefault(item_id, []).append(chunk_id)
+    if not by_item:
+        return 0
+
+    vectors = exact_vectors(conn, chunk_source, [c for chunk_ids in by_item.values() for c in chunk_ids])
+    parents = []
+    for item_id, chunk_ids in by_item.items():
+        if all(c in vectors for c in chunk_ids):
+            parents.append((item_id, mean_pool([vectors[c].tolist() for c in chunk_ids])))
+    with conn:
+        write_embeddings(conn, name, parents)
+    return len(parents)
+
+
+# ==================== SEARCH ====================
+
+def chunk_parents(conn: sqlite3.Connection, name: str, chunk_ids: Sequence[int]) -> Dict[int, int]:
+    """chunk id -> item id for chunks that still exist."""
+    if not chunk_ids:
+        return {}
+    chunk_table, parent_column, _ = CHUNKED_SOURCES[name]
+    placeholders = ','.join('?' * len(chunk_ids))
+    return dict(conn.execute(
+        f"SELECT id, {parent_column} FROM {chunk_table} WHERE id IN ({placeholders})",
+        list(chunk_ids)
+    ).fetchall())
+
+
+def max_sim_search(conn: sqlite3.Connection, name: str, item_engine, chunk_engine,
+                   query, k: int = 10, min_score: float = -1.0,
+                   candidates: Optional[Sequence[int]] = None) -> List[Tuple[int, float]]:
+    """
+    Top-k items for `query`, each scored by the best of its own vector and
+    its chunks. `chunk_engine` may be None when no item is chunked.
+    """
+    hits = dict(item_engine.search(query, k=k, min_score=min_score, candidates=candidates))
+    if chunk_engine is not None and len(chunk_engine):
+        chunk_hits = chunk_engine.search(query, k=k * CHUNK_SEARCH_FACTOR, min_score=min_score)
+        parents = chunk_parents(conn, name, [chunk_id for chunk_id, _ in chunk_hits])
+        allowed = set(candidates) if candidates is not None else None
+        for chunk_id, score in chunk_hits:
+            item_id = parents.get(chunk_id)
+            if item_id is None or (allowed is not None and item_id not in allowed):
+                continue
+            if score > hits.get(item_id, -np.inf):
+                hits[item_id] = score
+    return sorted(hits.items(), key=lambda h: h[1], reverse=True)[:k]
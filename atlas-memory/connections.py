@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Atlas Connections
+The one way to open atlas_memory.db, shared by every script that uses it.
+
+The agent, heartbeat jobs and the briefing hit the database at the same
+time, so connect() applies the same settings everywhere:
+
+    journal_mode=WAL      readers never block behind a writer, nor it behind them
+    busy_timeout          a writer waits for the write lock instead of failing
+                          with "database is locked"
+    synchronous=NORMAL    fsync at checkpoints only (durable enough under WAL)
+    mmap_size/cache_size  reads served from the page cache and the mapping
+
+Within one process, Database adds a small pool of reader connections and a
+single writer thread. Writes are queued as callables taking the writer's
+connection; the writer runs everything queued so far in one transaction,
+each job under its own savepoint (group commit), so a burst of small writes
+costs one commit instead of one each. metrics() reports reader pool waits,
+write queue delays, batch sizes and lock retries per database.
+"""
+
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+DB_PATH = Path(__file__).parent / "atlas_memory.db"
+SCHEMA_PATH = Path(__file__).parent / "schema.sql"
+
+BUSY_TIMEOUT_MS = 10000
+MMAP_SIZE = 256 * 2 ** 20
+CACHE_SIZE_KB = 32 * 1024
+
+READER_POOL_SIZE = 4
+# Most jobs one group commit takes from the write queue
+GROUP_COMMIT_MAX = 256
+# Attempts at a group commit that keeps failing with "database is locked"
+WRITE_RETRIES = 3
+
+
+def connect(db_path: Union[str, Path] = DB_PATH, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Open the database with WAL, busy_timeout, mmap and page cache settings applied."""
+    conn = sqlite3.connect(str(db_path), timeout=BUSY_TIMEOUT_MS / 1000,
+                           check_same_thread=check_same_thread)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    try:
+        # Persistent; a no-op once the file is in WAL mode
+        conn.execute("PRAGMA journal_mode = WAL")
+    except sqlite3.OperationalError:
+        pass  # another process holds the lock mid-switch; it sets WAL for us
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def schema_version(schema: str) -> int:
+    """Checksum of the schema text, kept in PRAGMA user_version once it is applied."""
+    return zlib.crc32(schema.encode('utf-8')) & 0x7fffffff
+
+
+def apply_schema(conn: sqlite3.Connection):
+    """
+    Create whatever schema.sql defines that the database lacks (every
+    statement is IF NOT EXISTS). Skipped when user_version says the schema
+    is current; otherwise runs one statement at a time (not executescript),
+    so a transaction the caller has open is joined rather than committed.
+    """
+    schema = SCHEMA_PATH.read_text()
+    if conn.execute("PRAGMA user_version").fetchone()[0] == schema_version(schema):
+        return
+    statement = ''
+    for line in schema.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+
+
+def _is_locked(error: Exception) -> bool:
+    return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+
+class ConnectionMetrics:
+    """Contention counters of one Database (thread-safe)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.read_waits = 0
+        self.read_wait_seconds = 0.0
+        self.read_wait_max = 0.0
+        self.writes = 0
+        self.write_errors = 0
+        self.commits = 0
+        self.batch_max = 0
+        self.queue_seconds = 0.0
+        self.queue_max = 0.0
+        self.commit_seconds = 0.0
+        self.lock_retries = 0
+
+    def reader(self, waited: float):
+        with self.lock:
+            self.reads += 1
+            if waited > 0:
+                self.read_waits += 1
+                self.read_wait_seconds += waited
+                self.read_wait_max = max(self.read_wait_max, waited)
+
+    def batch(self, queued: list, failed: int, commit_seconds: float):
+        with self.lock:
+            self.commits += 1
+            self.writes += len(queued)
+            self.write_errors += failed
+            self.batch_max = max(self.batch_max, len(queued))
+            self.queue_seconds += sum(queued)
+            self.queue_max = max(self.queue_max, max(queued))
+            self.commit_seconds += commit_seconds
+
+    def retry(self):
+        with self.lock:
+            self.lock_retries += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'reads': self.reads,
+                'read_waits': self.read_waits,
+                'read_wait_ms_max': round(self.read_wait_max * 1000, 3),
+                'read_wait_ms_avg': round(1000 * self.read_wait_seconds / self.read_waits, 3)
+                                    if self.read_waits else 0.0,
+                'writes': self.writes,
+                'write_errors': self.write_errors,
+                'commits': self.commits,
+                'writes_per_commit': round(self.writes / self.commits, 2) if self.commits else 0.0,
+                'batch_max': self.batch_max,
+                'queue_ms_avg': round(1000 * self.queue_seconds / self.writes, 3) if self.writes else 0.0,
+                'queue_ms_max': round(self.queue_max * 1000, 3),
+                'commit_ms_avg': round(1000 * self.commit_seconds / self.commits, 3)
+                                 if self.commits else 0.0,
+                'lock_retries': self.lock_retries,
+            }
+
+
+class _WriteJob:
+    __slots__ = ('fn', 'future', 'queued_at')
+
+    def __init__(self, fn: Callable[[sqlite3.Connection], Any]):
+        self.fn = fn
+        self.future = Future()
+        self.queued_at = time.perf_counter()
+
+
+class Database:
+    """
+    Reader pool plus a single group-committing writer thread for one
+    database file. Get the process-wide instance with get_database().
+    """
+
+    def __init__(self, db_path: Union[str, Path] = DB_PATH, readers: int = READER_POOL_SIZE):
+        self.db_path = str(db_path)
+        self.metrics = ConnectionMetrics()
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._reader_slots = threading.Semaphore(readers)
+        self._writes: "queue.Queue[Optional[_WriteJob]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._closed = False
+
+    # ==================== READS ====================
+
+    @contextmanager
+    def reader(self):
+        """Borrow a pooled connection for reads (blocks while all are in use)."""
+        started = time.perf_counter()
+        self._reader_slots.acquire()
+        waited = time.perf_counter() - started
+        self.metrics.reader(waited if waited > 0.001 else 0.0)
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = connect(self.db_path, check_same_thread=False)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+            self._reader_slots.release()
+
+    # ==================== WRITES ====================
+
+    def submit(self, fn: Callable[[sqlite3.Connection], Any]) -> Future:
+        """
+        Queue `fn(conn)` for the writer thread. It must not commit; its
+        future resolves once the group commit holding it is durable.
+        """
+        if self._closed:
+            raise RuntimeError(f"Database {self.db_path} is closed")
+        job = _WriteJob(fn)
+        self._ensure_writer()
+        self._writes.put(job)
+        return job.future
+
+    def write(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run `fn(conn)` on the writer thread and return its result once committed."""
+        return self.submit(fn).result()
+
+    def execute(self, sql: str, params: tuple = ()) -> int:
+        """Run one write statement; returns its lastrowid."""
+        return self.write(lambda conn: conn.execute(sql, params).lastrowid)
+
+    def _ensure_writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='atlas-db-writer', daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        conn = connect(self.db_path, check_same_thread=False)
+        conn.isolation_level = None  # transactions are managed here
+        stopping = False
+        while not stopping:
+            job = self._writes.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < GROUP_COMMIT_MAX:
+                try:
+                    job = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._commit(conn, batch)
+        conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: list):
+        started = time.perf_counter()
+        queued = [started - job.queued_at for job in batch]
+        for attempt in range(WRITE_RETRIES):
+            outcomes = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for job in batch:
+                    conn.execute("SAVEPOINT job")
+                    try:
+                        outcomes.append((True, job.fn(conn)))
+                    except Exception as e:
+                        if _is_locked(e):
+                            raise
+                        outcomes.append((False, e))
+                        conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                conn.execute("COMMIT")
+                break
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if _is_locked(e) and attempt + 1 < WRITE_RETRIES:
+                    self.metrics.retry()
+                    continue
+                outcomes = [(False, e)] * len(batch)
+                break
+
+        failed = 0
+        for job, (ok, value) in zip(batch, outcomes):
+            if ok:
+                job.future.set_result(value)
+            else:
+                failed += 1
+                job.future.set_exception(value)
+        self.metrics.batch(queued, failed, time.perf_counter() - started)
+
+    # ==================== LIFECYCLE ====================
+
+    def close(self):
+        """Flush queued writes, stop the writer and close pooled readers."""
+        self._closed = True
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._writes.put(None)
+            writer.join()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_databases: Dict[str, Database] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_path: Union[str, Path] = DB_PATH) -> Database:
+    """The process-wide Database for `db_path`."""
+    key = str(Path(db_path).resolve())
+    with _databases_lock:
+        database = _databases.get(key)
+        if database is None or database._closed:
+            database = _databases[key] = Database(key)
+        return database
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    """Contention metrics of every Database opened in this process."""
+    with _databases_lock:
+        return {path: database.metrics.snapshot() for path, database in _databases.items()}
+
+
+@atexit.register
+def _close_all():
+    with _databases_lock:
+        databases = list(_databases.values())
+    for database in databases:
+        database.close()
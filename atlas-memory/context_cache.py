@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Atlas Context Cache
+In-process LRU + TTL cache for get_relevant_context results.
+
+Entries are keyed by (normalised query, include flags, limits) and stamped
+with the database write generation: a counter in `write_generation` that
+triggers on facts, soul, messages and their embeddings bump on every change.
+An entry is only served while the generation is unchanged and its TTL has
+not run out, so a hit costs one single-row SELECT and a dict lookup.
+
+Most useful inside the resident memory_service process, where the cache
+lives across agent turns.
+"""
+
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+CONTEXT_CACHE_MAX_ENTRIES = 256
+CONTEXT_CACHE_TTL = 300.0  # seconds
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold and strip punctuation/whitespace differences from a query."""
+    return ' '.join(_TERM_RE.findall((query or '').lower()))
+
+
+def write_generation(conn: sqlite3.Connection) -> Optional[int]:
+    """Current write generation, or None on databases without the counter."""
+    try:
+        row = conn.execute("SELECT generation FROM write_generation WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+class ContextCache:
+    """Bounded, generation-checked result cache."""
+
+    def __init__(self, max_entries: int = CONTEXT_CACHE_MAX_ENTRIES,
+                 ttl: float = CONTEXT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (generation, expires_at, value)
+        self._entries: "OrderedDict[Hashable, Tuple[int, float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(query: str, **options) -> Tuple:
+        """Cache key from the normalised query and every option that shapes the result."""
+        return (normalize_query(query),) + tuple(sorted(options.items()))
+
+    def get(self, key: Hashable, generation: Optional[int]) -> Optional[Any]:
+        """Cached value for `key` if still valid at `generation`, else None."""
+        entry = self._entries.get(key)
+        if entry is None or generation is None:
+            self.misses += 1
+            return None
+        entry_generation, expires_at, value = entry
+        if entry_generation != generation:
+            self.stale += 1
+        elif expires_at < time.monotonic():
+            self.expired += 1
+        else:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+        del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, generation: Optional[int], value: Any):
+        """Store `value` computed at `generation` (not cached without one)."""
+        if generation is None:
+            return
+        self._entries[key] = (generation, time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and hit rate since start."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Atlas Context Packer
+Assembles get_relevant_context output under a hard token budget.
+
+1. Tokens are counted with tiktoken (cl100k_base) when it is installed and
+   estimated at CHARS_PER_TOKEN otherwise. Counts for facts and messages are
+   cached per item and reused until the item's text changes.
+2. Soul aspects are included as short extractive summaries, stored in
+   `soul_summaries` and rebuilt only when the aspect's content changes.
+3. Facts and messages are over-fetched from the usual searches and picked by
+   maximal marginal relevance (MMR) over the vectors already resident in the
+   fact/message engines, so near-duplicates give way to new information.
+4. Items are added best first until the budget is used; an item that does
+   not fit is skipped and smaller ones after it may still be placed.
+"""
+
+import hashlib
+import re
+import sqlite3
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import tiktoken
+except ImportError:  # optional: exact counts, estimates otherwise
+    tiktoken = None
+
+CONTEXT_TOKEN_BUDGET = 1500
+TOKENIZER_ENCODING = 'cl100k_base'
+CHARS_PER_TOKEN = 4
+
+# Relevance vs. novelty trade-off (1.0 = plain relevance order)
+MMR_LAMBDA = 0.7
+# Candidates fetched per requested fact/message for MMR to choose from
+MMR_CANDIDATE_FACTOR = 4
+# Longest soul summary and message excerpt, in tokens
+SOUL_SUMMARY_TOKENS = 48
+MESSAGE_EXCERPT_TOKENS = 80
+# Cached per-item token counts kept in memory
+TOKEN_CACHE_MAX_ENTRIES = 50000
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+# ==================== TOKENS ====================
+
+class TokenCounter:
+    """BPE token counts (estimates without tiktoken), cached per item."""
+
+    def __init__(self, encoding: str = TOKENIZER_ENCODING):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding)
+            except Exception as e:
+                print(f"[Memory] tiktoken encoding {encoding} unavailable, estimating tokens: {e}")
+        self.name = encoding if self._encoding is not None else f'chars/{CHARS_PER_TOKEN}'
+        # (kind, item_id) -> (crc32 of text, tokens)
+        self._items: Dict[Tuple[str, int], Tuple[int, int]] = {}
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return max(1, len(text) // CHARS_PER_TOKEN)
+
+    def count_item(self, kind: str, item_id: int, text: str) -> int:
+        """Token count of a stored item, recomputed only when its text changes."""
+        checksum = zlib.crc32(text.encode('utf-8'))
+        cached = self._items.get((kind, item_id))
+        if cached is not None and cached[0] == checksum:
+            return cached[1]
+        if len(self._items) >= TOKEN_CACHE_MAX_ENTRIES:
+            self._items.clear()
+        tokens = self.count(text)
+        self._items[(kind, item_id)] = (checksum, tokens)
+        return tokens
+
+    def split(self, text: str, max_tokens: int, overlap: int = 0) -> List[str]:
+        """
+        Windows of at most `max_tokens` tokens covering `text`, consecutive
+        windows sharing `overlap` tokens. Without tiktoken, windows are
+        estimated in characters and cut at whitespace.
+        """
+        if self.count(text) <= max_tokens:
+            return [text]
+        step = max(max_tokens - overlap, 1)
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return [
+                self._encoding.decode(tokens[start:start + max_tokens])
+                for start in range(0, len(tokens) - overlap, step)
+            ]
+
+        size = max_tokens * CHARS_PER_TOKEN
+        pieces = []
+        start = 0
+        while start < len(text):
+            end = min(start + size, len(text))
+            if end < len(text):
+                cut = text.rfind(' ', start + step * CHARS_PER_TOKEN // 2, end)
+                if cut > start:
+                    end = cut
+            pieces.append(text[start:end].strip())
+            if end >= len(text):
+                break
+            start = max(end - overlap * CHARS_PER_TOKEN, start + 1)
+            space = text.find(' ', start, end)
+            if space != -1:
+                start = space + 1
+        return [p for p in pieces if p]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """`text` cut to at most `max_tokens` tokens, marked with an ellipsis if cut."""
+        if self.count(text) <= max_tokens:
+            return text
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return self._encoding.decode(tokens[:max(max_tokens - 1, 0)]).rstrip() + '…'
+        return text[:max(max_tokens - 1, 0) * CHARS_PER_TOKEN].rstrip() + '…'
+
+
+_counter = None
+
+
+def get_counter() -> TokenCounter:
+    """Process-wide token counter (its item cache lives as long as the process)."""
+    global _counter
+    if _counter is None:
+        _counter = TokenCounter()
+    return _counter
+
+
+def count_tokens(text: str) -> int:
+    return get_counter().count(text)
+
+
+# ==================== MMR ====================
+
+def mmr_order(candidates: List[Dict], query_vector, vector_of: Callable[[int], Optional[np.ndarray]],
+              lam: float = MMR_LAMBDA) -> List[Dict]:
+    """
+    Order candidate dicts (with 'id') by maximal marginal relevance: cosine
+    to the query, minus `1 - lam` times the highest cosine to anything picked
+    before. Candidates without a vector get the mean relevance and count as novel.
+    """
+    if len(candidates) < 2 or query_vector is None:
+        return list(candidates)
+    q = np.asarray(query_vector, dtype=np.float32)
+    q_norm = float(np.linalg.norm(q))
+    if not q_norm:
+        return list(candidates)
+    q = q / q_norm
+
+    rows = []
+    for c in candidates:
+        vector = vector_of(c['id'])
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            norm = float(np.linalg.norm(vector))
+            vector = vector / norm if norm else None
+        rows.append(vector)
+    has_vector = np.array([v is not None for v in rows])
+    if not has_vector.any():
+        return list(candidates)
+    matrix = np.stack([v if v is not None else np.zeros_like(q) for v in rows])
+    relevance = matrix @ q
+    relevance[~has_vector] = relevance[has_vector].mean()
+    similarity = matrix @ matrix.T
+
+    order = []
+    remaining = np.ones(len(candidates), dtype=bool)
+    # Highest similarity of each candidate to anything already picked
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    while remaining.any():
+        marginal = lam * relevance - (1.0 - lam) * redundancy
+        marginal[~remaining] = -np.inf
+        pick = int(np.argmax(marginal))
+        order.append(candidates[pick])
+        remaining[pick] = False
+        if has_vector[pick]:
+            redundancy = np.maximum(redundancy, similarity[pick] * has_vector)
+    return order
+
+
+# ==================== SOUL SUMMARIES ====================
+
+def summarize_aspect(content: str, counter: TokenCounter,
+                     max_tokens: int = SOUL_SUMMARY_TOKENS) -> str:
+    """Leading sentences of a soul aspect that fit in `max_tokens`."""
+    text = ' '.join(content.split())
+    if counter.count(text) <= max_tokens:
+        return text
+    summary = ''
+    for sentence in _SENTENCE_RE.split(text):
+        candidate = f"{summary} {sentence}".strip()
+        if counter.count(candidate) > max_tokens:
+            break
+        summary = candidate
+    return summary or counter.truncate(text, max_tokens)
+
+
+def soul_summaries(conn: sqlite3.Connection, counter: TokenCounter,
+                   max_tokens: int = SOUL_SUMMARY_TOKENS) -> List[Tuple[str, str, int]]:
+    """
+    (aspect, summary, tokens) for every soul aspect. Summaries are cached in
+    `soul_summaries` and rebuilt when the aspect text or tokenizer changes.
+    """
+    rows = conn.execute("""
+        SELECT s.aspect, s.content, c.content_hash, c.summary, c.token_count, c.tokenizer
+        FROM soul s LEFT JOIN soul_summaries c ON c.aspect = s.aspect
+        ORDER BY s.aspect
+    """).fetchall()
+    out = []
+    refreshed = []
+    for aspect, content, cached_hash, summary, tokens, tokenizer in rows:
+        content_hash = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        if cached_hash != content_hash or tokenizer != counter.name:
+            summary = summarize_aspect(content, counter, max_tokens)
+            tokens = counter.count(summary)
+            refreshed.append((aspect, content_hash, summary, tokens, counter.name))
+        out.append((aspect, summary, tokens))
+    if refreshed:
+        with conn:
+            conn.executemany(
+                """INSERT OR REPLACE INTO soul_summaries
+                   (aspect, content_hash, summary, token_count, tokenizer)
+                   VALUES (?, ?, ?, ?, ?)""",
+                refreshed
+            )
+    return out
+
+
+# ==================== PACKING ====================
+
+def _fact_line(fact: Dict) -> str:
+    if fact['subject']:
+        return f"- **{fact['category']}/{fact['subject']}**: {fact['content']}"
+    return f"- **{fact['category']}**: {fact['content']}"
+
+
+def _message_line(message: Dict, counter: TokenCounter) -> str:
+    role = "User" if message['role'] == 'user' else "Atlas"
+    excerpt = counter.truncate(' '.join(message['content'].split()), MESSAGE_EXCERPT_TOKENS)
+    return f"- [{role}] {excerpt}"
+
+
+def _fill(heading: str, lines: List[Tuple[str, int]], budget: int, limit: int,
+          counter: TokenCounter) -> Tuple[Optional[str], int, int]:
+    """
+    Greedily place up to `limit` lines under `heading` within `budget`.
+    Returns (section or None, tokens used, lines dropped).
+    """
+    # Sections are joined by a blank line, lines by a newline (~1 token each)
+    cost = counter.count(heading) + 2
+    placed = []
+    for line, tokens in lines:
+        if len(placed) >= limit:
+            break
+        if cost + tokens + 1 <= budget:
+            placed.append(line)
+            cost += tokens + 1
+    if not placed:
+        return None, 0, len(lines[:limit])
+    return "\n".join([heading] + placed), cost, min(len(lines), limit) - len(placed)
+
+
+def _query_vector(memory, query: str, embed: Optional[Callable[[str], List[float]]] = None
+                  ) -> Optional[List[float]]:
+    """Query embedding (an embedding-cache hit after the searches), or None."""
+    if not query or not query.strip():
+        return None
+    try:
+        return (embed or memory.embed)(query)
+    except Exception as e:
+        print(f"[Memory] Failed to embed query for MMR: {e}")
+        return None
+
+
+def pack_context(memory, query: str, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 include_soul: bool = True, include_facts: bool = True,
+                 include_messages: bool = True, fact_limit: int = 5,
+                 msg_limit: int = 3, counter: Optional[TokenCounter] = None,
+                 embed: Optional[Callable[[str], List[float]]] = None) -> Dict[str, Any]:
+    """
+    Build the context block for `query` on an AtlasMemory within `token_budget`.
+    Returns the text plus token accounting. `embed` replaces the query
+    embedding calls of the searches and MMR (e.g. one shared request).
+    """
+    counter = counter or get_counter()
+    remaining = token_budget
+    sections = []
+    stats = {'soul': 0, 'facts': 0, 'messages': 0, 'dropped': 0}
+
+    if include_soul:
+        aspects = soul_summaries(memory.conn, counter)
+        lines = [(f"- **{aspect}**: {summary}", tokens + counter.count(aspect) + 6)
+                 for aspect, summary, tokens in aspects]
+        section, used, dropped = _fill("## Soul Aspects", lines, remaining, len(lines), counter)
+        if section:
+            sections.append(section)
+            remaining -= used
+            stats['soul'] = len(lines) - dropped
+        stats['dropped'] += dropped
+
+    if include_facts and fact_limit > 0 and remaining > 0:
+        facts = memory.search_facts_hybrid(query, fact_limit * MMR_CANDIDATE_FACTOR, embed=embed)
+        ordered = facts
+        if len(facts) > 1:
+            ordered = mmr_order(facts, _query_vector(memory, query, embed), memory.fact_vectors.get)
+        lines = []
+        for f in ordered:
+            line = _fact_line(f)
+            lines.append((line, counter.count_item('facts', f['id'], line)))
+        section, used, dropped = _fill("## Relevant Facts", lines, remaining, fact_limit, counter)
+        if section:
+            sections.append(section)
+            remaining -= used
+            stats['facts'] = min(len(lines), fact_limit) - dropped
+        stats['dropped'] += dropped
+
+    if include_messages and msg_limit > 0 and remaining > 0:
+        messages = memory.search_messages(query, limit=msg_limit * MMR_CANDIDATE_FACTOR, embed=embed)
+        ordered = messages
+        if len(messages) > 1:
+            ordered = mmr_order(messages, _query_vector(memory, query, embed), memory.message_vectors.get)
+        lines = []
+        for msg in ordered:
+            line = _message_line(msg, counter)
+            lines.append((line, counter.count_item('messages', msg['id'], line)))
+        section, used, dropped = _fill("## Relevant Past Conversations", lines,
+                                       remaining, msg_limit, counter)
+        if section:
+            sections.append(section)
+            remaining -= used
+            stats['messages'] = min(len(lines), msg_limit) - dropped
+        stats['dropped'] += dropped
+
+    return {
+        'context': "\n\n".join(sections),
+        'tokens': token_budget - remaining,
+        'token_budget': token_budget,
+        'tokenizer': counter.name,
+        **stats,
+    }
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Atlas Embedding Providers
+Where vectors come from: the OpenAI API, a local ONNX model, or the hashing trick.
+
+Every embedding path (AtlasMemory, query.py, generate_embeddings.py and
+memory_evolution.py) embeds through get_provider(), chosen with
+ATLAS_EMBEDDING_PROVIDER:
+
+    openai  text-embedding-3-small over HTTPS (default)
+    local   a sentence-transformer exported to ONNX (e.g. all-MiniLM-L6-v2),
+            run in-process on CPU; ATLAS_LOCAL_MODEL points at a directory
+            holding model.onnx and tokenizer.json
+    hash    deterministic hashing-trick vectors, for tests and offline use
+
+A provider's `tag` ('openai/text-embedding-3-small', 'local/all-MiniLM-L6-v2',
+'hash/v1-512') keys the embedding cache and is recorded per database
+(embedding_store.embedding_model), so vectors from different spaces never
+meet in one index.
+"""
+
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+PROVIDER = os.environ.get("ATLAS_EMBEDDING_PROVIDER", "openai")
+
+OPENAI_MODEL = "text-embedding-3-small"
+OPENAI_DIMENSIONS = 1536
+# The model accepts 8191 tokens; longer inputs are windowed and pooled
+OPENAI_MAX_TOKENS = 8000
+
+LOCAL_MODEL_PATH = Path(os.environ.get(
+    "ATLAS_LOCAL_MODEL", Path(__file__).parent / "models" / "all-MiniLM-L6-v2"
+))
+LOCAL_MAX_TOKENS = 256
+LOCAL_BATCH_SIZE = 32
+
+HASH_DIMENSIONS = 512
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class EmbeddingProvider:
+    """Turns texts into unit vectors of one embedding space."""
+
+    name = ''
+    # Longest input in tokens (None: no limit); get_embeddings windows longer texts
+    max_input_tokens: Optional[int] = None
+    # Whether results are worth keeping in the embedding cache
+    cacheable = True
+
+    def __init__(self, model: str, dimensions: int):
+        self.model = model
+        self.dimensions = dimensions
+
+    @property
+    def tag(self) -> str:
+        """provider/model: the embedding space of this provider's vectors."""
+        return f"{self.name}/{self.model}"
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def warm(self):
+        """Load whatever the first embed() would otherwise wait for."""
+
+    def __call__(self, texts: Sequence[str]) -> List[List[float]]:
+        return self.embed(texts) if texts else []
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.tag} ({self.dimensions}d)>"
+
+
+class OpenAIProvider(EmbeddingProvider):
+    """OpenAI embeddings API (one HTTPS request per call)."""
+
+    name = 'openai'
+    max_input_tokens = OPENAI_MAX_TOKENS
+
+    def __init__(self, model: str = OPENAI_MODEL, dimensions: int = OPENAI_DIMENSIONS):
+        super().__init__(model, dimensions)
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        from embeddings import fetch_embeddings
+        return fetch_embeddings(texts, self.model, self.dimensions)
+
+    def warm(self):
+        from embeddings import load_api_key
+        load_api_key()
+
+
+class LocalOnnxProvider(EmbeddingProvider):
+    """
+    Sentence-transformer run in-process with onnxruntime: mean pooling over
+    the last hidden state, then L2 normalisation.
+    """
+
+    name = 'local'
+    max_input_tokens = LOCAL_MAX_TOKENS
+
+    def __init__(self, model_path: Path = LOCAL_MODEL_PATH, threads: Optional[int] = None):
+        if onnxruntime is None or Tokenizer is None:
+            raise RuntimeError("Local embeddings need onnxruntime and tokenizers "
+                               "(pip install onnxruntime tokenizers)")
+        model_path = Path(model_path)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            str(model_path / "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = Tokenizer.from_file(str(model_path / "tokenizer.json"))
+        self.tokenizer.enable_truncation(LOCAL_MAX_TOKENS)
+        self.tokenizer.enable_padding()
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        super().__init__(model_path.name, 0)
+        self.dimensions = len(self._run(["dimension probe"])[0])
+
+    def _run(self, texts: Sequence[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(list(texts))
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {'input_ids': ids, 'attention_mask': mask}
+        if 'token_type_ids' in self._inputs:
+            feeds['token_type_ids'] = np.zeros_like(ids)
+        hidden = self.session.run(None, feeds)[0]
+        summed = (hidden * mask[:, :, None]).sum(axis=1)
+        pooled = summed / np.maximum(mask.sum(axis=1, keepdims=True), 1)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.where(norms == 0, 1, norms)
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        out = []
+        for start in range(0, len(texts), LOCAL_BATCH_SIZE):
+            out.extend(self._run(texts[start:start + LOCAL_BATCH_SIZE]).tolist())
+        return out
+
+
+class HashingProvider(EmbeddingProvider):
+    """
+    Signed hashing trick over lowercased words and word bigrams. Texts that
+    share words land close together; no model, no network, no state.
+    """
+
+    name = 'hash'
+    cacheable = False
+
+    def __init__(self, dimensions: int = HASH_DIMENSIONS):
+        super().__init__(f"v1-{dimensions}", dimensions)
+
+    def vector(self, text: str) -> np.ndarray:
+        words = _TOKEN_RE.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        v = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in features:
+            h = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+            v[h % self.dimensions] += 1.0 if (h >> 63) else -1.0
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        return [self.vector(t).tolist() for t in texts]
+
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'local': LocalOnnxProvider,
+    'hash': HashingProvider,
+}
+
+_providers: Dict[str, EmbeddingProvider] = {}
+_default: Optional[EmbeddingProvider] = None
+
+
+def get_provider(name: Optional[str] = None) -> EmbeddingProvider:
+    """The provider called `name`, or the process default (ATLAS_EMBEDDING_PROVIDER)."""
+    if name is None and _default is not None:
+        return _default
+    name = name or PROVIDER
+    if name not in _providers:
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown embedding provider {name!r} (choose from {', '.join(PROVIDERS)})")
+        _providers[name] = PROVIDERS[name]()
+    return _providers[name]
+
+
+def set_default_provider(provider: Optional[EmbeddingProvider]):
+    """Make `provider` the process default (None restores ATLAS_EMBEDDING_PROVIDER)."""
+    global _default
+    _default = provider
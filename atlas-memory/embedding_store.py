@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Atlas Embedding Store
+How embedding rows are laid out in SQLite.
+
+Each embedding table (fact_embeddings, message_embeddings,
+log_chunk_embeddings and the fact/message chunk tables) carries a
+per-row `dtype` ('float32', 'float16' or 'int8') and `scale` (int8 only).
+In a compact storage mode the main table holds the small quantized vector
+used for candidate scoring, and the full float32 vector moves to a
+`<table>_exact` side table that is only read to re-rank the top candidates.
+
+The active mode is stored per database in `atlas_settings` and changed with
+`atlas embeddings compact --dtype ...`.
+
+`atlas_settings` also records the embedding space (provider/model tag, see
+embedding_providers.py) of the stored vectors. Writers and engines check it,
+so one database never mixes vectors from two models; `atlas embeddings
+switch` clears the vectors and moves the database to another space.
+"""
+
+import sqlite3
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vector_engine import (
+    STORAGE_DTYPES, VectorEngine, blob_to_vector, decode_vector, normalize, quantize
+)
+
+# name -> (embedding table, item id column, parent table)
+VECTOR_SOURCES = {
+    'facts': ('fact_embeddings', 'fact_id', 'facts'),
+    'messages': ('message_embeddings', 'message_id', 'messages'),
+    'log_chunks': ('log_chunk_embeddings', 'chunk_id', 'daily_log_chunks'),
+    'fact_chunks': ('fact_chunk_embeddings', 'chunk_id', 'fact_chunks'),
+    'message_chunks': ('message_chunk_embeddings', 'chunk_id', 'message_chunks'),
+}
+
+DEFAULT_STORAGE = 'float32'
+# Vectors written before databases were tagged all came from this model
+LEGACY_EMBEDDING_MODEL = 'openai/text-embedding-3-small'
+COMPACT_BATCH_ROWS = 2000
+
+
+def source_sql(name: str, columns: str, where: str = "") -> str:
+    """SELECT over an embedding table joined to its live parent rows."""
+    table, id_column, parent = VECTOR_SOURCES[name]
+    return (
+        f"SELECT {columns} FROM {table} e "
+        f"JOIN {parent} p ON e.{id_column} = p.id {where}"
+    )
+
+
+def has_table(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def ensure_storage_schema(conn: sqlite3.Connection):
+    """Add dtype/scale columns and exact side tables to older databases."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS atlas_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+    for table, id_column, _ in VECTOR_SOURCES.values():
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if not columns:
+            continue
+        if 'dtype' not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN dtype TEXT NOT NULL DEFAULT 'float32'")
+        if 'scale' not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN scale REAL")
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table}_exact (
+                {id_column} INTEGER PRIMARY KEY,
+                embedding BLOB NOT NULL
+            )
+        """)
+    conn.commit()
+
+
+def storage_mode(conn: sqlite3.Connection) -> str:
+    """The embedding storage dtype new rows are written with."""
+    row = conn.execute(
+        "SELECT value FROM atlas_settings WHERE key = 'embedding_storage'"
+    ).fetchone()
+    return row[0] if row else DEFAULT_STORAGE
+
+
+def set_storage_mode(conn: sqlite3.Connection, dtype: str):
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unknown embedding dtype: {dtype}")
+    conn.execute(
+        """INSERT INTO atlas_settings (key, value) VALUES ('embedding_storage', ?)
+           ON CONFLICT(key) DO UPDATE SET value = excluded.value""",
+        (dtype,)
+    )
+
+
+class EmbeddingModelMismatch(ValueError):
+    """The database holds vectors from another provider/model."""
+
+
+def embedding_model(conn: sqlite3.Connection) -> Optional[str]:
+    """provider/model tag of the stored vectors (None before any are written)."""
+    row = conn.execute(
+        "SELECT value FROM atlas_settings WHERE key = 'embedding_model'"
+    ).fetchone()
+    if row:
+        return row[0]
+    for table, _, _ in VECTOR_SOURCES.values():
+        if has_table(conn, table) and conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+            _set_embedding_model(conn, LEGACY_EMBEDDING_MODEL)
+            if has_table(conn, 'embedding_cache'):
+                conn.execute(
+                    "UPDATE embedding_cache SET model = ? WHERE model = ?",
+                    (LEGACY_EMBEDDING_MODEL, LEGACY_EMBEDDING_MODEL.split('/', 1)[1])
+                )
+            conn.commit()
+            return LEGACY_EMBEDDING_MODEL
+    return None
+
+
+def _set_embedding_model(conn: sqlite3.Connection, tag: str):
+    conn.execute(
+        """INSERT INTO atlas_settings (key, value) VALUES ('embedding_model', ?)
+           ON CONFLICT(key) DO UPDATE SET value = excluded.value""",
+        (tag,)
+    )
+
+
+def use_embedding_model(conn: sqlite3.Connection, tag: str):
+    """
+    Claim a database without vectors for `tag` (no commit), or raise
+    EmbeddingModelMismatch if it holds vectors of another model.
+    """
+    stored = embedding_model(conn)
+    if stored is None:
+        _set_embedding_model(conn, tag)
+    elif stored != tag:
+        raise EmbeddingModelMismatch(
+            f"Database holds {stored} embeddings, not {tag} "
+            f"(run `memory_manager.py embeddings switch` to re-embed)"
+        )
+
+
+def matches_embedding_model(conn: sqlite3.Connection, tag: str) -> bool:
+    """Whether the stored vectors (if any) are in `tag`'s embedding space."""
+    return embedding_model(conn) in (None, tag)
+
+
+def switch_embedding_model(conn: sqlite3.Connection, tag: str) -> Dict[str, int]:
+    """Drop every stored vector and record `tag` as the database's space. Returns rows dropped."""
+    ensure_storage_schema(conn)
+    counts = {}
+    with conn:
+        for name, (table, _, _) in VECTOR_SOURCES.items():
+            if not has_table(conn, table):
+                continue
+            counts[name] = conn.execute(f"DELETE FROM {table}").rowcount
+            conn.execute(f"DELETE FROM {table}_exact")
+        _set_embedding_model(conn, tag)
+    return counts
+
+
+def encode_embedding(embedding, dtype: str) -> Tuple[bytes, Optional[float], Optional[bytes]]:
+    """
+    Encode an embedding for storage.
+    Returns (main BLOB, scale, exact float32 BLOB or None when not compact).
+    """
+    exact = np.asarray(embedding, dtype=np.float32)
+    if dtype == 'float32':
+        return exact.tobytes(), None, None
+    stored, scale = quantize(normalize(exact), dtype)
+    return stored.tobytes(), scale, exact.tobytes()
+
+
+def write_embeddings(conn: sqlite3.Connection, name: str,
+                     items: Iterable[Tuple[int, Sequence[float]]],
+                     dtype: Optional[str] = None) -> int:
+    """Insert or replace embeddings for `name` in the active storage format."""
+    table, id_column, _ = VECTOR_SOURCES[name]
+    dtype = dtype or storage_mode(conn)
+    main_rows = []
+    exact_rows = []
+    plain_ids = []
+    for item_id, embedding in items:
+        blob, scale, exact = encode_embedding(embedding, dtype)
+        main_rows.append((item_id, blob, dtype, scale))
+        if exact is None:
+            plain_ids.append((item_id,))
+        else:
+            exact_rows.append((item_id, exact))
+
+    conn.executemany(
+        f"""INSERT OR REPLACE INTO {table} ({id_column}, embedding, dtype, scale)
+            VALUES (?, ?, ?, ?)""",
+        main_rows
+    )
+    if exact_rows:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {table}_exact ({id_column}, embedding) VALUES (?, ?)",
+            exact_rows
+        )
+    if plain_ids:
+        conn.executemany(f"DELETE FROM {table}_exact WHERE {id_column} = ?", plain_ids)
+    return len(main_rows)
+
+
+def delete_embeddings(conn: sqlite3.Connection, name: str, item_ids: Iterable[int]):
+    """Remove the stored (and exact) embeddings of `item_ids`."""
+    table, id_column, _ = VECTOR_SOURCES[name]
+    rows = [(i,) for i in item_ids]
+    conn.executemany(f"DELETE FROM {table} WHERE {id_column} = ?", rows)
+    conn.executemany(f"DELETE FROM {table}_exact WHERE {id_column} = ?", rows)
+
+
+def exact_vectors(conn: sqlite3.Connection, name: str,
+                  item_ids: Sequence[int]) -> Dict[int, np.ndarray]:
+    """Full-precision vectors for `item_ids`, wherever they are stored."""
+    table, id_column, _ = VECTOR_SOURCES[name]
+    out = {}
+    ids = list(item_ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        for item_id, blob in conn.execute(
+            f"SELECT {id_column}, embedding FROM {table}_exact WHERE {id_column} IN ({placeholders})",
+            chunk
+        ):
+            out[item_id] = blob_to_vector(blob)
+        missing = [i for i in chunk if i not in out]
+        if missing:
+            placeholders = ','.join('?' * len(missing))
+            for item_id, blob, dtype, scale in conn.execute(
+                f"""SELECT {id_column}, embedding, dtype, scale FROM {table}
+                    WHERE {id_column} IN ({placeholders})""",
+                missing
+            ):
+                out[item_id] = decode_vector(blob, dtype, scale)
+    return out
+
+
+def load_engine(conn: sqlite3.Connection, name: str, dimensions: int = 1536,
+                dtype: Optional[str] = None) -> VectorEngine:
+    """Load every live embedding of `name` into an exact-search engine."""
+    ensure_storage_schema(conn)
+    _, id_column, _ = VECTOR_SOURCES[name]
+    dtype = dtype or storage_mode(conn)
+    rerank = None
+    if dtype != 'float32':
+        rerank = lambda ids: exact_vectors(conn, name, ids)
+    sql = source_sql(
+        name, f"e.{id_column}, e.embedding, e.dtype, e.scale", f"ORDER BY e.{id_column}"
+    )
+    return VectorEngine.from_query(conn, sql, dimensions, dtype=dtype, rerank=rerank)
+
+
+def compact_storage(conn: sqlite3.Connection, dtype: str) -> Dict[str, int]:
+    """
+    Rewrite every stored embedding in `dtype` and make it the default.
+    'float32' moves exact vectors back into the main tables.
+    """
+    ensure_storage_schema(conn)
+    counts = {}
+    with conn:
+        set_storage_mode(conn, dtype)
+        for name, (table, id_column, _) in VECTOR_SOURCES.items():
+            if not has_table(conn, table):
+                continue
+            ids = [r[0] for r in conn.execute(f"SELECT {id_column} FROM {table} WHERE dtype != ?", (dtype,))]
+            for start in range(0, len(ids), COMPACT_BATCH_ROWS):
+                chunk = ids[start:start + COMPACT_BATCH_ROWS]
+                write_embeddings(conn, name, exact_vectors(conn, name, chunk).items(), dtype)
+            counts[name] = len(ids)
+    return counts
+
+
+def storage_report(conn: sqlite3.Connection) -> Dict[str, Dict]:
+    """Bytes used by scoring vectors and exact vectors per table and dtype."""
+    ensure_storage_schema(conn)
+    report = {'mode': storage_mode(conn), 'model': embedding_model(conn)}
+    for name, (table, _, _) in VECTOR_SOURCES.items():
+        if not has_table(conn, table):
+            continue
+        by_dtype = {
+            dtype: {'rows': rows, 'bytes': size or 0}
+            for dtype, rows, size in conn.execute(
+                f"SELECT dtype, COUNT(*), SUM(LENGTH(embedding)) FROM {table} GROUP BY dtype"
+            )
+        }
+        exact_rows, exact_bytes = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(LENGTH(embedding)), 0) FROM {table}_exact"
+        ).fetchone()
+        report[name] = {
+            'scoring': by_dtype,
+            'exact': {'rows': exact_rows, 'bytes': exact_bytes},
+        }
+    return report
+
+
+def quantization_recall(conn: sqlite3.Connection, name: str, k: int = 10,
+                        queries: int = 200, dimensions: int = 1536,
+                        seed: int = 0) -> Dict[str, float]:
+    """Recall@k of the compact engine (with re-rank) against exact float32 search."""
+    exact = load_engine(conn, name, dimensions, dtype='float32')
+    mode = storage_mode(conn)
+    compact = load_engine(conn, name, dimensions, dtype=mode)
+    if len(exact) == 0:
+        return {'dtype': mode, f'recall@{k}': 1.0, 'queries': 0}
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(exact), min(queries, len(exact)), replace=False)
+    total = 0.0
+    for pos in sample:
+        q = exact.matrix[pos]
+        truth = {i for i, _ in exact.search(q, k)}
+        approx = {i for i, _ in compact.search(q, k)}
+        total += len(truth & approx) / max(len(truth), 1)
+    return {
+        'dtype': mode,
+        f'recall@{k}': total / len(sample),
+        'queries': len(sample),
+        'exact_bytes': exact.nbytes,
+        'compact_bytes': compact.nbytes,
+    }
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Atlas Embeddings
+Shared embedding fetch + content-addressed cache.
+
+Every embedding call site (AtlasMemory.embed, query.py, generate_embeddings.py
+and memory_evolution.py) goes through `get_embeddings`, which looks texts up
+in the `embedding_cache` table by (provider/model tag, dimensions,
+sha256(text)) and only sends the misses to the provider (see
+embedding_providers.py), in one call.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+import urllib.request
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from connections import connect
+from embedding_store import has_table
+from embedding_providers import OPENAI_DIMENSIONS, OPENAI_MODEL, EmbeddingProvider, get_provider
+
+DB_PATH = Path(__file__).parent / "atlas_memory.db"
+
+# Defaults of the OpenAI API call below
+EMBEDDING_MODEL = OPENAI_MODEL
+EMBEDDING_DIMENSIONS = OPENAI_DIMENSIONS
+
+# ~6 KB per float32 1536-d vector, so this bounds the cache at ~120 MB
+CACHE_MAX_ENTRIES = 20000
+# Evict down to this fraction of the bound so eviction runs rarely
+CACHE_EVICT_TO = 0.9
+
+# LRU touches and hit/miss counts are buffered per database and written
+# with the next cache insert, or once this many lookups have piled up
+CACHE_FLUSH_LOOKUPS = 100
+
+CACHE_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS embedding_cache (
+        model TEXT NOT NULL,
+        dimensions INTEGER NOT NULL,
+        text_hash TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+        last_used_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+        PRIMARY KEY (model, dimensions, text_hash)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_embedding_cache_lru ON embedding_cache(last_used_at)",
+    """CREATE TABLE IF NOT EXISTS embedding_cache_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        hits INTEGER NOT NULL DEFAULT 0,
+        misses INTEGER NOT NULL DEFAULT 0,
+        evictions INTEGER NOT NULL DEFAULT 0,
+        entries INTEGER NOT NULL DEFAULT 0
+    )""",
+    "INSERT OR IGNORE INTO embedding_cache_stats (id) VALUES (1)",
+)
+
+# Unwritten cache bookkeeping by database file (see EmbeddingCache.flush)
+_pending: Dict[str, Dict] = {}
+_pending_lock = threading.Lock()
+
+# Inputs longer than a provider's max_input_tokens are embedded as
+# overlapping windows and mean-pooled instead of failing or being truncated
+INPUT_OVERLAP_TOKENS = 200
+
+
+def load_api_key() -> str:
+    """Find the OpenAI API key in the environment or ~/.clawdbot/.env."""
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        env_file = Path.home() / '.clawdbot' / '.env'
+        if env_file.exists():
+            for line in env_file.read_text().split('\n'):
+                if line.startswith('OPENAI_API_KEY='):
+                    api_key = line.split('=', 1)[1].strip().strip('"\'')
+                    break
+
+    if not api_key:
+        raise ValueError("No OPENAI_API_KEY found")
+    return api_key
+
+
+def fetch_embeddings(texts: Sequence[str], model: str = EMBEDDING_MODEL,
+                     dimensions: int = EMBEDDING_DIMENSIONS) -> List[List[float]]:
+    """Embed `texts` with one OpenAI API request."""
+    data = json.dumps({
+        "model": model,
+        "input": list(texts),
+        "dimensions": dimensions
+    }).encode()
+
+    req = urllib.request.Request(
+        "https://api.openai.com/v1/embeddings",
+        data=data,
+        headers={
+            "Authorization": f"Bearer {load_api_key()}",
+            "Content-Type": "application/json"
+        }
+    )
+
+    with urllib.request.urlopen(req) as resp:
+        result = json.loads(resp.read())
+        ordered = sorted(result['data'], key=lambda d: d['index'])
+        return [d['embedding'] for d in ordered]
+
+
+def input_windows(text: str, max_tokens: Optional[int]) -> List[str]:
+    """`text` as model-sized windows (a single window unless it is very long)."""
+    # A token is at least one character, so short texts need no counting
+    if max_tokens is None or len(text) <= max_tokens:
+        return [text]
+    from context_packer import get_counter
+    return get_counter().split(text, max_tokens, min(INPUT_OVERLAP_TOKENS, max_tokens // 4))
+
+
+def mean_pool(vectors: Sequence[Sequence[float]]) -> List[float]:
+    """Normalised mean of `vectors`."""
+    if len(vectors) == 1:
+        return list(vectors[0])
+    pooled = [sum(values) / len(vectors) for values in zip(*vectors)]
+    norm = sum(x * x for x in pooled) ** 0.5
+    return [x / norm for x in pooled] if norm else pooled
+
+
+def text_hash(text: str) -> str:
+    """Content address of a text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Size-bounded LRU cache of embeddings stored in SQLite.
+
+    Writes join the connection's current transaction and are committed by
+    whoever opened it. LRU touches and hit/miss counts are buffered per
+    database and only written by flush().
+    """
+
+    def __init__(self, conn: sqlite3.Connection, max_entries: int = CACHE_MAX_ENTRIES):
+        self.conn = conn
+        self.max_entries = max_entries
+        database = conn.execute("PRAGMA database_list").fetchone()[2]
+        self._key = database or f":memory:{id(conn)}"
+        self._ensure_tables()
+
+    def _ensure_tables(self):
+        """Create the cache and counter tables (statement by statement, which
+        unlike executescript does not commit an open transaction)."""
+        if has_table(self.conn, 'embedding_cache_stats'):
+            return
+        opened = not self.conn.in_transaction
+        for statement in CACHE_SCHEMA:
+            self.conn.execute(statement)
+        if opened:
+            self.conn.commit()
+
+    def _pending(self) -> Dict:
+        return _pending.setdefault(self._key, {'touched': set(), 'hits': 0, 'misses': 0})
+
+    def get_many(self, texts: Sequence[str], model: str, dimensions: int) -> Dict[str, List[float]]:
+        """Return cached embeddings for `texts`, keyed by text hash."""
+        hashes = list({text_hash(t) for t in texts})
+        found = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"""SELECT text_hash, embedding FROM embedding_cache
+                    WHERE model = ? AND dimensions = ? AND text_hash IN ({placeholders})""",
+                [model, dimensions, *chunk]
+            ).fetchall()
+            for h, blob in rows:
+                found[h] = list(struct.unpack(f'{len(blob) // 4}f', blob))
+
+        if found:
+            with _pending_lock:
+                self._pending()['touched'].update((model, dimensions, h) for h in found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]], model: str, dimensions: int):
+        """Store embeddings keyed by text hash, evicting LRU entries if over the bound."""
+        if not items:
+            return
+        cur = self.conn.cursor()
+        before = self.conn.total_changes
+        cur.executemany(
+            """INSERT OR IGNORE INTO embedding_cache (model, dimensions, text_hash, embedding)
+               VALUES (?, ?, ?, ?)""",
+            [(model, dimensions, h, struct.pack(f'{len(e)}f', *e)) for h, e in items.items()]
+        )
+        added = self.conn.total_changes - before
+        cur.execute(
+            "UPDATE embedding_cache_stats SET entries = entries + ? WHERE id = 1", (added,)
+        )
+        self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used entries once the cache exceeds its bound."""
+        entries = self.conn.execute(
+            "SELECT entries FROM embedding_cache_stats WHERE id = 1"
+        ).fetchone()[0]
+        if entries <= self.max_entries:
+            return
+        # Recency must be current before picking victims
+        self.flush(force=True)
+        excess = entries - int(self.max_entries * CACHE_EVICT_TO)
+        cur = self.conn.execute(
+            """DELETE FROM embedding_cache WHERE rowid IN (
+                   SELECT rowid FROM embedding_cache ORDER BY last_used_at LIMIT ?
+               )""",
+            (excess,)
+        )
+        self.conn.execute(
+            """UPDATE embedding_cache_stats
+               SET entries = entries - ?, evictions = evictions + ? WHERE id = 1""",
+            (cur.rowcount, cur.rowcount)
+        )
+
+    def record(self, hits: int, misses: int):
+        """Count hits and misses (buffered until the next flush)."""
+        with _pending_lock:
+            pending = self._pending()
+            pending['hits'] += hits
+            pending['misses'] += misses
+
+    def flush(self, force: bool = True) -> bool:
+        """
+        Write buffered LRU touches and hit/miss counts to the connection
+        (no commit). Unless `force`, waits for CACHE_FLUSH_LOOKUPS of them.
+        """
+        with _pending_lock:
+            pending = _pending.get(self._key)
+            if not pending or not (pending['touched'] or pending['hits'] or pending['misses']):
+                return False
+            if not force and pending['hits'] + pending['misses'] < CACHE_FLUSH_LOOKUPS:
+                return False
+            del _pending[self._key]
+        self.conn.executemany(
+            """UPDATE embedding_cache
+               SET last_used_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+               WHERE model = ? AND dimensions = ? AND text_hash = ?""",
+            pending['touched']
+        )
+        self.conn.execute(
+            "UPDATE embedding_cache_stats SET hits = hits + ?, misses = misses + ? WHERE id = 1",
+            (pending['hits'], pending['misses'])
+        )
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters (including unflushed ones), entry count and hit rate."""
+        row = self.conn.execute(
+            "SELECT hits, misses, evictions, entries FROM embedding_cache_stats WHERE id = 1"
+        ).fetchone()
+        hits, misses, evictions, entries = row
+        with _pending_lock:
+            pending = _pending.get(self._key)
+            if pending:
+                hits += pending['hits']
+                misses += pending['misses']
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        """Empty the cache (counters are kept; no commit)."""
+        self.conn.execute("DELETE FROM embedding_cache")
+        self.conn.execute("UPDATE embedding_cache_stats SET entries = 0 WHERE id = 1")
+
+
+def get_embeddings(texts: Sequence[str],
+                   conn: Optional[sqlite3.Connection] = None,
+                   cache: Optional[EmbeddingCache] = None,
+                   fetch: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                   model: Optional[str] = None,
+                   dimensions: Optional[int] = None,
+                   db_path: Path = DB_PATH,
+                   provider: Optional[EmbeddingProvider] = None) -> List[List[float]]:
+    """
+    Embed `texts` with `provider` (default: get_provider()) through the cache.
+    Cached texts cost no network; the misses go out in one `fetch` call
+    (the provider unless given). Uses `cache` (or a cache on `conn`) if
+    given, otherwise opens and closes its own connection to `db_path`.
+    Over-long texts are embedded window by window and mean-pooled.
+    """
+    if not texts:
+        return []
+    provider = provider or get_provider()
+    windows = [input_windows(t, provider.max_input_tokens) for t in texts]
+    if any(len(w) > 1 for w in windows):
+        vectors = iter(get_embeddings(
+            [piece for w in windows for piece in w], conn=conn, cache=cache,
+            fetch=fetch, model=model, dimensions=dimensions, db_path=db_path,
+            provider=provider
+        ))
+        return [mean_pool([next(vectors) for _ in w]) for w in windows]
+    fetch = fetch or provider
+    if not provider.cacheable:
+        return fetch(list(texts))
+    model = model or provider.tag
+    dimensions = dimensions or provider.dimensions
+    if cache is not None:
+        conn = cache.conn
+    own_conn = conn is None
+    if own_conn:
+        conn = connect(db_path)
+
+    # Only a transaction this call opened is committed here; inside a
+    # caller's transaction the cache rows commit (or roll back) with it
+    opened = not conn.in_transaction
+    try:
+        cache = cache or EmbeddingCache(conn)
+        hashes = [text_hash(t) for t in texts]
+        found = cache.get_many(texts, model, dimensions)
+
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in found and h not in missing:
+                missing[h] = t
+        if missing:
+            fresh = fetch(list(missing.values()))
+            new_items = dict(zip(missing.keys(), fresh))
+            cache.put_many(new_items, model, dimensions)
+            found.update(new_items)
+
+        cache.record(hits=len(texts) - len(missing), misses=len(missing))
+        if opened:
+            # On a shared connection, read-only lookups write nothing until
+            # enough bookkeeping piles up
+            cache.flush(force=bool(missing) or own_conn)
+            if conn.in_transaction:
+                conn.commit()
+        return [found[h] for h in hashes]
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def get_embedding(text: str, **kwargs) -> List[float]:
+    """Embed a single text through the cache."""
+    return get_embeddings([text], **kwargs)[0]
@@ -1,100 +1,348 @@
 #!/usr/bin/env python3
 """
-Generate embeddings for all facts that don't have them yet.
-Uses OpenAI's text-embedding-3-small model.
+Generate embeddings for all rows that don't have them yet.
+Uses the configured embedding provider (see embedding_providers.py).
+
+Backfill pipeline:
+1. Select the missing-embedding set for each target (facts, messages, ...)
+2. Serve what we can from the embedding cache
+3. Pack the rest into token-budgeted batches
+4. Send batches concurrently (bounded in-flight, 429/5xx backoff)
+5. Write each batch with executemany in one transaction, advancing a
+   checkpoint so an interrupted run resumes where it stopped
+
+Facts and messages longer than one chunk are not truncated: their chunks
+are backfilled as a target of their own and the item embedding is the
+mean of its chunk embeddings (see chunked_embeddings.py).
 """
 import sqlite3
-import os
-import struct
+import time
+import urllib.error
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import embeddings
+from embedding_providers import PROVIDERS, EmbeddingProvider, get_provider
+from chunked_embeddings import aggregate_parents, chunk_long_rows, ensure_chunked_schema
+from connections import connect
+from embedding_store import ensure_storage_schema, use_embedding_model, write_embeddings
+from log_chunks import ensure_chunk_schema, refresh_log_chunks
 
 DB_PATH = Path(__file__).parent / "atlas_memory.db"
 
-def get_embedding(text: str) -> list[float]:
-    """Get embedding from OpenAI API."""
-    import urllib.request
-    import json
-    
-    api_key = os.environ.get('OPENAI_API_KEY')
-    if not api_key:
-        # Try loading from clawdbot env
-        env_file = Path.home() / '.clawdbot' / '.env'
-        if env_file.exists():
-            for line in env_file.read_text().split('\n'):
-                if line.startswith('OPENAI_API_KEY='):
-                    api_key = line.split('=', 1)[1].strip().strip('"\'')
-                    break
-    
-    if not api_key:
-        raise ValueError("No OPENAI_API_KEY found")
-    
-    data = json.dumps({
-        "model": "text-embedding-3-small",
-        "input": text[:8000]  # Truncate if too long
-    }).encode()
-    
-    req = urllib.request.Request(
-        "https://api.openai.com/v1/embeddings",
-        data=data,
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-    )
-    
-    with urllib.request.urlopen(req) as resp:
-        result = json.loads(resp.read())
-        return result['data'][0]['embedding']
-
-def embedding_to_blob(embedding: list[float]) -> bytes:
-    """Convert embedding list to blob for storage."""
-    return struct.pack(f'{len(embedding)}f', *embedding)
-
-def blob_to_embedding(blob: bytes) -> list[float]:
-    """Convert blob back to embedding list."""
-    n = len(blob) // 4
-    return list(struct.unpack(f'{n}f', blob))
-
-def generate_all():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    
-    # Find facts without embeddings
-    cur.execute("""
-        SELECT f.id, f.category, f.subject, f.content 
-        FROM facts f
-        LEFT JOIN fact_embeddings fe ON f.id = fe.fact_id
-        WHERE fe.id IS NULL
-    """)
-    facts = cur.fetchall()
-    
-    print(f"Found {len(facts)} facts without embeddings")
-    
-    generated = 0
-    for fact_id, category, subject, content in facts:
-        # Create searchable text
-        text = f"{category} | {subject} | {content}"
-        
+CHARS_PER_TOKEN = 4
+# Per-request limits (the API allows 2048 inputs / 300k tokens)
+BATCH_TOKEN_BUDGET = 50000
+BATCH_MAX_ITEMS = 512
+MAX_IN_FLIGHT = 4
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Backfill targets: missing-set query (id, text) per embedding store,
+# plus an optional `prepare(conn)` run before the query and, for chunked
+# stores, the target holding the chunks of long items
+TARGETS: Dict[str, Dict[str, Any]] = {
+    'facts': {
+        'missing': """
+            SELECT f.id, f.category || ' | ' || f.subject || ' | ' || f.content
+            FROM facts f
+            LEFT JOIN fact_embeddings fe ON f.id = fe.fact_id
+            WHERE fe.id IS NULL AND f.id > ?
+            ORDER BY f.id
+        """,
+        'prepare': ensure_chunked_schema,
+        'chunks': 'fact_chunks',
+    },
+    'messages': {
+        'missing': """
+            SELECT m.id, m.content
+            FROM messages m
+            LEFT JOIN message_embeddings me ON m.id = me.message_id
+            WHERE me.id IS NULL AND m.id > ?
+            ORDER BY m.id
+        """,
+        'prepare': ensure_chunked_schema,
+        'chunks': 'message_chunks',
+    },
+    'fact_chunks': {
+        'missing': """
+            SELECT c.id, c.content
+            FROM fact_chunks c
+            LEFT JOIN fact_chunk_embeddings ce ON c.id = ce.chunk_id
+            WHERE ce.id IS NULL AND c.id > ?
+            ORDER BY c.id
+        """,
+        'prepare': ensure_chunked_schema,
+    },
+    'message_chunks': {
+        'missing': """
+            SELECT c.id, c.content
+            FROM message_chunks c
+            LEFT JOIN message_chunk_embeddings ce ON c.id = ce.chunk_id
+            WHERE ce.id IS NULL AND c.id > ?
+            ORDER BY c.id
+        """,
+        'prepare': ensure_chunked_schema,
+    },
+    'log_chunks': {
+        'missing': """
+            SELECT c.id, c.log_date || ' | ' || c.heading || ' | ' || c.content
+            FROM daily_log_chunks c
+            LEFT JOIN log_chunk_embeddings ce ON c.id = ce.chunk_id
+            WHERE ce.id IS NULL AND c.id > ?
+            ORDER BY c.id
+        """,
+        'prepare': lambda conn: (ensure_chunk_schema(conn), refresh_log_chunks(conn)),
+    },
+}
+# Log chunk embeddings are opt-in (--target log_chunks)
+DEFAULT_TARGETS = ['facts', 'messages']
+
+
+# ==================== BATCHING ====================
+
+def estimate_tokens(text: str) -> int:
+    """Estimate token count from text."""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+def pack_batches(rows: List[Tuple[int, str]],
+                 token_budget: int = BATCH_TOKEN_BUDGET,
+                 max_items: int = BATCH_MAX_ITEMS) -> Iterator[List[Tuple[int, str]]]:
+    """Group (id, text) rows into batches under the token and item limits."""
+    batch = []
+    tokens = 0
+    for row_id, text in rows:
+        cost = estimate_tokens(text)
+        if batch and (tokens + cost > token_budget or len(batch) >= max_items):
+            yield batch
+            batch = []
+            tokens = 0
+        batch.append((row_id, text))
+        tokens += cost
+    if batch:
+        yield batch
+
+def fetch_with_backoff(texts: List[str],
+                       fetch: Callable[[List[str]], List[List[float]]],
+                       max_retries: int = MAX_RETRIES) -> List[List[float]]:
+    """Fetch a batch, retrying rate limits and server errors with exponential backoff."""
+    for attempt in range(max_retries + 1):
         try:
-            embedding = get_embedding(text)
-            blob = embedding_to_blob(embedding)
-            
-            cur.execute("""
-                INSERT INTO fact_embeddings (fact_id, embedding)
-                VALUES (?, ?)
-            """, (fact_id, blob))
-            
-            generated += 1
-            if generated % 50 == 0:
-                print(f"  Generated {generated}/{len(facts)} embeddings...")
-                conn.commit()
-        except Exception as e:
-            print(f"  Error on fact {fact_id}: {e}")
-    
+            return fetch(texts)
+        except urllib.error.HTTPError as e:
+            if (e.code != 429 and e.code < 500) or attempt == max_retries:
+                raise
+            retry_after = e.headers.get('Retry-After') if e.headers else None
+            delay = float(retry_after) if retry_after else BACKOFF_BASE * 2 ** attempt
+        except urllib.error.URLError:
+            if attempt == max_retries:
+                raise
+            delay = BACKOFF_BASE * 2 ** attempt
+        time.sleep(min(delay, BACKOFF_MAX))
+
+# ==================== CHECKPOINTS ====================
+
+def _ensure_checkpoint_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            target TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'done',
+            embedded INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+        )
+    """)
+    conn.commit()
+
+def _resume_point(conn: sqlite3.Connection, target: str, restart: bool) -> int:
+    """Id to resume after: the checkpoint of an interrupted run, else 0."""
+    row = conn.execute(
+        "SELECT last_id, status FROM backfill_checkpoints WHERE target = ?", (target,)
+    ).fetchone()
+    if restart or row is None or row[1] != 'running':
+        return 0
+    return row[0]
+
+def _save_checkpoint(conn: sqlite3.Connection, target: str, last_id: int,
+                     status: str, embedded: int = 0):
+    conn.execute("""
+        INSERT INTO backfill_checkpoints (target, last_id, status, embedded)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(target) DO UPDATE SET
+            last_id = excluded.last_id,
+            status = excluded.status,
+            embedded = backfill_checkpoints.embedded + excluded.embedded,
+            updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+    """, (target, last_id, status, embedded))
+
+# ==================== BACKFILL ====================
+
+def backfill(target: str,
+             conn: sqlite3.Connection,
+             fetch: Optional[Callable[[List[str]], List[List[float]]]] = None,
+             concurrency: int = MAX_IN_FLIGHT,
+             restart: bool = False,
+             verbose: bool = True,
+             provider: Optional[EmbeddingProvider] = None) -> Dict[str, float]:
+    """
+    Embed every row of `target` that has no embedding yet, with `provider`
+    (default: get_provider()) or a `fetch` callable standing in for it.
+    Returns counts and throughput for the run.
+    """
+    spec = TARGETS[target]
+    provider = provider or get_provider()
+    fetch = fetch or provider
+    _ensure_checkpoint_table(conn)
+    if 'prepare' in spec:
+        spec['prepare'](conn)
+    ensure_storage_schema(conn)
+    use_embedding_model(conn, provider.tag)
     conn.commit()
-    conn.close()
-    
-    print(f"\n✅ Generated {generated} embeddings")
+    cache = embeddings.EmbeddingCache(conn)
+    model = provider.tag
+    dims = provider.dimensions
+    started = time.time()
+
+    resume_after = _resume_point(conn, target, restart)
+    rows = [
+        (row_id, text or '')
+        for row_id, text in conn.execute(spec['missing'], (resume_after,)).fetchall()
+    ]
+    stats = {'target': target, 'missing': len(rows), 'embedded': 0,
+             'cached': 0, 'failed': 0, 'resumed_after': resume_after}
+    if 'chunks' in spec:
+        # Long items are embedded through their chunks, then aggregated
+        rows, stats['chunked'] = chunk_long_rows(conn, target, rows)
+    if verbose:
+        suffix = f" (resuming after id {resume_after})" if resume_after else ""
+        print(f"Found {stats['missing']} {target} without embeddings{suffix}")
+    if not rows:
+        _save_checkpoint(conn, target, 0, 'done')
+        conn.commit()
+        return _backfill_chunks(spec, target, conn, provider, fetch, concurrency, restart, verbose, stats)
+
+    _save_checkpoint(conn, target, resume_after, 'running')
+    conn.commit()
+
+    # Cache hits are written straight away, in one transaction
+    hashes = {row_id: embeddings.text_hash(text) for row_id, text in rows}
+    cached = cache.get_many([text for _, text in rows], model, dims) if provider.cacheable else {}
+    hit_rows = [(row_id, cached[hashes[row_id]])
+                for row_id, _ in rows if hashes[row_id] in cached]
+    with conn:
+        write_embeddings(conn, target, hit_rows)
+        cache.record(hits=len(hit_rows), misses=len(rows) - len(hit_rows))
+    stats['cached'] = len(hit_rows)
+    pending = [(row_id, text) for row_id, text in rows if hashes[row_id] not in cached]
+
+    # Batches complete out of order; the checkpoint only advances past a
+    # batch once every earlier batch has been written
+    batches = list(pack_batches(pending))
+    done = [False] * len(batches)
+    watermark = 0
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        queue = iter(enumerate(batches))
+        for batch_no, batch in queue:
+            in_flight[pool.submit(fetch_with_backoff, [t for _, t in batch], fetch)] = batch_no
+            if len(in_flight) >= concurrency:
+                break
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                batch_no = in_flight.pop(future)
+                batch = batches[batch_no]
+                try:
+                    vectors = future.result()
+                except Exception as e:
+                    stats['failed'] += len(batch)
+                    print(f"  Error on {target} batch {batch[0][0]}..{batch[-1][0]}: {e}")
+                    vectors = None
+
+                with conn:
+                    if vectors is not None:
+                        write_embeddings(conn, target, [
+                            (row_id, vec) for (row_id, _), vec in zip(batch, vectors)
+                        ])
+                        if provider.cacheable:
+                            cache.put_many({
+                                hashes[row_id]: vec for (row_id, _), vec in zip(batch, vectors)
+                            }, model, dims)
+                        stats['embedded'] += len(batch)
+                    done[batch_no] = True
+                    while watermark < len(batches) and done[watermark]:
+                        watermark += 1
+                    last_id = batches[watermark - 1][-1][0] if watermark else resume_after
+                    _save_checkpoint(conn, target, last_id, 'running',
+                                     len(batch) if vectors is not None else 0)
+
+                if verbose:
+                    print(f"  Embedded {stats['embedded']}/{len(pending)} {target}...")
+
+                next_batch = next(queue, None)
+                if next_batch is not None:
+                    batch_no, batch = next_batch
+                    in_flight[pool.submit(fetch_with_backoff, [t for _, t in batch], fetch)] = batch_no
+
+    with conn:
+        _save_checkpoint(conn, target, 0, 'done')
+        cache.flush()
+
+    elapsed = time.time() - started
+    stats['seconds'] = round(elapsed, 3)
+    stats['rows_per_second'] = round((stats['embedded'] + stats['cached']) / elapsed, 1) if elapsed else 0.0
+    return _backfill_chunks(spec, target, conn, provider, fetch, concurrency, restart, verbose, stats)
+
+def _backfill_chunks(spec: Dict[str, Any], target: str, conn: sqlite3.Connection,
+                     provider: EmbeddingProvider, fetch: Callable[[List[str]], List[List[float]]],
+                     concurrency: int, restart: bool, verbose: bool,
+                     stats: Dict[str, float]) -> Dict[str, float]:
+    """Embed the chunks of long items of `target` and write their mean vectors."""
+    if 'chunks' not in spec:
+        return stats
+    chunk_stats = backfill(spec['chunks'], conn, fetch=fetch, concurrency=concurrency,
+                           restart=restart, verbose=verbose, provider=provider)
+    stats['chunks_embedded'] = chunk_stats['embedded'] + chunk_stats['cached']
+    stats['failed'] += chunk_stats['failed']
+    stats['aggregated'] = aggregate_parents(conn, target)
+    if verbose and stats['aggregated']:
+        print(f"  Pooled {stats['aggregated']} long {target} from their chunks")
+    return stats
+
+def generate_all(targets: Optional[List[str]] = None,
+                 concurrency: int = MAX_IN_FLIGHT,
+                 restart: bool = False,
+                 provider: Optional[str] = None) -> List[Dict[str, float]]:
+    conn = connect(DB_PATH)
+    try:
+        results = []
+        for target in targets or DEFAULT_TARGETS:
+            stats = backfill(target, conn, concurrency=concurrency, restart=restart,
+                             provider=get_provider(provider))
+            results.append(stats)
+            print(f"\n✅ {target}: embedded {stats['embedded']}, "
+                  f"{stats['cached']} from cache, {stats['failed']} failed "
+                  f"({stats.get('rows_per_second', 0)} rows/s)")
+        return results
+    finally:
+        conn.close()
 
 if __name__ == '__main__':
-    generate_all()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Backfill missing embeddings")
+    parser.add_argument("--target", action="append", choices=list(TARGETS),
+                        help="Table to backfill (repeatable, default: facts and messages)")
+    parser.add_argument("--concurrency", type=int, default=MAX_IN_FLIGHT,
+                        help="Maximum requests in flight")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the checkpoint of an interrupted run")
+    parser.add_argument("--provider", choices=list(PROVIDERS),
+                        help="Embedding provider (default: ATLAS_EMBEDDING_PROVIDER)")
+    args = parser.parse_args()
+
+    generate_all(args.target, args.concurrency, args.restart, args.provider)
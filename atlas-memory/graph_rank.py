@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Atlas Graph Rank
+Centrality and community structure of the memory_links graph, for recall.
+
+Scores are computed over the cached CSR snapshot (see link_graph.py) with
+array operations only: a sparse matrix-vector product is one np.bincount
+over the edge arrays, so
+
+    PageRank            power iteration with strength-weighted transitions,
+                        dangling mass returned to the personalisation vector
+    weighted degree     sum of link strengths at each fact
+    communities         weighted label propagation (ties keep the own label)
+
+GraphRank holds the results for one link generation and computes each lazily
+on first use; graph_rank() hands out the one for the current snapshot, so
+nothing is recomputed until memory_links changes.
+
+blend() folds the graph into a hybrid result list without any extra
+embedding call or SQL. It only re-ranks the candidates the query already
+matched: each is boosted by its (normalised) PageRank and by a share of the
+score of any of the best hits it is linked to. Linked facts the query did
+not match are never added, so the graph cannot pull in unrelated results.
+"""
+
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from link_graph import LinkGraph, cached_graph
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_ITERATIONS = 50
+PAGERANK_TOLERANCE = 1e-8
+COMMUNITY_ITERATIONS = 20
+
+# Default of search_facts_hybrid(graph=...): opt in with ATLAS_GRAPH_BLEND=1
+GRAPH_BLEND = os.environ.get("ATLAS_GRAPH_BLEND", "0") == "1"
+# Score boost of the most central fact (others scale with their PageRank)
+CENTRALITY_WEIGHT = 0.2
+# Share of a seed's score passed to each linked candidate, scaled by link strength
+NEIGHBOR_WEIGHT = 0.5
+NEIGHBOR_MIN_STRENGTH = 0.5
+# Best hits that lend support to the candidates they link to
+SUPPORT_SEEDS = 3
+
+
+class GraphRank:
+    """PageRank, weighted degree and community labels of one LinkGraph."""
+
+    def __init__(self, graph: LinkGraph):
+        self.graph = graph
+        n = len(graph.ids)
+        # Owning node of each edge (edges are grouped by node in CSR order)
+        self._sources = np.repeat(np.arange(n), np.diff(graph.indptr))
+        self._out = np.bincount(self._sources, weights=graph.strengths, minlength=n)
+        self._pagerank = None
+        self._communities = None
+
+    @property
+    def generation(self) -> int:
+        return self.graph.generation
+
+    def nodes(self, fact_ids) -> np.ndarray:
+        """Node index of each fact id (-1 for facts without links)."""
+        ids = self.graph.ids
+        fact_ids = np.asarray(fact_ids, dtype=np.int64)
+        if not len(ids):
+            return np.full(len(fact_ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(ids, fact_ids), len(ids) - 1)
+        return np.where(ids[pos] == fact_ids, pos, -1)
+
+    @property
+    def weighted_degree(self) -> np.ndarray:
+        """Total strength of the links at each node."""
+        return self._out
+
+    def personalized_pagerank(self, personalization: Optional[np.ndarray] = None,
+                              damping: float = PAGERANK_DAMPING,
+                              iterations: int = PAGERANK_ITERATIONS,
+                              tolerance: float = PAGERANK_TOLERANCE) -> np.ndarray:
+        """
+        PageRank over strength-weighted edges, restarting at `personalization`
+        (a non-negative weight per node; uniform when None). Sums to 1.
+        """
+        n = len(self.graph.ids)
+        if not n:
+            return np.zeros(0)
+        if personalization is None:
+            restart = np.full(n, 1.0 / n)
+        else:
+            restart = np.asarray(personalization, dtype=np.float64)
+            restart = restart / restart.sum()
+        dangling = self._out == 0
+        # Transition weight of each edge: its share of the owner's out-strength
+        share = self.graph.strengths / np.where(dangling, 1.0, self._out)[self._sources]
+        rank = restart.copy()
+        for _ in range(iterations):
+            spread = np.bincount(self.graph.neighbors, weights=rank[self._sources] * share, minlength=n)
+            updated = damping * spread + (damping * rank[dangling].sum() + 1 - damping) * restart
+            delta = np.abs(updated - rank).sum()
+            rank = updated
+            if delta < tolerance:
+                break
+        return rank
+
+    def personalized(self, seeds: Dict[int, float], **kwargs) -> Dict[int, float]:
+        """Personalised PageRank restarting at `seeds` ({fact id: weight}), by fact id."""
+        nodes = self.nodes(list(seeds))
+        weights = np.fromiter(seeds.values(), dtype=np.float64, count=len(seeds))
+        keep = (nodes >= 0) & (weights > 0)
+        if not keep.any():
+            return {}
+        restart = np.zeros(len(self.graph.ids))
+        np.add.at(restart, nodes[keep], weights[keep])
+        rank = self.personalized_pagerank(restart, **kwargs)
+        hit = np.flatnonzero(rank)
+        return dict(zip(self.graph.ids[hit].tolist(), rank[hit].tolist()))
+
+    @property
+    def pagerank(self) -> np.ndarray:
+        """Global PageRank of each node (computed once per generation)."""
+        if self._pagerank is None:
+            self._pagerank = self.personalized_pagerank()
+        return self._pagerank
+
+    @property
+    def centrality(self) -> np.ndarray:
+        """PageRank scaled so the most central node is 1."""
+        rank = self.pagerank
+        top = rank.max() if len(rank) else 0.0
+        return rank / top if top > 0 else rank
+
+    @property
+    def communities(self) -> np.ndarray:
+        """Community label of each node (0..k-1)."""
+        if self._communities is None:
+            self._communities = self._label_propagation()
+        return self._communities
+
+    def _label_propagation(self) -> np.ndarray:
+        n = len(self.graph.ids)
+        labels = np.arange(n)
+        if not n:
+            return labels
+        # Every node also votes for its own label, which wins ties
+        src = np.concatenate([self._sources, np.arange(n)])
+        dst = np.concatenate([self.graph.neighbors, np.arange(n)])
+        weight = np.concatenate([self.graph.strengths.astype(np.float64), np.full(n, 1e-9)])
+        # Half the nodes move per round, which stops two-colourings flipping forever
+        coin = np.random.default_rng(0)
+        for _ in range(COMMUNITY_ITERATIONS):
+            keys, inverse = np.unique(src * n + labels[dst], return_inverse=True)
+            votes = np.bincount(inverse, weights=weight)
+            owner = keys // n
+            # keys are sorted by owner: one segment per node, in node order
+            starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+            best = np.repeat(np.maximum.reduceat(votes, starts), np.diff(np.r_[starts, len(keys)]))
+            top = np.flatnonzero(votes == best)
+            top = top[np.r_[True, owner[top][1:] != owner[top][:-1]]]
+            wanted = keys[top] % n
+            if np.array_equal(wanted, labels):
+                break
+            move = coin.random(n) < 0.5
+            labels = np.where(move, wanted, labels)
+        return np.unique(labels, return_inverse=True)[1]
+
+    def neighbors(self, fact_id: int, min_strength: float = 0.0) -> List[tuple]:
+        """(fact id, strength) of the facts one hop from `fact_id`."""
+        node = self.graph.node(fact_id)
+        if node < 0:
+            return []
+        edges = np.arange(self.graph.indptr[node], self.graph.indptr[node + 1])
+        edges = edges[self.graph.strengths[edges] >= min_strength]
+        return list(zip(self.graph.ids[self.graph.neighbors[edges]].tolist(),
+                        self.graph.strengths[edges].tolist()))
+
+    def top(self, limit: int = 10) -> List[Dict]:
+        """The most central facts with their scores."""
+        order = np.argsort(-self.pagerank)[:limit]
+        return [
+            {
+                'id': int(self.graph.ids[i]),
+                'pagerank': float(self.pagerank[i]),
+                'weighted_degree': float(self.weighted_degree[i]),
+                'community': int(self.communities[i])
+            }
+            for i in order
+        ]
+
+
+# ==================== CACHE ====================
+
+_ranks: Dict[str, GraphRank] = {}
+
+
+def graph_rank(conn: sqlite3.Connection, db_path: Union[str, Path],
+               wait: bool = False) -> Optional[GraphRank]:
+    """
+    Scores for the current link graph snapshot (see cached_graph), or None
+    while the snapshot is still being built.
+    """
+    graph = cached_graph(conn, db_path, wait=wait)
+    if graph is None:
+        return None
+    key = str(Path(db_path).resolve())
+    rank = _ranks.get(key)
+    if rank is None or rank.graph is not graph:
+        rank = GraphRank(graph)
+        _ranks[key] = rank
+    return rank
+
+
+# ==================== RECALL ====================
+
+def blend(hits: List[Dict], rank: GraphRank, limit: int) -> List[Dict]:
+    """
+    Re-rank hybrid hits (dicts with id and combined_score, best first) with
+    graph evidence: a PageRank boost, plus support from the best SUPPORT_SEEDS
+    hits they are linked to. Only the given hits are scored and returned;
+    adds 'graph_score' to every one.
+    """
+    if not hits or not len(rank.graph.ids):
+        return hits[:limit]
+    blended = {hit['id']: dict(hit, graph_score=0.0) for hit in hits}
+
+    for seed in hits[:SUPPORT_SEEDS]:
+        for fact_id, strength in rank.neighbors(seed['id'], NEIGHBOR_MIN_STRENGTH):
+            hit = blended.get(fact_id)
+            if hit is not None and fact_id != seed['id']:
+                hit['graph_score'] += NEIGHBOR_WEIGHT * strength * seed['combined_score']
+
+    ids = list(blended)
+    nodes = rank.nodes(ids)
+    centrality = np.where(nodes >= 0, rank.centrality[np.maximum(nodes, 0)], 0.0)
+    for fact_id, central in zip(ids, centrality.tolist()):
+        hit = blended[fact_id]
+        base = hit['combined_score'] + hit['graph_score']
+        hit['graph_score'] += CENTRALITY_WEIGHT * central * base
+        hit['combined_score'] += hit['graph_score']
+
+    ranked = sorted(blended.values(), key=lambda h: h['combined_score'], reverse=True)
+    return ranked[:limit]
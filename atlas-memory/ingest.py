@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Atlas Bulk Ingest
+Set-based fact upserts for migrations and imports.
+
+ingest_facts() stages every incoming fact in a temp table (executemany with
+INSERT ... ON CONFLICT, so later duplicates win as with repeated save_fact
+calls), then merges the stage into `facts` with one UPDATE pass and one
+INSERT ... SELECT, all in a single transaction. WAL and synchronous=NORMAL
+are enabled for the duration.
+
+Incoming facts that match no stored key but are near-duplicates of a
+stored fact in the same category and subject (near_duplicates.py) are
+folded into that fact, as save_fact does, instead of being inserted.
+Near-duplicates under another subject are inserted and the pair recorded;
+they and near-duplicates within one batch are left to `fact dedupe`.
+
+Embedding is deferred: facts whose text changed lose their stored embedding,
+and embed_pending() backfills everything missing in token-budgeted batches
+(generate_embeddings.backfill), optionally on a background thread.
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from connections import connect
+from embedding_store import delete_embeddings
+from near_duplicates import find_near_duplicates, record_duplicates, same_subject_duplicate, sync_signatures
+
+# Staging key: 'subject' updates (category, subject) in place like save_fact;
+# 'content' only adds facts whose exact text is not stored yet
+INGEST_KEYS = {
+    'subject': ('category', 'subject'),
+    'content': ('category', 'subject', 'content'),
+}
+
+
+@contextmanager
+def bulk_pragmas(conn: sqlite3.Connection):
+    """WAL + synchronous=NORMAL while bulk writing; the previous sync level is restored."""
+    previous_sync = conn.execute("PRAGMA synchronous").fetchone()[0]
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    try:
+        yield conn
+    finally:
+        conn.execute(f"PRAGMA synchronous = {int(previous_sync)}")
+
+
+def _fact_row(fact: Union[Dict, tuple], default_source: str) -> tuple:
+    if isinstance(fact, dict):
+        return (fact['category'], fact.get('subject') or '', fact['content'],
+                fact.get('source') or default_source)
+    category, subject, content, *rest = fact
+    return (category, subject or '', content, rest[0] if rest and rest[0] else default_source)
+
+
+def merge_facts(conn: sqlite3.Connection, facts: Iterable[Union[Dict, tuple]],
+                default_source: str = 'manual', key: str = 'subject') -> Dict[str, int]:
+    """
+    Stage and merge `facts` inside the caller's transaction (no commit).
+    Facts are dicts or (category, subject, content[, source]) tuples.
+    """
+    key_columns = INGEST_KEYS[key]
+    columns = ', '.join(key_columns)
+    join = ' AND '.join(f"f.{c} = s.{c}" for c in key_columns)
+
+    conn.execute("DROP TABLE IF EXISTS temp.fact_stage")
+    conn.execute(f"""
+        CREATE TEMP TABLE fact_stage (
+            category TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            content TEXT NOT NULL,
+            source TEXT,
+            PRIMARY KEY ({columns})
+        )
+    """)
+    updates = ', '.join(
+        f"{c} = excluded.{c}" for c in ('content', 'source') if c not in key_columns
+    )
+    conn.executemany(
+        f"""INSERT INTO fact_stage (category, subject, content, source)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT ({columns}) DO UPDATE SET {updates}""",
+        (_fact_row(f, default_source) for f in facts)
+    )
+    staged = conn.execute("SELECT COUNT(*) FROM fact_stage").fetchone()[0]
+    # Facts written by other tools may not be in the near-duplicate index yet
+    sync_signatures(conn)
+
+    # facts drives the join so each row probes the stage's primary key; the
+    # other order degrades badly when many facts share (category, subject)
+    changed = conn.execute(f"""
+        SELECT f.id, s.content, s.source, f.content != s.content
+        FROM facts f CROSS JOIN fact_stage s ON {join}
+        WHERE f.content != s.content OR f.source IS NOT s.source
+    """).fetchall()
+    conn.executemany(
+        """UPDATE facts SET content = ?, source = ?,
+           updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+           WHERE id = ?""",
+        [(content, source, fact_id) for fact_id, content, source, _ in changed]
+    )
+    # Changed text needs a new embedding; the backfill picks these up
+    stale = [fact_id for fact_id, _, _, text_changed in changed if text_changed]
+    delete_embeddings(conn, 'facts', stale)
+
+    # What is left in the stage after dropping matched keys is new, unless
+    # it restates a stored fact near-verbatim ('subject' ingests then update that fact)
+    conn.execute(f"""
+        DELETE FROM fact_stage WHERE rowid IN (
+            SELECT s.rowid FROM facts f CROSS JOIN fact_stage s ON {join}
+        )
+    """)
+    near: Dict[int, tuple] = {}
+    flagged = []
+    folded = 0
+    for rowid, category, subject, content, source in conn.execute(
+            "SELECT rowid, category, subject, content, source FROM fact_stage ORDER BY rowid").fetchall():
+        duplicates = find_near_duplicates(conn, content, category=category)
+        fact_id = same_subject_duplicate(conn, subject, duplicates)
+        if fact_id is not None:
+            conn.execute("DELETE FROM fact_stage WHERE rowid = ?", (rowid,))
+            near[fact_id] = (content, source)
+            folded += 1
+        elif duplicates:
+            flagged.append(((category, subject, content), duplicates))
+    near_stale = []
+    if near and key == 'subject':
+        placeholders = ','.join('?' * len(near))
+        current = dict(conn.execute(
+            f"SELECT id, content FROM facts WHERE id IN ({placeholders})", list(near)
+        ).fetchall())
+        conn.executemany(
+            """UPDATE facts SET content = ?, source = ?,
+               updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+               WHERE id = ?""",
+            [(content, source, fact_id) for fact_id, (content, source) in near.items()]
+        )
+        near_stale = [fact_id for fact_id, (content, _) in near.items() if current[fact_id] != content]
+        delete_embeddings(conn, 'facts', near_stale)
+
+    cur = conn.execute("""
+        INSERT INTO facts (category, subject, content, source)
+        SELECT category, subject, content, source FROM fact_stage ORDER BY rowid
+    """)
+    inserted = cur.rowcount
+    for values, duplicates in flagged:
+        fact_id = conn.execute(
+            "SELECT MAX(id) FROM facts WHERE category = ? AND subject = ? AND content = ?", values
+        ).fetchone()[0]
+        record_duplicates(conn, fact_id, duplicates)
+    conn.execute("DROP TABLE temp.fact_stage")
+    # Index inserted facts and re-index changed ones (their signatures were dropped)
+    sync_signatures(conn)
+    return {
+        'staged': staged,
+        'inserted': inserted,
+        'updated': len(changed),
+        'near_duplicates': folded,
+        'flagged_duplicates': len(flagged),
+        'reembed': len(stale) + len(near_stale),
+        'unchanged': staged - inserted - len(changed) - folded,
+    }
+
+
+def ingest_facts(conn: sqlite3.Connection, facts: Iterable[Union[Dict, tuple]],
+                 default_source: str = 'manual', key: str = 'subject') -> Dict[str, float]:
+    """Upsert `facts` in one transaction. Returns row counts and throughput."""
+    started = time.time()
+    with bulk_pragmas(conn):
+        with conn:
+            stats = merge_facts(conn, facts, default_source, key)
+    elapsed = time.time() - started
+    stats['seconds'] = round(elapsed, 3)
+    stats['rows_per_second'] = round(stats['staged'] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+
+def embed_pending(db_path: Union[str, Path],
+                  fetch: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                  targets: Iterable[str] = ('facts',),
+                  provider=None,
+                  background: bool = False) -> Union[threading.Thread, List[Dict]]:
+    """
+    Batch-embed every row of `targets` without an embedding, on a fresh
+    connection. With `background`, runs on a daemon thread and returns it.
+    """
+    import generate_embeddings
+
+    def run() -> List[Dict]:
+        conn = connect(db_path)
+        try:
+            results = []
+            for target in targets:
+                kwargs = {'fetch': fetch, 'provider': provider}
+                try:
+                    results.append(generate_embeddings.backfill(target, conn, verbose=False, **kwargs))
+                except Exception as e:
+                    print(f"[Memory] Deferred embedding of {target} failed: {e}")
+            return results
+        finally:
+            conn.close()
+
+    if not background:
+        return run()
+    thread = threading.Thread(target=run, name='atlas-ingest-embed', daemon=True)
+    thread.start()
+    return thread
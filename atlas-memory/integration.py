@@ -6,181 +6,176 @@ Provides high-level functions for integrating Atlas Memory
 into Clawdbot's active workflow.
 """
 
-import json
 import sys
 import os
+from contextlib import contextmanager
 from pathlib import Path
 
 # Add parent to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 from memory_manager import AtlasMemory
+from context_cache import ContextCache, write_generation
+from context_packer import CONTEXT_TOKEN_BUDGET, pack_context
 
 DB_PATH = Path(__file__).parent / "atlas_memory.db"
 
 
+# Set by memory_service so every call reuses one warm AtlasMemory
+_resident_memory = None
+_context_cache = ContextCache()
+
+
 def get_memory():
     """Get memory manager instance."""
     return AtlasMemory(str(DB_PATH))
 
 
+def set_resident_memory(memory):
+    """Use `memory` for all calls instead of opening one per call (None to reset)."""
+    global _resident_memory
+    _resident_memory = memory
+
+
+@contextmanager
+def memory_session():
+    """Yield the resident memory, or a fresh one that is closed afterwards."""
+    if _resident_memory is not None:
+        yield _resident_memory
+        return
+    m = get_memory()
+    try:
+        yield m
+    finally:
+        m.close()
+
+
 # ==================== FACT OPERATIONS ====================
 
 def fact_add(category: str, subject: str, content: str, source: str = "conversation"):
     """Add a fact to memory."""
-    m = get_memory()
-    try:
+    with memory_session() as m:
         fact_id = m.save_fact(category, subject, content, source)
         return {"success": True, "fact_id": fact_id}
-    finally:
-        m.close()
 
 
 def fact_search(query: str, limit: int = 5):
     """Search facts using hybrid search."""
-    m = get_memory()
-    try:
+    with memory_session() as m:
         results = m.search_facts_hybrid(query, limit)
         return {"success": True, "results": results}
-    finally:
-        m.close()
 
 
 def fact_list(category: str = None):
     """List all facts, optionally filtered by category."""
-    m = get_memory()
-    try:
+    with memory_session() as m:
         facts = m.get_all_facts()
         if category:
             facts = [f for f in facts if f['category'].lower() == category.lower()]
         return {"success": True, "facts": facts}
-    finally:
-        m.close()
 
 
 def fact_delete(fact_id: int):
     """Delete a fact by ID."""
-    m = get_memory()
-    try:
+    with memory_session() as m:
         deleted = m.delete_fact(fact_id)
         return {"success": deleted}
-    finally:
-        m.close()
 
 
 # ==================== SOUL OPERATIONS ====================
 
 def soul_set(aspect: str, content: str):
     """Set or update a soul aspect."""
-    m = get_memory()
-    try:
+    with memory_session() as m:
         m.soul_set(aspect, content)
         return {"success": True, "aspect": aspect}
-    finally:
-        m.close()
 
 
 def soul_get(aspect: str):
     """Get a soul aspect."""
-    m = get_memory()
-    try:
+    with memory_session() as m:
         result = m.soul_get(aspect)
         if result:
             return {"success": True, "aspect": result}
         return {"success": False, "error": "Aspect not found"}
-    finally:
-        m.close()
 
 
 def soul_list():
     """List all soul aspects."""
-    m = get_memory()
-    try:
+    with memory_session() as m:
         aspects = m.soul_list()
         return {"success": True, "aspects": aspects}
-    finally:
-        m.close()
 
 
 def soul_delete(aspect: str):
     """Delete a soul aspect."""
-    m = get_memory()
-    try:
+    with memory_session() as m:
         deleted = m.soul_delete(aspect)
         return {"success": deleted}
-    finally:
-        m.close()
 
 
 # ==================== MESSAGE OPERATIONS ====================
 
 def message_save(role: str, content: str, session_id: str = "main", embed: bool = True):
     """Save a message and optionally embed it."""
-    m = get_memory()
-    try:
+    with memory_session() as m:
         msg_id = m.save_message(role, content, session_id)
         if embed:
             m.embed_message(msg_id)
         return {"success": True, "message_id": msg_id}
-    finally:
-        m.close()
 
 
 def message_search(query: str, session_id: str = None, limit: int = 5):
     """Search past messages semantically."""
-    m = get_memory()
-    try:
+    with memory_session() as m:
         results = m.search_messages(query, session_id, limit)
         return {"success": True, "results": results}
-    finally:
-        m.close()
+
+
+def session_recall(session_id: str = "main"):
+    """Summaries covering a session plus its unsummarised recent messages."""
+    with memory_session() as m:
+        return {"success": True, **m.recall_session(session_id)}
 
 
 # ==================== CONTEXT GENERATION ====================
 
 def get_relevant_context(query: str, include_soul: bool = True, include_facts: bool = True,
-                         include_messages: bool = True, fact_limit: int = 5, msg_limit: int = 3):
+                         include_messages: bool = True, fact_limit: int = 5, msg_limit: int = 3,
+                         token_budget: int = CONTEXT_TOKEN_BUDGET):
     """
     Get relevant context for a query.
-    Returns combined context from facts, soul, and past messages.
+    Returns combined context from soul summaries, facts and past messages,
+    packed within `token_budget` tokens (see context_packer.py).
+    Repeated requests are served from the context cache until the next write.
     """
-    m = get_memory()
-    try:
-        context_parts = []
-        
-        # Soul context
-        if include_soul:
-            soul_ctx = m.get_soul_context()
-            if soul_ctx:
-                context_parts.append(soul_ctx)
+    with memory_session() as m:
+        key = _context_cache.make_key(
+            query, include_soul=include_soul, include_facts=include_facts,
+            include_messages=include_messages, fact_limit=fact_limit, msg_limit=msg_limit,
+            token_budget=token_budget
+        )
+        generation = write_generation(m.conn)
+        cached = _context_cache.get(key, generation)
+        if cached is not None:
+            return dict(cached)
         
-        # Relevant facts
-        if include_facts:
-            facts = m.search_facts_hybrid(query, fact_limit)
-            if facts:
-                lines = ["## Relevant Facts"]
-                for f in facts:
-                    if f['subject']:
-                        lines.append(f"- **{f['category']}/{f['subject']}**: {f['content']}")
-                    else:
-                        lines.append(f"- **{f['category']}**: {f['content']}")
-                context_parts.append("\n".join(lines))
-        
-        # Relevant past messages
-        if include_messages:
-            messages = m.search_messages(query, limit=msg_limit)
-            if messages:
-                lines = ["## Relevant Past Conversations"]
-                for msg in messages:
-                    role = "User" if msg['role'] == 'user' else "Atlas"
-                    lines.append(f"- [{role}] {msg['content'][:200]}...")
-                context_parts.append("\n".join(lines))
-        
-        return {
+        packed = pack_context(
+            m, query, token_budget,
+            include_soul=include_soul, include_facts=include_facts,
+            include_messages=include_messages, fact_limit=fact_limit, msg_limit=msg_limit
+        )
+        result = {
             "success": True,
-            "context": "\n\n".join(context_parts) if context_parts else ""
+            "context": packed.pop("context"),
+            **packed
         }
-    finally:
-        m.close()
+        _context_cache.put(key, generation, result)
+        return dict(result)
+
+
+def context_cache_stats():
+    """Hit-rate stats of this process's context cache."""
+    return {"success": True, "stats": _context_cache.stats()}
 
 
 # ==================== AUTO FACT EXTRACTION ====================
@@ -194,56 +189,33 @@ def extract_facts_from_text(text: str, context: str = ""):
     return {"success": True, "facts": [], "note": "Use agent-level extraction"}
 
 
+# ==================== SERVICE DISPATCH ====================
+
+# Functions memory_service exposes as JSON-RPC methods
+METHODS = {
+    f.__name__: f for f in (
+        fact_add, fact_search, fact_list, fact_delete,
+        soul_set, soul_get, soul_list, soul_delete,
+        message_save, message_search, session_recall,
+        get_relevant_context, context_cache_stats,
+        extract_facts_from_text,
+    )
+}
+
+
+def dispatch(method: str, params: dict = None):
+    """Call an integration function by name with keyword params."""
+    if method not in METHODS:
+        raise KeyError(method)
+    return METHODS[method](**(params or {}))
+
+
 # ==================== CLI ====================
 
 def main():
-    """CLI interface for integration testing."""
-    import argparse
-    
-    parser = argparse.ArgumentParser(description="Atlas Memory Integration")
-    parser.add_argument("command", choices=[
-        "fact-add", "fact-search", "fact-list", "fact-delete",
-        "soul-set", "soul-get", "soul-list", "soul-delete",
-        "msg-save", "msg-search", "context"
-    ])
-    parser.add_argument("args", nargs="*")
-    parser.add_argument("--json", action="store_true", help="Output as JSON")
-    
-    args = parser.parse_args()
-    
-    result = None
-    
-    if args.command == "fact-add" and len(args.args) >= 3:
-        result = fact_add(args.args[0], args.args[1], args.args[2])
-    elif args.command == "fact-search" and len(args.args) >= 1:
-        result = fact_search(args.args[0])
-    elif args.command == "fact-list":
-        result = fact_list(args.args[0] if args.args else None)
-    elif args.command == "fact-delete" and len(args.args) >= 1:
-        result = fact_delete(int(args.args[0]))
-    elif args.command == "soul-set" and len(args.args) >= 2:
-        result = soul_set(args.args[0], args.args[1])
-    elif args.command == "soul-get" and len(args.args) >= 1:
-        result = soul_get(args.args[0])
-    elif args.command == "soul-list":
-        result = soul_list()
-    elif args.command == "soul-delete" and len(args.args) >= 1:
-        result = soul_delete(args.args[0])
-    elif args.command == "msg-save" and len(args.args) >= 2:
-        result = message_save(args.args[0], args.args[1])
-    elif args.command == "msg-search" and len(args.args) >= 1:
-        result = message_search(args.args[0])
-    elif args.command == "context" and len(args.args) >= 1:
-        result = get_relevant_context(args.args[0])
-    else:
-        print("Invalid command or missing arguments")
-        parser.print_help()
-        return
-    
-    if args.json:
-        print(json.dumps(result, indent=2, default=str))
-    else:
-        print(result)
+    """CLI interface (forwards to memory_service when it is running)."""
+    import memory_client
+    memory_client.main()
 
 
 if __name__ == "__main__":
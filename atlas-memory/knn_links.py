@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Atlas k-NN Links
+Bulk nearest-neighbour search over the fact embedding matrix for auto-linking.
+
+Linking one fact at a time costs a full index scan per insert, and facts
+written outside MemoryEvolution.add_with_links (save_fact, store-fact.py,
+migrate_markdown.py) were never linked at all. knn_pairs() instead finds
+the top-k neighbours of many facts at once: query rows are multiplied
+against the whole unit-vector matrix one block at a time, so a block is a
+single (block, n) matrix product and the peak scratch memory is
+block * n floats however large the corpus.
+
+Pairs come back canonical (newer fact -> older fact, the direction
+add_with_links has always linked in) with mutual neighbours reported once.
+`relink_watermark` records the highest fact_embeddings rowid already linked,
+so an incremental run only queries facts embedded (or re-embedded) since.
+"""
+
+import sqlite3
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Query rows per matrix product
+KNN_BLOCK = 1024
+# Neighbours linked per fact, and the minimum cosine similarity for a link
+KNN_NEIGHBORS = 5
+KNN_THRESHOLD = 0.5
+
+
+def knn_pairs(ids: np.ndarray, matrix: np.ndarray, queries: np.ndarray,
+              k: int = KNN_NEIGHBORS, threshold: float = KNN_THRESHOLD,
+              block: int = KNN_BLOCK) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Top-k neighbours (cosine >= threshold) of the rows at positions `queries`
+    among all rows of `matrix` (unit vectors, aligned with `ids`).
+    Returns (source ids, target ids, similarities), deduplicated unordered pairs
+    with source the newer (larger) fact id.
+    """
+    n = len(ids)
+    k = min(k, n - 1)
+    if k <= 0 or len(queries) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+
+    sources, targets, sims = [], [], []
+    for start in range(0, len(queries), block):
+        rows = queries[start:start + block]
+        scores = matrix[rows] @ matrix.T
+        # A fact is not its own neighbour
+        scores[np.arange(len(rows)), rows] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        keep = top_scores >= threshold
+        sources.append(np.repeat(ids[rows], k)[keep.ravel()])
+        targets.append(ids[top][keep])
+        sims.append(top_scores[keep])
+
+    a = np.concatenate(sources)
+    b = np.concatenate(targets)
+    sim = np.concatenate(sims).astype(np.float32)
+    newer, older = np.maximum(a, b), np.minimum(a, b)
+    _, first = np.unique(np.stack([newer, older], axis=1), axis=0, return_index=True)
+    return newer[first], older[first], sim[first]
+
+
+# ==================== WATERMARK ====================
+
+def relink_watermark(conn: sqlite3.Connection) -> Optional[int]:
+    """Highest fact_embeddings rowid linked by the last relink (None if never run)."""
+    row = conn.execute(
+        "SELECT value FROM atlas_settings WHERE key = 'relink_embedding_rowid'"
+    ).fetchone()
+    return int(row[0]) if row else None
+
+
+def set_relink_watermark(conn: sqlite3.Connection, rowid: int):
+    conn.execute(
+        """INSERT INTO atlas_settings (key, value) VALUES ('relink_embedding_rowid', ?)
+           ON CONFLICT(key) DO UPDATE SET value = excluded.value""",
+        (str(rowid),)
+    )
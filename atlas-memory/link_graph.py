@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Atlas Link Graph
+In-memory snapshot of the `memory_links` knowledge graph for traversal.
+
+The snapshot is a compressed-sparse-row adjacency over fact ids: for each
+fact, the slice indptr[i]:indptr[i + 1] of the edge arrays holds its
+neighbours, link strengths and types. A link is an edge source -> target,
+plus target -> source (marked reverse) when it is bidirectional, the same
+directions MemoryEvolution.find_connections has always followed.
+
+A snapshot is stamped with `link_generation`, a counter that triggers bump
+on every change to memory_links and every deleted fact, so a single-row
+read tells whether it is still current. traverse() expands a whole BFS
+level at a time with array operations; callers fetch fact text for the
+result in one query (fact_texts).
+
+When no current snapshot is cached (a cold process, or right after a
+write), one is built in a background thread and the query is answered by
+traverse_sql(), a recursive CTE over the link indexes.
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from connections import connect
+
+LINK_GRAPH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS link_generation (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO link_generation (id, generation) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS memory_links_generation_ai AFTER INSERT ON memory_links BEGIN
+    UPDATE link_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS memory_links_generation_au AFTER UPDATE ON memory_links BEGIN
+    UPDATE link_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS memory_links_generation_ad AFTER DELETE ON memory_links BEGIN
+    UPDATE link_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+-- Links to a deleted fact drop out of the graph
+CREATE TRIGGER IF NOT EXISTS facts_link_generation_ad AFTER DELETE ON facts BEGIN
+    UPDATE link_generation SET generation = generation + 1 WHERE id = 1;
+END;
+"""
+
+# One traversal result: (fact id, hops, reached from, link type, strength)
+Reached = Tuple[int, int, int, str, float]
+
+
+def ensure_link_graph_schema(conn: sqlite3.Connection):
+    """Create the link generation counter and its triggers (needs memory_links)."""
+    conn.executescript(LINK_GRAPH_SCHEMA)
+
+
+def link_generation(conn: sqlite3.Connection) -> Optional[int]:
+    """Current link generation, or None on databases without the counter."""
+    try:
+        row = conn.execute("SELECT generation FROM link_generation WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+# ==================== SNAPSHOT ====================
+
+class LinkGraph:
+    """CSR adjacency of memory_links at one link generation."""
+
+    def __init__(self, generation: int, ids: np.ndarray, indptr: np.ndarray, neighbors: np.ndarray,
+                 strengths: np.ndarray, types: np.ndarray, reverse: np.ndarray,
+                 type_names: List[str]):
+        self.generation = generation
+        self.ids = ids                # sorted fact ids, one per node
+        self.indptr = indptr          # node i's edges are [indptr[i], indptr[i + 1])
+        self.neighbors = neighbors    # node index at the other end of each edge
+        self.strengths = strengths
+        self.types = types            # index into type_names
+        self.reverse = reverse        # edge follows a bidirectional link backwards
+        self.type_names = type_names
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection) -> "LinkGraph":
+        """Snapshot every link between live facts (in one read transaction)."""
+        in_transaction = conn.in_transaction
+        if not in_transaction:
+            conn.execute("BEGIN")
+        try:
+            generation = link_generation(conn) or 0
+            rows = conn.execute("""
+                SELECT ml.source_fact_id, ml.target_fact_id, ml.link_type, ml.strength, ml.bidirectional
+                FROM memory_links ml
+                JOIN facts s ON s.id = ml.source_fact_id
+                JOIN facts t ON t.id = ml.target_fact_id
+                ORDER BY ml.id
+            """).fetchall()
+        finally:
+            if not in_transaction:
+                conn.rollback()
+        return cls.from_links(generation, rows)
+
+    @classmethod
+    def from_links(cls, generation: int,
+                   rows: Sequence[Tuple[int, int, str, float, int]]) -> "LinkGraph":
+        """Build from (source, target, link type, strength, bidirectional) rows."""
+        type_names = sorted({row[2] for row in rows})
+        if not rows:
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(generation, empty, np.zeros(1, dtype=np.int64), empty,
+                       np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int16),
+                       np.zeros(0, dtype=bool), type_names)
+        codes = {name: i for i, name in enumerate(type_names)}
+        source = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        target = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+        strength = np.fromiter((r[3] if r[3] is not None else 0.5 for r in rows),
+                               dtype=np.float32, count=len(rows))
+        kind = np.fromiter((codes[r[2]] for r in rows), dtype=np.int16, count=len(rows))
+        both = np.fromiter((bool(r[4]) for r in rows), dtype=bool, count=len(rows))
+
+        # Forward edges, then bidirectional links walked backwards
+        order = np.arange(len(rows))
+        edge_from = np.concatenate([source, target[both]])
+        edge_to = np.concatenate([target, source[both]])
+        edge_strength = np.concatenate([strength, strength[both]])
+        edge_kind = np.concatenate([kind, kind[both]])
+        edge_reverse = np.concatenate([np.zeros(len(rows), dtype=bool), np.ones(int(both.sum()), dtype=bool)])
+        edge_order = np.concatenate([order, order[both]])
+
+        ids = np.unique(np.concatenate([source, target]))
+        rows_of = np.searchsorted(ids, edge_from)
+        # Within a node: forward edges first, each group in link order
+        sort = np.lexsort((edge_order, edge_reverse, rows_of))
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows_of, minlength=len(ids)), out=indptr[1:])
+        return cls(generation, ids, indptr, np.searchsorted(ids, edge_to)[sort],
+                   edge_strength[sort], edge_kind[sort], edge_reverse[sort], type_names)
+
+    def __len__(self) -> int:
+        return len(self.neighbors)
+
+    def node(self, fact_id: int) -> int:
+        """Node index of a fact, or -1 when it has no links."""
+        i = int(np.searchsorted(self.ids, fact_id))
+        return i if i < len(self.ids) and self.ids[i] == fact_id else -1
+
+    def edges_of(self, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(edge index, owning node) of every edge leaving `nodes`, in node order."""
+        starts = self.indptr[nodes]
+        counts = self.indptr[nodes + 1] - starts
+        total = int(counts.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        offsets = np.cumsum(counts) - counts
+        edges = np.arange(total) - np.repeat(offsets, counts) + np.repeat(starts, counts)
+        return edges, np.repeat(nodes, counts)
+
+    def traverse(self, fact_id: int, max_hops: int = 3, min_strength: float = 0.3) -> List[Reached]:
+        """
+        Breadth-first search from `fact_id` over edges of at least `min_strength`.
+        Each fact is reported once, at its first discovery (fewest hops).
+        """
+        start = self.node(fact_id)
+        if start < 0:
+            return []
+        visited = np.zeros(len(self.ids), dtype=bool)
+        visited[start] = True
+        frontier = np.array([start], dtype=np.int64)
+        reached = []
+        for hops in range(1, max_hops + 1):
+            edges, parents = self.edges_of(frontier)
+            keep = self.strengths[edges] >= min_strength
+            edges, parents = edges[keep], parents[keep]
+            targets = self.neighbors[edges]
+            fresh = ~visited[targets]
+            edges, parents, targets = edges[fresh], parents[fresh], targets[fresh]
+            if not len(targets):
+                break
+            # First edge to each new node wins, in discovery order
+            _, first = np.unique(targets, return_index=True)
+            first.sort()
+            edges, parents, targets = edges[first], parents[first], targets[first]
+            visited[targets] = True
+            reached.append((hops, edges, parents, targets))
+            frontier = targets
+
+        if not reached:
+            return []
+        hops = np.concatenate([np.full(len(t), h) for h, _, _, t in reached])
+        edges = np.concatenate([e for _, e, _, _ in reached])
+        parents = np.concatenate([p for _, _, p, _ in reached])
+        targets = np.concatenate([t for _, _, _, t in reached])
+        labels = np.array(self.type_names + [f"{name} (reverse)" for name in self.type_names], dtype=object)
+        link_types = labels[self.types[edges] + self.reverse[edges] * len(self.type_names)]
+        return list(zip(self.ids[targets].tolist(), hops.tolist(), self.ids[parents].tolist(),
+                        link_types.tolist(), self.strengths[edges].tolist()))
+
+
+# ==================== CACHE ====================
+
+_graphs: Dict[str, LinkGraph] = {}
+_building = set()
+_lock = threading.Lock()
+
+
+def _build(key: str):
+    try:
+        conn = connect(key)
+        try:
+            graph = LinkGraph.load(conn)
+        finally:
+            conn.close()
+        with _lock:
+            current = _graphs.get(key)
+            if current is None or current.generation <= graph.generation:
+                _graphs[key] = graph
+    except Exception as e:
+        print(f"[Memory] Link graph snapshot failed: {e}")
+    finally:
+        with _lock:
+            _building.discard(key)
+
+
+def cached_graph(conn: sqlite3.Connection, db_path: Union[str, Path],
+                 wait: bool = False) -> Optional[LinkGraph]:
+    """
+    The current snapshot of `db_path`'s link graph. Without `wait`, a missing
+    or stale snapshot starts a background rebuild and None is returned.
+    """
+    generation = link_generation(conn)
+    if generation is None:
+        return None
+    key = str(Path(db_path).resolve())
+    graph = _graphs.get(key)
+    if graph is not None and graph.generation == generation:
+        return graph
+    if wait:
+        graph = LinkGraph.load(conn)
+        with _lock:
+            _graphs[key] = graph
+        return graph
+    with _lock:
+        if key in _building:
+            return None
+        _building.add(key)
+    threading.Thread(target=_build, args=(key,), name='atlas-link-graph', daemon=True).start()
+    return None
+
+
+# ==================== SQL FALLBACK ====================
+
+def traverse_sql(conn: sqlite3.Connection, fact_id: int, max_hops: int = 3,
+                 min_strength: float = 0.3) -> List[Reached]:
+    """traverse() as one recursive CTE, for when no snapshot is cached."""
+    rows = conn.execute("""
+        WITH RECURSIVE walk(fact_id, hops, path_from, link_type, strength) AS (
+            SELECT ?1, 0, NULL, NULL, NULL
+            UNION
+            SELECT ml.target_fact_id, w.hops + 1, w.fact_id, ml.link_type, ml.strength
+            FROM walk w
+            JOIN memory_links ml ON ml.source_fact_id = w.fact_id
+            JOIN facts f ON f.id = ml.target_fact_id
+            WHERE w.hops < ?2 AND ml.strength >= ?3
+            UNION
+            SELECT ml.source_fact_id, w.hops + 1, w.fact_id, ml.link_type || ' (reverse)', ml.strength
+            FROM walk w
+            JOIN memory_links ml ON ml.target_fact_id = w.fact_id
+            JOIN facts f ON f.id = ml.source_fact_id
+            WHERE w.hops < ?2 AND ml.bidirectional = 1 AND ml.strength >= ?3
+        ),
+        ranked AS (
+            SELECT fact_id, hops, path_from, link_type, strength,
+                   ROW_NUMBER() OVER (PARTITION BY fact_id ORDER BY hops, strength DESC) AS pick
+            FROM walk
+        )
+        SELECT fact_id, hops, path_from, link_type, strength FROM ranked
+        WHERE pick = 1 AND fact_id != ?1
+        ORDER BY hops
+    """, (fact_id, max_hops, min_strength)).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def fact_texts(conn: sqlite3.Connection, fact_ids: Sequence[int],
+               max_chars: Optional[int] = None) -> Dict[int, Tuple[str, str]]:
+    """fact id -> (subject, content, cut to `max_chars` if given) for `fact_ids`, in one query."""
+    if not fact_ids:
+        return {}
+    content = "content" if max_chars is None else f"substr(content, 1, {int(max_chars)})"
+    rows = conn.execute(
+        f"SELECT id, subject, {content} FROM facts WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(fact_ids)),)
+    ).fetchall()
+    return {row[0]: (row[1], row[2]) for row in rows}
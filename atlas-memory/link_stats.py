@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Atlas Link Stats
+Trigger-maintained counters over the `memory_links` knowledge graph.
+
+Graph statistics used to be aggregates over the whole link table: the most
+connected facts came from a facts x memory_links join on
+`source = id OR target = id` (which no index can serve) and orphan
+detection from a double LEFT JOIN. Both are answered here from two small
+tables kept current by triggers on memory_links:
+
+    fact_degree       one row per fact with at least one link end, and its
+                      degree (a self-link counts once), indexed by degree
+    link_type_counts  link count and strength total per link type
+
+so totals, per-type counts and average strength are a read of a handful
+of rows, top hubs an index walk and orphans a primary-key probe per fact.
+Counters are backfilled once when the tables are first created.
+"""
+
+import sqlite3
+from typing import Dict, List, Tuple
+
+from embedding_store import has_table
+
+LINK_STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fact_degree (
+    fact_id INTEGER PRIMARY KEY,
+    degree INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fact_degree ON fact_degree(degree);
+
+CREATE TABLE IF NOT EXISTS link_type_counts (
+    link_type TEXT PRIMARY KEY,
+    links INTEGER NOT NULL,
+    total_strength REAL NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS memory_links_stats_ai AFTER INSERT ON memory_links BEGIN
+    INSERT INTO fact_degree (fact_id, degree) VALUES (new.source_fact_id, 1)
+        ON CONFLICT(fact_id) DO UPDATE SET degree = degree + 1;
+    INSERT INTO fact_degree (fact_id, degree)
+        SELECT new.target_fact_id, 1 WHERE new.target_fact_id != new.source_fact_id
+        ON CONFLICT(fact_id) DO UPDATE SET degree = degree + 1;
+    INSERT INTO link_type_counts (link_type, links, total_strength)
+        VALUES (new.link_type, 1, COALESCE(new.strength, 0))
+        ON CONFLICT(link_type) DO UPDATE SET links = links + 1,
+                                             total_strength = total_strength + excluded.total_strength;
+END;
+
+CREATE TRIGGER IF NOT EXISTS memory_links_stats_ad AFTER DELETE ON memory_links BEGIN
+    UPDATE fact_degree SET degree = degree - 1
+        WHERE fact_id IN (old.source_fact_id, old.target_fact_id);
+    DELETE FROM fact_degree
+        WHERE fact_id IN (old.source_fact_id, old.target_fact_id) AND degree <= 0;
+    UPDATE link_type_counts SET links = links - 1,
+                                total_strength = total_strength - COALESCE(old.strength, 0)
+        WHERE link_type = old.link_type;
+    DELETE FROM link_type_counts WHERE link_type = old.link_type AND links <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS memory_links_stats_au
+AFTER UPDATE OF source_fact_id, target_fact_id, link_type, strength ON memory_links BEGIN
+    UPDATE fact_degree SET degree = degree - 1
+        WHERE fact_id IN (old.source_fact_id, old.target_fact_id);
+    INSERT INTO fact_degree (fact_id, degree) VALUES (new.source_fact_id, 1)
+        ON CONFLICT(fact_id) DO UPDATE SET degree = degree + 1;
+    INSERT INTO fact_degree (fact_id, degree)
+        SELECT new.target_fact_id, 1 WHERE new.target_fact_id != new.source_fact_id
+        ON CONFLICT(fact_id) DO UPDATE SET degree = degree + 1;
+    DELETE FROM fact_degree
+        WHERE fact_id IN (old.source_fact_id, old.target_fact_id) AND degree <= 0;
+    UPDATE link_type_counts SET links = links - 1,
+                                total_strength = total_strength - COALESCE(old.strength, 0)
+        WHERE link_type = old.link_type;
+    INSERT INTO link_type_counts (link_type, links, total_strength)
+        VALUES (new.link_type, 1, COALESCE(new.strength, 0))
+        ON CONFLICT(link_type) DO UPDATE SET links = links + 1,
+                                             total_strength = total_strength + excluded.total_strength;
+    DELETE FROM link_type_counts WHERE link_type = old.link_type AND links <= 0;
+END;
+
+-- A deleted fact is no longer a hub (its links' other ends keep their count)
+CREATE TRIGGER IF NOT EXISTS facts_degree_ad AFTER DELETE ON facts BEGIN
+    DELETE FROM fact_degree WHERE fact_id = old.id;
+END;
+"""
+
+
+def ensure_link_stats_schema(conn: sqlite3.Connection):
+    """Create the counters and their triggers (needs memory_links), backfilling them once."""
+    backfill = not has_table(conn, 'link_type_counts')
+    conn.executescript(LINK_STATS_SCHEMA)
+    if backfill:
+        rebuild_link_stats(conn)
+
+
+def rebuild_link_stats(conn: sqlite3.Connection):
+    """Recount every counter from memory_links (no commit)."""
+    conn.execute("DELETE FROM fact_degree")
+    conn.execute("DELETE FROM link_type_counts")
+    conn.execute("""
+        INSERT INTO fact_degree (fact_id, degree)
+        SELECT fact_id, COUNT(*) FROM (
+            SELECT source_fact_id AS fact_id FROM memory_links
+            UNION ALL
+            SELECT target_fact_id FROM memory_links WHERE target_fact_id != source_fact_id
+        )
+        WHERE fact_id IN (SELECT id FROM facts)
+        GROUP BY fact_id
+    """)
+    conn.execute("""
+        INSERT INTO link_type_counts (link_type, links, total_strength)
+        SELECT link_type, COUNT(*), COALESCE(SUM(strength), 0)
+        FROM memory_links
+        GROUP BY link_type
+    """)
+
+
+# ==================== QUERIES ====================
+
+def link_type_counts(conn: sqlite3.Connection) -> Dict[str, Tuple[int, float]]:
+    """{link type: (links, total strength)}."""
+    return {
+        link_type: (links, total_strength)
+        for link_type, links, total_strength in conn.execute(
+            "SELECT link_type, links, total_strength FROM link_type_counts"
+        )
+    }
+
+
+def top_hubs(conn: sqlite3.Connection, limit: int = 5) -> List[Tuple[int, str, int]]:
+    """(fact id, subject, degree) of the most linked facts."""
+    return conn.execute("""
+        SELECT d.fact_id, f.subject, d.degree
+        FROM fact_degree d
+        JOIN facts f ON f.id = d.fact_id
+        ORDER BY d.degree DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+
+
+def orphan_facts(conn: sqlite3.Connection, older_than: str) -> List[Tuple[int, str]]:
+    """(id, subject) of facts without links created before `older_than` (a datetime() modifier)."""
+    return conn.execute("""
+        SELECT f.id, f.subject
+        FROM facts f
+        WHERE f.created_at < datetime('now', ?)
+          AND NOT EXISTS (SELECT 1 FROM fact_degree d WHERE d.fact_id = f.id)
+    """, (older_than,)).fetchall()
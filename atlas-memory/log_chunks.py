@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Atlas Log Chunks
+Heading-delimited chunks of daily logs with an FTS5 index.
+
+Each daily_logs row is split at markdown headings (long sections further at
+paragraph breaks) into daily_log_chunks rows. daily_log_chunks_fts is kept
+in sync with the chunk table by triggers, as facts_fts is with facts.
+
+Triggers on daily_logs drop a log's chunks whenever the log is inserted,
+replaced, updated or deleted. refresh_log_chunks() then re-chunks every log
+without chunks, so any writer of daily_logs (sync, migration, manual SQL)
+stays consistent without calling into this module.
+
+Chunks can optionally be embedded (generate_embeddings.py --target log_chunks);
+search_log_chunks() then fuses vector hits into the keyword ranking.
+"""
+
+import re
+import sqlite3
+from typing import Callable, Dict, List, Optional, Tuple
+
+import retrieval
+from connections import apply_schema
+
+FTS_TABLE = 'daily_log_chunks_fts'
+# Sections longer than this are split at paragraph breaks
+MAX_CHUNK_CHARS = 2000
+# Tokens of context around matches in snippets
+SNIPPET_TOKENS = 24
+SNIPPET_OPEN = '**'
+SNIPPET_CLOSE = '**'
+# Snippet for vector-only hits, which have no FTS match to highlight
+FALLBACK_SNIPPET_CHARS = 200
+
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$', re.MULTILINE)
+
+
+def ensure_chunk_schema(conn: sqlite3.Connection):
+    """Create the chunk tables, FTS index and triggers (see schema.sql) on older databases."""
+    apply_schema(conn)
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Split text at blank lines into pieces of at most ~max_chars."""
+    pieces = []
+    current = ''
+    for para in re.split(r'\n\s*\n', text):
+        para = para.strip()
+        if not para:
+            continue
+        if current and len(current) + len(para) + 2 > max_chars:
+            pieces.append(current)
+            current = para
+        else:
+            current = f"{current}\n\n{para}" if current else para
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_log(content: str, max_chars: int = MAX_CHUNK_CHARS) -> List[Tuple[str, str]]:
+    """Split a markdown log into (heading, text) chunks."""
+    sections = []
+    heading = ''
+    start = 0
+    for match in _HEADING_RE.finditer(content):
+        sections.append((heading, content[start:match.start()]))
+        heading = match.group(2)
+        start = match.end()
+    sections.append((heading, content[start:]))
+
+    chunks = []
+    for heading, body in sections:
+        body = body.strip()
+        if not body:
+            if heading:
+                chunks.append((heading, heading))
+            continue
+        for piece in _split_long(body, max_chars):
+            chunks.append((heading, piece))
+    return chunks
+
+
+def refresh_log_chunks(conn: sqlite3.Connection) -> int:
+    """Chunk every daily log that has no chunks yet. Returns chunks written."""
+    stale = conn.execute("""
+        SELECT d.date, d.content FROM daily_logs d
+        WHERE NOT EXISTS (SELECT 1 FROM daily_log_chunks c WHERE c.log_date = d.date)
+    """).fetchall()
+    rows = []
+    for date, content in stale:
+        for position, (heading, text) in enumerate(split_log(content or '')):
+            rows.append((date, position, heading, text))
+    if rows:
+        with conn:
+            conn.executemany(
+                """INSERT INTO daily_log_chunks (log_date, position, heading, content)
+                   VALUES (?, ?, ?, ?)""",
+                rows
+            )
+    return len(rows)
+
+
+def has_chunk_embeddings(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT EXISTS (SELECT 1 FROM log_chunk_embeddings)").fetchone()[0] == 1
+
+
+def search_log_chunks(conn: sqlite3.Connection, query: str, limit: int = 5,
+                      embed: Optional[Callable[[str], List[float]]] = None,
+                      vector_search: Optional[Callable[[List[float], int], List[Tuple[int, float]]]] = None,
+                      min_vector_score: float = 0.3) -> List[Dict]:
+    """
+    Ranked chunk hits for `query` with highlighted snippets.
+    Vector search is only used when `embed`/`vector_search` are given.
+    """
+    refresh_log_chunks(conn)
+    hits = retrieval.hybrid_search(
+        conn, query, limit,
+        embed=embed, vector_search=vector_search,
+        fts_table=FTS_TABLE, min_vector_score=min_vector_score
+    )
+    if not hits:
+        return []
+
+    ids = [h['id'] for h in hits]
+    placeholders = ','.join('?' * len(ids))
+    rows = {
+        r[0]: r for r in conn.execute(
+            f"""SELECT c.id, c.log_date, d.file_path, c.heading, c.content
+                FROM daily_log_chunks c
+                JOIN daily_logs d ON d.date = c.log_date
+                WHERE c.id IN ({placeholders})""",
+            ids
+        )
+    }
+    snippets = {}
+    match = retrieval.fts_query(query)
+    if match is not None:
+        snippets = dict(conn.execute(
+            f"""SELECT rowid, snippet({FTS_TABLE}, -1, ?, ?, '…', ?)
+                FROM {FTS_TABLE}
+                WHERE {FTS_TABLE} MATCH ? AND rowid IN ({placeholders})""",
+            [SNIPPET_OPEN, SNIPPET_CLOSE, SNIPPET_TOKENS, match, *ids]
+        ).fetchall())
+
+    results = []
+    for hit in hits:
+        row = rows.get(hit['id'])
+        if row is None:
+            continue
+        chunk_id, date, path, heading, content = row
+        snippet = snippets.get(chunk_id)
+        if not snippet:
+            snippet = content[:FALLBACK_SNIPPET_CHARS] + ('…' if len(content) > FALLBACK_SNIPPET_CHARS else '')
+        results.append({
+            'chunk_id': chunk_id,
+            'date': date,
+            'path': path,
+            'heading': heading,
+            'snippet': snippet,
+            'score': hit['combined_score'],
+        })
+    return results
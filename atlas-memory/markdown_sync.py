@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Atlas Markdown Sync
+Change-detecting sync of markdown memory files into SQLite.
+
+Shared by AtlasMemory.sync_daily_logs and migrate_markdown.migrate. A
+manifest records each file's mtime, size and content hash, plus the hash of
+every heading-delimited section (chunk) in it:
+
+1. Files whose mtime and size match the manifest are skipped without being
+   read, so a sync with nothing to do costs one stat per file.
+2. A changed file is re-split; facts are only extracted from chunks whose
+   hash is new, and facts derived from chunks that disappeared are deleted
+   together with their embeddings (unless another chunk still yields them).
+3. Files deleted from disk lose their daily_logs row and derived facts.
+
+Derived facts are linked to their source chunks in markdown_fact_sources.
+Extraction reuses an identical stored fact, or a near-duplicate in the same
+category (near_duplicates.py), instead of inserting a copy.
+
+watch() re-runs the sync on inotify events (Linux, via libc), or by polling
+where inotify is unavailable.
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import re
+import select
+import sqlite3
+import struct
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from connections import apply_schema
+from embedding_store import delete_embeddings
+from log_chunks import refresh_log_chunks
+from near_duplicates import find_near_duplicates, index_fact, sync_signatures
+
+MEMORY_MD_NAME = "MEMORY.md"
+# daily_logs key for MEMORY.md
+MEMORY_MD_LOG = "MEMORY"
+# Only facts with this source prefix are ever deleted by sync
+DERIVED_SOURCE_PREFIX = "migration:"
+
+WATCH_INTERVAL = 2.0  # seconds between polls without inotify
+WATCH_DEBOUNCE = 0.5  # seconds to let a burst of writes settle
+
+_SECTION_RE = re.compile(r'^#{1,6}\s', re.MULTILINE)
+
+
+def ensure_sync_schema(conn: sqlite3.Connection):
+    """Create the manifest tables (see schema.sql) on older databases."""
+    apply_schema(conn)
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def split_sections(content: str) -> List[str]:
+    """Split markdown at heading lines; each section keeps its heading line."""
+    starts = [m.start() for m in _SECTION_RE.finditer(content)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    sections = []
+    for start, end in zip(starts, starts[1:] + [len(content)]):
+        section = content[start:end].strip()
+        if section:
+            sections.append(section)
+    return sections
+
+
+def log_key(path: Path) -> str:
+    """daily_logs.date for a markdown file."""
+    return MEMORY_MD_LOG if path.name == MEMORY_MD_NAME else path.stem
+
+
+def derive_facts(path: Path, text: str) -> List[Dict]:
+    """Facts extracted from one chunk of `path`."""
+    from migrate_markdown import extract_facts_from_daily, parse_memory_md
+
+    if path.name == MEMORY_MD_NAME:
+        return parse_memory_md(text)
+    date_match = re.search(r'(\d{4}-\d{2}-\d{2})', path.name)
+    return extract_facts_from_daily(text, date_match.group(1) if date_match else path.stem)
+
+
+def markdown_files(memory_dir: Path, memory_md: Optional[Path] = None,
+                   daily_only: bool = False) -> List[Path]:
+    """Markdown files to sync: memory/*.md (date-named only with `daily_only`) and MEMORY.md."""
+    files = []
+    if memory_md is not None and memory_md.exists():
+        files.append(memory_md)
+    if memory_dir.exists():
+        for md_file in sorted(memory_dir.glob("*.md")):
+            if not daily_only or md_file.name.startswith("20"):
+                files.append(md_file)
+    return files
+
+
+# ==================== CHUNK BOOKKEEPING ====================
+
+def _link_facts(conn: sqlite3.Connection, path: str, chunk_hash: str, facts: List[Dict]) -> int:
+    """Store (or adopt identical or near-duplicate) facts for a new chunk. Returns facts inserted."""
+    inserted = 0
+    for fact in facts:
+        category = fact['category']
+        subject = fact.get('subject') or ''
+        content = fact['content']
+        row = conn.execute(
+            "SELECT MIN(id) FROM facts WHERE category = ? AND subject = ? AND content = ?",
+            (category, subject, content)
+        ).fetchone()
+        fact_id = row[0]
+        if fact_id is None:
+            duplicates = find_near_duplicates(conn, content, category=category)
+            if duplicates:
+                fact_id = duplicates[0][0]
+        if fact_id is None:
+            fact_id = conn.execute(
+                "INSERT INTO facts (category, subject, content, source) VALUES (?, ?, ?, ?)",
+                (category, subject, content, fact.get('source') or DERIVED_SOURCE_PREFIX + path)
+            ).lastrowid
+            index_fact(conn, fact_id, content)
+            inserted += 1
+        conn.execute(
+            "INSERT OR IGNORE INTO markdown_fact_sources (path, chunk_hash, fact_id) VALUES (?, ?, ?)",
+            (path, chunk_hash, fact_id)
+        )
+    return inserted
+
+
+def _drop_chunks(conn: sqlite3.Connection, path: str, chunk_hashes: Iterable[str]) -> List[int]:
+    """Forget chunks and delete derived facts no other chunk yields. Returns deleted fact ids."""
+    chunk_hashes = list(chunk_hashes)
+    if not chunk_hashes:
+        return []
+    placeholders = ','.join('?' * len(chunk_hashes))
+    params = [path, *chunk_hashes]
+    candidates = [r[0] for r in conn.execute(
+        f"""SELECT DISTINCT fact_id FROM markdown_fact_sources
+            WHERE path = ? AND chunk_hash IN ({placeholders})""",
+        params
+    )]
+    conn.execute(
+        f"DELETE FROM markdown_fact_sources WHERE path = ? AND chunk_hash IN ({placeholders})",
+        params
+    )
+    conn.execute(
+        f"DELETE FROM markdown_chunks WHERE path = ? AND chunk_hash IN ({placeholders})",
+        params
+    )
+    if not candidates:
+        return []
+    placeholders = ','.join('?' * len(candidates))
+    orphans = [r[0] for r in conn.execute(
+        f"""SELECT f.id FROM facts f
+            WHERE f.id IN ({placeholders})
+              AND f.source LIKE '{DERIVED_SOURCE_PREFIX}%'
+              AND NOT EXISTS (SELECT 1 FROM markdown_fact_sources s WHERE s.fact_id = f.id)""",
+        candidates
+    )]
+    if orphans:
+        delete_embeddings(conn, 'facts', orphans)
+        conn.execute(
+            f"DELETE FROM facts WHERE id IN ({','.join('?' * len(orphans))})", orphans
+        )
+    return orphans
+
+
+# ==================== SYNC ====================
+
+def sync_markdown(conn: sqlite3.Connection, files: Iterable[Path]) -> Dict:
+    """
+    Bring daily_logs, derived facts and the manifest in line with `files`
+    in one transaction. Returns counts plus the ids of deleted facts.
+    """
+    started = time.perf_counter()
+    manifest = {
+        row[0]: row[1:] for row in conn.execute(
+            "SELECT path, log_date, mtime_ns, size, content_hash FROM markdown_manifest"
+        )
+    }
+    stats = {
+        'files': 0, 'unchanged': 0, 'changed': 0, 'removed': 0,
+        'chunks_added': 0, 'chunks_removed': 0, 'facts_added': 0, 'facts_removed': 0,
+    }
+    removed_fact_ids = []
+    seen = set()
+    signatures_synced = False
+
+    with conn:
+        for path in files:
+            key = str(path)
+            seen.add(key)
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            stats['files'] += 1
+            entry = manifest.get(key)
+            if entry is not None and entry[1] == st.st_mtime_ns and entry[2] == st.st_size:
+                stats['unchanged'] += 1
+                continue
+
+            content = path.read_text()
+            content_hash = _hash(content)
+            log_date = log_key(path)
+            if entry is not None and entry[3] == content_hash:
+                conn.execute(
+                    "UPDATE markdown_manifest SET mtime_ns = ?, size = ? WHERE path = ?",
+                    (st.st_mtime_ns, st.st_size, key)
+                )
+                stats['unchanged'] += 1
+                continue
+
+            conn.execute(
+                """INSERT INTO daily_logs (date, file_path, content) VALUES (?, ?, ?)
+                   ON CONFLICT(date) DO UPDATE SET
+                   file_path = excluded.file_path,
+                   content = excluded.content,
+                   updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')""",
+                (log_date, key, content)
+            )
+            chunks = {_hash(section): section for section in split_sections(content)}
+            stored = {r[0] for r in conn.execute(
+                "SELECT chunk_hash FROM markdown_chunks WHERE path = ?", (key,)
+            )}
+            gone = stored - chunks.keys()
+            added = [h for h in chunks if h not in stored]
+
+            # Link new chunks first so facts an edited section still yields
+            # keep their ids and embeddings when the old section is dropped
+            conn.executemany(
+                "INSERT INTO markdown_chunks (path, chunk_hash) VALUES (?, ?)",
+                [(key, h) for h in added]
+            )
+            if added and not signatures_synced:
+                # Facts written elsewhere must be indexed before we look for duplicates
+                sync_signatures(conn)
+                signatures_synced = True
+            for chunk_hash in added:
+                facts = derive_facts(path, chunks[chunk_hash])
+                stats['facts_added'] += _link_facts(conn, key, chunk_hash, facts)
+            removed_fact_ids.extend(_drop_chunks(conn, key, gone))
+            conn.execute(
+                """INSERT INTO markdown_manifest (path, log_date, mtime_ns, size, content_hash)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(path) DO UPDATE SET
+                   log_date = excluded.log_date,
+                   mtime_ns = excluded.mtime_ns,
+                   size = excluded.size,
+                   content_hash = excluded.content_hash,
+                   synced_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')""",
+                (key, log_date, st.st_mtime_ns, st.st_size, content_hash)
+            )
+            stats['changed'] += 1
+            stats['chunks_added'] += len(added)
+            stats['chunks_removed'] += len(gone)
+
+        # Files that were synced before but no longer exist
+        for key in manifest.keys() - seen:
+            if os.path.exists(key):
+                continue
+            stored = [r[0] for r in conn.execute(
+                "SELECT chunk_hash FROM markdown_chunks WHERE path = ?", (key,)
+            )]
+            removed_fact_ids.extend(_drop_chunks(conn, key, stored))
+            conn.execute("DELETE FROM daily_logs WHERE date = ? AND file_path = ?",
+                         (manifest[key][0], key))
+            conn.execute("DELETE FROM markdown_manifest WHERE path = ?", (key,))
+            stats['removed'] += 1
+            stats['chunks_removed'] += len(stored)
+
+    if stats['changed'] or stats['removed']:
+        stats['log_chunks'] = refresh_log_chunks(conn)
+    stats['facts_removed'] = len(removed_fact_ids)
+    stats['removed_fact_ids'] = removed_fact_ids
+    stats['seconds'] = round(time.perf_counter() - started, 4)
+    return stats
+
+
+# ==================== WATCHER ====================
+
+class _Inotify:
+    """Minimal inotify reader over libc (Linux only)."""
+
+    # IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    MASK = 0x002 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self, directories: Iterable[Path]):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify not supported")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        for directory in directories:
+            if libc.inotify_add_watch(self.fd, str(directory).encode(), self.MASK) < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"cannot watch {directory}")
+
+    def wait(self, timeout: Optional[float] = None) -> List[str]:
+        """Names of files changed within `timeout` seconds (empty on timeout)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            names.append(data[offset:offset + length].rstrip(b'\0').decode(errors='replace'))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch(sync: Callable[[], Dict], directories: Iterable[Path],
+          interval: float = WATCH_INTERVAL, debounce: float = WATCH_DEBOUNCE,
+          on_sync: Optional[Callable[[Dict], None]] = None):
+    """
+    Run `sync` whenever a markdown file in `directories` changes, until
+    interrupted. Uses inotify when available and polls every `interval` otherwise.
+    """
+    directories = [d for d in directories if d.exists()]
+    try:
+        notifier = _Inotify(directories)
+    except (OSError, AttributeError) as e:
+        notifier = None
+        print(f"[Memory] inotify unavailable ({e}), polling every {interval}s")
+
+    try:
+        while True:
+            if notifier is None:
+                time.sleep(interval)
+            else:
+                names = notifier.wait()
+                if not any(n.endswith('.md') for n in names):
+                    continue
+                # Let editors finish writing, then drain the burst
+                time.sleep(debounce)
+                while notifier.wait(0):
+                    pass
+            stats = sync()
+            if on_sync is not None and (stats.get('changed') or stats.get('removed')):
+                on_sync(stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if notifier is not None:
+            notifier.close()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Atlas Memory Client
+Thin client for the resident memory service (memory_service.py).
+
+Standard library only: a lookup costs one interpreter start and a socket
+round trip, while numpy, openai and the database stay warm in the service.
+When no service is listening, commands run in-process through integration.py.
+
+Usage:
+    memory_client.py <command> [args...] [--json]
+
+From Python:
+    from memory_client import MemoryClient
+    with MemoryClient() as client:
+        client.call("fact_search", query="deploy", limit=5)
+"""
+
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SOCKET_PATH = Path(os.environ.get(
+    "ATLAS_MEMORY_SOCKET", Path(__file__).parent / "atlas_memory.sock"
+))
+CALL_TIMEOUT = 60.0
+
+# CLI command -> (service method, positional params as (name, type), required count)
+COMMANDS = {
+    "fact-add": ("fact_add", [("category", str), ("subject", str), ("content", str)], 3),
+    "fact-search": ("fact_search", [("query", str)], 1),
+    "fact-list": ("fact_list", [("category", str)], 0),
+    "fact-delete": ("fact_delete", [("fact_id", int)], 1),
+    "soul-set": ("soul_set", [("aspect", str), ("content", str)], 2),
+    "soul-get": ("soul_get", [("aspect", str)], 1),
+    "soul-list": ("soul_list", [], 0),
+    "soul-delete": ("soul_delete", [("aspect", str)], 1),
+    "msg-save": ("message_save", [("role", str), ("content", str)], 2),
+    "msg-search": ("message_search", [("query", str)], 1),
+    "recall": ("session_recall", [("session_id", str)], 0),
+    "context": ("get_relevant_context", [("query", str), ("token_budget", int)], 1),
+    "context-stats": ("context_cache_stats", [], 0),
+}
+
+
+class ServiceUnavailable(Exception):
+    """No memory service is listening on the socket."""
+
+
+class ServiceError(Exception):
+    """The service answered with a JSON-RPC error."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{message} ({code})")
+        self.code = code
+
+
+class MemoryClient:
+    """Persistent connection to the memory service."""
+
+    def __init__(self, socket_path: Path = SOCKET_PATH, timeout: float = CALL_TIMEOUT):
+        self.socket_path = Path(socket_path)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._next_id = 0
+
+    def connect(self):
+        """Open the socket (raises ServiceUnavailable if nothing listens)."""
+        if self._sock is not None:
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(str(self.socket_path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            sock.close()
+            raise ServiceUnavailable(f"No memory service at {self.socket_path}") from e
+        self._sock = sock
+        self._file = sock.makefile("rwb")
+
+    def call(self, method: str, **params) -> Any:
+        """Call `method` with keyword `params` and return its result."""
+        self.connect()
+        self._next_id += 1
+        request = {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params}
+        try:
+            self._file.write(json.dumps(request, default=str).encode("utf-8") + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        except OSError:
+            self.close()
+            raise
+        if not line:
+            self.close()
+            raise ServiceUnavailable("Memory service closed the connection")
+
+        response = json.loads(line)
+        if "error" in response:
+            error = response["error"]
+            raise ServiceError(error.get("code", -32000), error.get("message", "unknown error"))
+        return response.get("result")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def call(method: str, **params) -> Any:
+    """One-shot call to the memory service."""
+    with MemoryClient() as client:
+        return client.call(method, **params)
+
+
+def parse_command(command: str, args: List[str]) -> Optional[Dict[str, Any]]:
+    """Map CLI positional args to service params (None if too few)."""
+    _, spec, required = COMMANDS[command]
+    if len(args) < required:
+        return None
+    return {name: kind(value) for (name, kind), value in zip(spec, args)}
+
+
+def run_local(method: str, params: Dict[str, Any]) -> Any:
+    """Run a command in this process when no service is up."""
+    sys.path.insert(0, str(Path(__file__).parent))
+    import integration
+    return integration.dispatch(method, params)
+
+
+# ==================== CLI ====================
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Atlas Memory Client")
+    parser.add_argument("command", choices=list(COMMANDS))
+    parser.add_argument("args", nargs="*")
+    parser.add_argument("--json", action="store_true", help="Output as JSON")
+    parser.add_argument("--local", action="store_true",
+                        help="Run in-process even if the service is up")
+
+    args = parser.parse_args()
+
+    params = parse_command(args.command, args.args)
+    if params is None:
+        print("Invalid command or missing arguments")
+        parser.print_help()
+        return
+
+    method = COMMANDS[args.command][0]
+    if args.local:
+        result = run_local(method, params)
+    else:
+        try:
+            result = call(method, **params)
+        except ServiceUnavailable:
+            result = run_local(method, params)
+        except ServiceError as e:
+            result = {"success": False, "error": str(e)}
+
+    if args.json:
+        print(json.dumps(result, indent=2, default=str))
+    else:
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
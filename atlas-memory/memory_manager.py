@@ -17,25 +17,51 @@ import os
 import struct
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
 import openai
 
+import retrieval
+from archive import ARCHIVE_AFTER_DAYS, MessageArchive
+from chunked_embeddings import CHUNKED_SOURCES, has_chunks, max_sim_search, write_document
+from connections import SCHEMA_PATH, connect, schema_version
+from context_cache import write_generation
+from context_packer import count_tokens
+from graph_rank import GRAPH_BLEND, blend, graph_rank
+from summarizer import (
+    ROLLING_SUMMARY_TOKENS, RollingSummarizer, default_summarizer, ensure_summary_schema,
+)
+from ingest import embed_pending, ingest_facts
+from log_chunks import has_chunk_embeddings, search_log_chunks
+from markdown_sync import WATCH_INTERVAL, markdown_files, sync_markdown, watch
+from near_duplicates import (
+    DUPLICATE_THRESHOLD, dedupe, find_near_duplicates, index_fact, record_duplicates,
+    same_subject_duplicate, sync_signatures
+)
+from embeddings import EmbeddingCache, get_embeddings
+from embedding_providers import PROVIDERS, EmbeddingProvider, get_provider
+from embedding_store import (
+    VECTOR_SOURCES, compact_storage, delete_embeddings, embedding_model, ensure_storage_schema,
+    load_engine, matches_embedding_model, quantization_recall, storage_report,
+    switch_embedding_model, use_embedding_model
+)
+from vector_engine import VectorEngine, decode_vector, quantize
+from ann_index import (
+    ANN_SAVE_THRESHOLD, IVFIndex, index_path,
+    open_vector_index, rebuild_index, recall_at_k, save_index, sync_index
+)
+
 # Configuration
 DB_PATH = Path(__file__).parent / "atlas_memory.db"
-SCHEMA_PATH = Path(__file__).parent / "schema.sql"
 MEMORY_DIR = Path(__file__).parent.parent / "memory"
 MEMORY_MD = Path(__file__).parent.parent / "MEMORY.md"
 SOUL_MD = Path(__file__).parent.parent / "SOUL.md"
 
-EMBEDDING_MODEL = "text-embedding-3-small"
-EMBEDDING_DIMENSIONS = 1536
-CHARS_PER_TOKEN = 4
-
-# Vector search weights
-VECTOR_WEIGHT = 0.7
-KEYWORD_WEIGHT = 0.3
+# Vector hits below this similarity are not hybrid candidates
 MIN_SCORE_THRESHOLD = 0.35
 
+# Vector sources whose rows bump write_generation (schema.sql triggers)
+GENERATION_SOURCES = ('facts', 'messages', 'fact_chunks', 'message_chunks')
+
 
 def get_openai_client():
     """Get OpenAI client from environment."""
@@ -46,19 +72,23 @@ def get_openai_client():
 
 
 def estimate_tokens(text: str) -> int:
-    """Estimate token count from text."""
-    return len(text) // CHARS_PER_TOKEN
+    """Token count of text (BPE when tiktoken is installed, else estimated)."""
+    return count_tokens(text)
 
 
-def serialize_embedding(embedding: List[float]) -> bytes:
-    """Serialize embedding to bytes for SQLite storage."""
-    return struct.pack(f'{len(embedding)}f', *embedding)
+def serialize_embedding(embedding: List[float], dtype: str = 'float32') -> bytes:
+    """Serialize embedding to bytes for SQLite storage (float32, float16 or int8)."""
+    if dtype == 'float32':
+        return struct.pack(f'{len(embedding)}f', *embedding)
+    return quantize(embedding, dtype)[0].tobytes()
 
 
-def deserialize_embedding(data: bytes) -> List[float]:
-    """Deserialize embedding from bytes."""
-    count = len(data) // 4
-    return list(struct.unpack(f'{count}f', data))
+def deserialize_embedding(data: bytes, dtype: str = 'float32', scale: float = None) -> List[float]:
+    """Deserialize embedding from bytes stored in any supported dtype."""
+    if dtype in (None, 'float32'):
+        count = len(data) // 4
+        return list(struct.unpack(f'{count}f', data))
+    return decode_vector(data, dtype, scale).tolist()
 
 
 def cosine_similarity(a: List[float], b: List[float]) -> float:
@@ -74,18 +104,38 @@ def cosine_similarity(a: List[float], b: List[float]) -> float:
 class AtlasMemory:
     """Atlas Memory Manager with hybrid markdown + SQLite storage."""
     
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, check_same_thread: bool = True,
+                 auto_summarize: bool = True, provider: Optional[EmbeddingProvider] = None):
         self.db_path = db_path or str(DB_PATH)
-        self.conn = sqlite3.connect(self.db_path)
+        # Embedding provider (see embedding_providers.py); ATLAS_EMBEDDING_PROVIDER by default
+        self.provider = provider or get_provider()
+        # memory_service shares one instance across handler threads (under a lock)
+        self.conn = connect(self.db_path, check_same_thread=check_same_thread)
         self.conn.row_factory = sqlite3.Row
         self._init_schema()
         self._openai = None
+        self._vector_engines = {}
+        self._engine_generations = {}
+        self.embedding_cache = EmbeddingCache(self.conn)
+        self._background_embeds = []
+        self.auto_summarize = auto_summarize
+        self._summarizer = None
+        self._signatures_synced = False
+        # Cold tier of old messages (see archive.py)
+        self.archive = MessageArchive(self.conn, self.db_path)
     
     def _init_schema(self):
-        """Initialize database schema."""
+        """Initialize database schema (skipped when schema.sql is unchanged)."""
         with open(SCHEMA_PATH, 'r') as f:
             schema = f.read()
+        # user_version holds a checksum of the schema it was last built from
+        version = schema_version(schema)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] == version:
+            return
         self.conn.executescript(schema)
+        ensure_storage_schema(self.conn)
+        ensure_summary_schema(self.conn)
+        self.conn.execute(f"PRAGMA user_version = {version}")
         self.conn.commit()
     
     @property
@@ -96,29 +146,175 @@ class AtlasMemory:
         return self._openai
     
     def embed(self, text: str) -> List[float]:
-        """Generate embedding for text."""
-        response = self.openai.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=text,
-            dimensions=EMBEDDING_DIMENSIONS
-        )
-        return response.data[0].embedding
+        """Generate embedding for text (served from the cache when possible)."""
+        return self.embed_batch([text])[0]
     
     def embed_batch(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts."""
-        if not texts:
-            return []
-        response = self.openai.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=texts,
-            dimensions=EMBEDDING_DIMENSIONS
+        """Generate embeddings for multiple texts, fetching only cache misses."""
+        return get_embeddings(
+            texts,
+            cache=self.embedding_cache,
+            fetch=self._fetch_embeddings,
+            provider=self.provider
         )
-        return [d.embedding for d in response.data]
+    
+    def _embed_detached(self, text: str) -> List[float]:
+        """Embed on a private connection, safe to call from a worker thread."""
+        return get_embeddings(
+            [text],
+            fetch=self._fetch_embeddings,
+            db_path=self.db_path,
+            provider=self.provider
+        )[0]
+    
+    def _fetch_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts not in the cache with the provider."""
+        return self.provider(texts)
+    
+    # ==================== VECTOR ENGINES ====================
+    
+    def _vector_engine(self, name: str):
+        """
+        Get the resident vector index for 'facts' or 'messages'.
+        Opened on first use (exact matrix, or IVF index for large corpora)
+        and refreshed only when another connection has committed since
+        (PRAGMA data_version changes) and, for GENERATION_SOURCES, the
+        write generation moved with it.
+        """
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        cached = self._vector_engines.get(name)
+        if cached is not None and cached[0] == data_version:
+            return cached[1]
+        
+        # Other connections also commit embedding cache rows; sources with
+        # generation triggers only need a reload when the generation moved
+        generation = write_generation(self.conn) if name in GENERATION_SOURCES else None
+        if (cached is not None and generation is not None
+                and generation == self._engine_generations.get(name)):
+            self._vector_engines[name] = (data_version, cached[1])
+            return cached[1]
+        
+        if not matches_embedding_model(self.conn, self.provider.tag):
+            # Vectors of another model are not comparable with our queries
+            print(f"[Memory] {name} vectors are {embedding_model(self.conn)}, not "
+                  f"{self.provider.tag}; vector search disabled until `embeddings switch`")
+            engine = VectorEngine(self.provider.dimensions)
+        elif cached is not None and isinstance(cached[1], IVFIndex):
+            engine = cached[1]
+            sync_index(self.conn, engine, name)
+        else:
+            engine = open_vector_index(self.conn, self.db_path, name, self.provider.dimensions)
+        self._vector_engines[name] = (data_version, engine)
+        self._engine_generations[name] = generation
+        return engine
+    
+    def _persist_index(self, name: str, engine, threshold: int = ANN_SAVE_THRESHOLD):
+        """Save an IVF index once enough local changes have piled up."""
+        if isinstance(engine, IVFIndex) and engine.dirty >= threshold:
+            save_index(self.conn, engine, self.db_path, name)
+    
+    def rebuild_vector_index(self, name: str, nlist: int = None) -> IVFIndex:
+        """Retrain and save the IVF index for 'facts' or 'messages'."""
+        index = rebuild_index(self.conn, self.db_path, name, nlist, self.provider.dimensions)
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        self._vector_engines[name] = (data_version, index)
+        return index
+    
+    def switch_embedding_model(self, provider: Optional[EmbeddingProvider] = None) -> Dict:
+        """
+        Move the database to `provider`'s embedding space (default: our own):
+        drop every stored vector and saved index, then re-embed facts,
+        messages and archived messages (and log chunks if they were embedded).
+        """
+        provider = provider or self.provider
+        dropped = switch_embedding_model(self.conn, provider.tag)
+        for name in VECTOR_SOURCES:
+            index_path(self.db_path, name).unlink(missing_ok=True)
+        self.provider = provider
+        self._vector_engines.clear()
+        self._engine_generations.clear()
+        targets = ['facts', 'messages'] + (['log_chunks'] if dropped.get('log_chunks') else [])
+        return {
+            'model': provider.tag,
+            'dropped': dropped,
+            'embedded': embed_pending(self.db_path, fetch=self._fetch_embeddings,
+                                      provider=provider, targets=targets),
+            'archived': self.archive.reembed(self.embed_batch, provider.tag),
+        }
+    
+    def check_vector_index(self, name: str, k: int = 10, queries: int = 200) -> Dict:
+        """Measure recall@k of the saved IVF index against exact search."""
+        path = index_path(self.db_path, name)
+        if not path.exists():
+            return {'index': name, 'error': 'no index built'}
+        index = IVFIndex.load(path)
+        exact = load_engine(self.conn, name, self.provider.dimensions, dtype='float32')
+        return {
+            'index': name,
+            'vectors': len(index),
+            'nlist': index.nlist,
+            'nprobe': index.nprobe,
+            f'recall@{k}': recall_at_k(index, exact, k, queries),
+        }
+    
+    @property
+    def fact_vectors(self):
+        """Resident vector index over fact embeddings."""
+        return self._vector_engine('facts')
+    
+    @property
+    def message_vectors(self):
+        """Resident vector index over message embeddings."""
+        return self._vector_engine('messages')
+    
+    def _engine_upsert(self, name: str, item_id: int, embedding: List[float]):
+        """Apply a local write to a loaded engine without reloading it."""
+        cached = self._vector_engines.get(name)
+        if cached is not None:
+            cached[1].upsert(item_id, embedding)
+            self._engine_synced(name, cached[0])
+    
+    def _engine_remove(self, name: str, item_id: int):
+        """Apply a local delete to a loaded engine without reloading it."""
+        cached = self._vector_engines.get(name)
+        if cached is not None:
+            cached[1].remove(item_id)
+            self._engine_synced(name, cached[0])
+    
+    def _engine_synced(self, name: str, data_version: int):
+        """Adopt the generation of our own write if no other connection wrote meanwhile."""
+        if name not in GENERATION_SOURCES:
+            return
+        if self.conn.execute("PRAGMA data_version").fetchone()[0] == data_version:
+            self._engine_generations[name] = write_generation(self.conn)
+    
+    def _store_document(self, name: str, item_id: int, text: str):
+        """Embed and store a fact or message of any length (see chunked_embeddings.py)."""
+        use_embedding_model(self.conn, self.provider.tag)
+        embedding, chunks = write_document(self.conn, name, item_id, text, self.embed_batch)
+        self.conn.commit()
+        self._engine_upsert(name, item_id, embedding)
+        for chunk_id, chunk_embedding in chunks:
+            self._engine_upsert(CHUNKED_SOURCES[name][2], chunk_id, chunk_embedding)
+    
+    def _max_sim_search(self, name: str, embedding: List[float], k: int,
+                        min_score: float, candidates: List[int] = None) -> List[Tuple[int, float]]:
+        """Vector search over items and the chunks of long items, best match per item."""
+        chunk_engine = None
+        if has_chunks(self.conn, name):
+            chunk_engine = self._vector_engine(CHUNKED_SOURCES[name][2])
+        return max_sim_search(self.conn, name, self._vector_engine(name), chunk_engine,
+                              embedding, k=k, min_score=min_score, candidates=candidates)
     
     # ==================== FACT METHODS ====================
     
     def save_fact(self, category: str, subject: str, content: str, source: str = "manual") -> int:
-        """Save or update a fact."""
+        """
+        Save or update a fact. A near-duplicate of a stored fact in the same
+        category (see near_duplicates.py) updates that fact when their subjects
+        match up to case and spacing; otherwise it is added and the pair is
+        recorded for `fact dedupe`.
+        """
         cursor = self.conn.cursor()
         
         # Check if fact exists
@@ -127,21 +323,33 @@ class AtlasMemory:
             (category, subject)
         )
         existing = cursor.fetchone()
+        fact_id = existing['id'] if existing else None
+        duplicates = []
+        if fact_id is None:
+            if not self._signatures_synced:
+                # Index facts other tools wrote since the last sync, once per instance
+                sync_signatures(self.conn)
+                self._signatures_synced = True
+            duplicates = find_near_duplicates(self.conn, content, category=category)
+            fact_id = same_subject_duplicate(self.conn, subject, duplicates)
         
-        if existing:
+        if fact_id is not None:
             cursor.execute(
                 """UPDATE facts SET content = ?, source = ?, 
                    updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now') 
                    WHERE id = ?""",
-                (content, source, existing['id'])
+                (content, source, fact_id)
             )
-            fact_id = existing['id']
         else:
             cursor.execute(
                 "INSERT INTO facts (category, subject, content, source) VALUES (?, ?, ?, ?)",
                 (category, subject, content, source)
             )
             fact_id = cursor.lastrowid
+            if duplicates:
+                # Different subjects may be different facts; leave the merge to dedupe
+                record_duplicates(self.conn, fact_id, duplicates)
+        index_fact(self.conn, fact_id, content)
         
         self.conn.commit()
         
@@ -153,20 +361,37 @@ class AtlasMemory:
     def _embed_fact(self, fact_id: int, category: str, subject: str, content: str):
         """Generate and store embedding for a fact."""
         try:
-            text = f"{category}: {subject} - {content}"
-            embedding = self.embed(text)
-            embedding_bytes = serialize_embedding(embedding)
-            
-            cursor = self.conn.cursor()
-            cursor.execute(
-                """INSERT OR REPLACE INTO fact_embeddings (fact_id, embedding) 
-                   VALUES (?, ?)""",
-                (fact_id, embedding_bytes)
-            )
-            self.conn.commit()
+            self._store_document('facts', fact_id, f"{category}: {subject} - {content}")
         except Exception as e:
             print(f"[Memory] Failed to embed fact {fact_id}: {e}")
     
+    def ingest_facts(self, facts: Iterable, source: str = "manual", key: str = "subject",
+                     embed: bool = True, background: bool = False) -> Dict:
+        """
+        Bulk upsert facts in one transaction (see ingest.py), then embed
+        everything missing in batches (inline, or on a background thread).
+        """
+        stats = ingest_facts(self.conn, facts, default_source=source, key=key)
+        if embed:
+            result = embed_pending(self.db_path, fetch=self._fetch_embeddings,
+                                   provider=self.provider, background=background)
+            if background:
+                self._background_embeds.append(result)
+                stats['embedding'] = 'background'
+            else:
+                stats['embedding'] = result
+        return stats
+    
+    def dedupe_facts(self, threshold: float = DUPLICATE_THRESHOLD, dry_run: bool = False) -> Dict:
+        """Merge clusters of near-duplicate facts into one fact each (see near_duplicates.py)."""
+        result = dedupe(self.conn, threshold, dry_run)
+        if result['removed'] and not dry_run:
+            # Survivors may have adopted a duplicate's vector; reload on next use
+            for name in ('facts', 'fact_chunks'):
+                self._vector_engines.pop(name, None)
+                self._engine_generations.pop(name, None)
+        return result
+    
     def get_all_facts(self) -> List[Dict]:
         """Get all facts."""
         cursor = self.conn.cursor()
@@ -179,13 +404,23 @@ class AtlasMemory:
         """Delete a fact by ID."""
         cursor = self.conn.cursor()
         cursor.execute("DELETE FROM facts WHERE id = ?", (fact_id,))
+        deleted = cursor.rowcount > 0
+        delete_embeddings(self.conn, 'facts', [fact_id])
         self.conn.commit()
-        return cursor.rowcount > 0
+        self._engine_remove('facts', fact_id)
+        return deleted
     
-    def search_facts_hybrid(self, query: str, limit: int = 10) -> List[Dict]:
-        """Hybrid semantic + keyword search for facts."""
-        results = {}
-        
+    def search_facts_hybrid(self, query: str, limit: int = 10,
+                            fusion: str = retrieval.DEFAULT_FUSION,
+                            embed: Optional[Callable[[str], List[float]]] = None,
+                            graph: Optional[bool] = None) -> List[Dict]:
+        """
+        Hybrid semantic + keyword search for facts (see retrieval.py).
+        `embed` replaces the query embedding call (it runs in a worker thread).
+        With `graph` (default: GRAPH_BLEND, off) the candidates are re-ranked
+        by link-graph centrality and links to the best hits, once a snapshot
+        of memory_links is cached (see graph_rank.py).
+        """
         # Handle empty query
         if not query or not query.strip():
             cursor = self.conn.cursor()
@@ -196,82 +431,59 @@ class AtlasMemory:
             return [{'id': r['id'], 'category': r['category'], 'subject': r['subject'], 
                      'content': r['content'], 'combined_score': 0.0} for r in cursor.fetchall()]
         
-        # Keyword search using FTS5
-        cursor = self.conn.cursor()
+        use_graph = GRAPH_BLEND if graph is None else graph
+        rank = graph_rank(self.conn, self.db_path) if use_graph else None
+        hits = retrieval.hybrid_search(
+            self.conn, query, limit * 2 if rank else limit,
+            embed=embed or self._embed_detached,
+            vector_search=lambda embedding, k: self._max_sim_search(
+                'facts', embedding, k, MIN_SCORE_THRESHOLD
+            ),
+            fusion=fusion,
+            min_vector_score=MIN_SCORE_THRESHOLD
+        )
+        if rank:
+            hits = blend(hits, rank, limit)
+        if not hits:
+            return []
         
-        # Escape special FTS5 characters and wrap in quotes for phrase search
-        safe_query = query.replace('"', '""')
-        try:
-            cursor.execute(
-                """SELECT f.id, f.category, f.subject, f.content, 
-                          bm25(facts_fts) as keyword_score
-                   FROM facts_fts 
-                   JOIN facts f ON facts_fts.rowid = f.id
-                   WHERE facts_fts MATCH ?
-                   LIMIT ?""",
-                (f'"{safe_query}"', limit * 2)
-            )
-        except Exception:
-            # If FTS fails, fall back to LIKE search
-            cursor.execute(
-                """SELECT f.id, f.category, f.subject, f.content, 0.5 as keyword_score
-                   FROM facts f
-                   WHERE f.content LIKE ? OR f.subject LIKE ? OR f.category LIKE ?
-                   LIMIT ?""",
-                (f'%{query}%', f'%{query}%', f'%{query}%', limit * 2)
+        placeholders = ','.join('?' * len(hits))
+        rows = {
+            r['id']: r for r in self.conn.execute(
+                f"SELECT id, category, subject, content FROM facts WHERE id IN ({placeholders})",
+                [h['id'] for h in hits]
             )
-        for row in cursor.fetchall():
-            results[row['id']] = {
+        }
+        results = []
+        for hit in hits:
+            row = rows.get(hit['id'])
+            if row is None:
+                continue
+            results.append({
                 'id': row['id'],
                 'category': row['category'],
                 'subject': row['subject'],
                 'content': row['content'],
-                'keyword_score': abs(row['keyword_score']),  # BM25 returns negative
-                'vector_score': 0.0
-            }
-        
-        # Vector search
-        try:
-            query_embedding = self.embed(query)
-            
-            cursor.execute(
-                """SELECT fe.fact_id, fe.embedding, f.category, f.subject, f.content
-                   FROM fact_embeddings fe
-                   JOIN facts f ON fe.fact_id = f.id"""
-            )
-            
-            for row in cursor.fetchall():
-                fact_embedding = deserialize_embedding(row['embedding'])
-                similarity = cosine_similarity(query_embedding, fact_embedding)
-                
-                if row['fact_id'] in results:
-                    results[row['fact_id']]['vector_score'] = similarity
-                elif similarity > MIN_SCORE_THRESHOLD:
-                    results[row['fact_id']] = {
-                        'id': row['fact_id'],
-                        'category': row['category'],
-                        'subject': row['subject'],
-                        'content': row['content'],
-                        'keyword_score': 0.0,
-                        'vector_score': similarity
-                    }
-        except Exception as e:
-            print(f"[Memory] Vector search failed: {e}")
-        
-        # Combine scores and sort
-        for r in results.values():
-            r['combined_score'] = (
-                VECTOR_WEIGHT * r['vector_score'] + 
-                KEYWORD_WEIGHT * r['keyword_score']
+                'keyword_score': hit['keyword_score'],
+                'vector_score': hit['vector_score'],
+                'graph_score': hit.get('graph_score', 0.0),
+                'combined_score': hit['combined_score']
+            })
+        return results
+    
+    def central_facts(self, limit: int = 10) -> List[Dict]:
+        """The most central facts of the link graph (PageRank, weighted degree, community)."""
+        rank = graph_rank(self.conn, self.db_path, wait=True)
+        if rank is None:
+            return []
+        top = rank.top(limit)
+        subjects = {
+            r['id']: r['subject'] for r in self.conn.execute(
+                f"SELECT id, subject FROM facts WHERE id IN ({','.join('?' * len(top))})",
+                [t['id'] for t in top]
             )
-        
-        sorted_results = sorted(
-            results.values(), 
-            key=lambda x: x['combined_score'], 
-            reverse=True
-        )
-        
-        return sorted_results[:limit]
+        } if top else {}
+        return [dict(t, subject=subjects[t['id']]) for t in top if t['id'] in subjects]
     
     # ==================== SOUL METHODS ====================
     
@@ -336,7 +548,10 @@ class AtlasMemory:
             (role, content, session_id, token_count)
         )
         self.conn.commit()
-        return cursor.lastrowid
+        message_id = cursor.lastrowid
+        if self.auto_summarize:
+            self.summarizer.maybe_update(session_id)
+        return message_id
     
     def embed_message(self, message_id: int):
         """Generate and store embedding for a message."""
@@ -347,99 +562,155 @@ class AtlasMemory:
             return
         
         try:
-            embedding = self.embed(row['content'])
-            embedding_bytes = serialize_embedding(embedding)
-            cursor.execute(
-                """INSERT OR REPLACE INTO message_embeddings (message_id, embedding)
-                   VALUES (?, ?)""",
-                (message_id, embedding_bytes)
-            )
-            self.conn.commit()
+            self._store_document('messages', message_id, row['content'])
         except Exception as e:
             print(f"[Memory] Failed to embed message {message_id}: {e}")
     
-    def search_messages(self, query: str, session_id: str = None, limit: int = 10) -> List[Dict]:
-        """Semantic search over past messages."""
+    def search_messages(self, query: str, session_id: str = None, limit: int = 10,
+                        embed: Optional[Callable[[str], List[float]]] = None) -> List[Dict]:
+        """
+        Semantic search over past messages: the live table plus the archived
+        segments that could still beat its hits (see archive.py).
+        `embed` replaces the query embedding call.
+        """
         try:
-            query_embedding = self.embed(query)
+            query_embedding = (embed or self.embed)(query)
         except Exception as e:
             print(f"[Memory] Failed to embed query: {e}")
             return []
         
         cursor = self.conn.cursor()
         
+        candidates = None
         if session_id:
+            cursor.execute("SELECT id FROM messages WHERE session_id = ?", (session_id,))
+            candidates = [row['id'] for row in cursor.fetchall()]
+        
+        hits = self._max_sim_search(
+            'messages',
+            query_embedding,
+            k=limit,
+            min_score=MIN_SCORE_THRESHOLD,
+            candidates=candidates
+        )
+        hits = [(message_id, s) for message_id, s in hits if s > MIN_SCORE_THRESHOLD]
+        
+        rows = {}
+        if hits:
+            placeholders = ','.join('?' * len(hits))
             cursor.execute(
-                """SELECT me.message_id, me.embedding, m.role, m.content, m.timestamp
-                   FROM message_embeddings me
-                   JOIN messages m ON me.message_id = m.id
-                   WHERE m.session_id = ?
-                   ORDER BY m.id DESC LIMIT 500""",
-                (session_id,)
-            )
-        else:
-            cursor.execute(
-                """SELECT me.message_id, me.embedding, m.role, m.content, m.timestamp
-                   FROM message_embeddings me
-                   JOIN messages m ON me.message_id = m.id
-                   ORDER BY m.id DESC LIMIT 500"""
+                f"SELECT id, role, content, timestamp FROM messages WHERE id IN ({placeholders})",
+                [message_id for message_id, _ in hits]
             )
+            rows = {row['id']: row for row in cursor.fetchall()}
         
         results = []
-        for row in cursor.fetchall():
-            msg_embedding = deserialize_embedding(row['embedding'])
-            similarity = cosine_similarity(query_embedding, msg_embedding)
-            if similarity > MIN_SCORE_THRESHOLD:
-                results.append({
-                    'id': row['message_id'],
-                    'role': row['role'],
-                    'content': row['content'],
-                    'timestamp': row['timestamp'],
-                    'similarity': similarity
-                })
+        for message_id, similarity in hits:
+            row = rows.get(message_id)
+            if row is None:
+                continue
+            results.append({
+                'id': message_id,
+                'role': row['role'],
+                'content': row['content'],
+                'timestamp': row['timestamp'],
+                'similarity': similarity,
+                'archived': False
+            })
         
-        results.sort(key=lambda x: x['similarity'], reverse=True)
-        return results[:limit]
+        # Only segments whose score bound beats the k-th live hit are opened
+        floor = results[-1]['similarity'] if len(results) >= limit else -1.0
+        cold = self.archive.search(
+            query_embedding, k=limit, min_score=MIN_SCORE_THRESHOLD,
+            session_id=session_id, floor=floor, model=self.provider.tag
+        )
+        if cold:
+            seen = {r['id'] for r in results}
+            results.extend(
+                {'id': r['id'], 'role': r['role'], 'content': r['content'],
+                 'timestamp': r['timestamp'], 'similarity': r['similarity'], 'archived': True}
+                for r in cold if r['id'] not in seen
+            )
+            results.sort(key=lambda r: r['similarity'], reverse=True)
+            results = results[:limit]
+        return results
+    
+    def archive_messages(self, older_than_days: int = ARCHIVE_AFTER_DAYS) -> Dict:
+        """Move summarised messages older than `older_than_days` to monthly archive segments."""
+        stats = self.archive.archive(older_than_days, embed_batch=self.embed_batch,
+                                     model=self.provider.tag)
+        if stats['archived']:
+            # Archived rows left the live tables; reload the message indexes on next use
+            for name in ('messages', 'message_chunks'):
+                self._vector_engines.pop(name, None)
+                self._engine_generations.pop(name, None)
+        return stats
     
     # ==================== SUMMARY METHODS ====================
     
-    def get_rolling_summary(self, session_id: str = "main") -> Optional[str]:
-        """Get the most recent rolling summary for a session."""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """SELECT content FROM summaries 
-               WHERE session_id = ? 
-               ORDER BY end_message_id DESC LIMIT 1""",
-            (session_id,)
-        )
-        row = cursor.fetchone()
-        return row['content'] if row else None
+    @property
+    def summarizer(self) -> RollingSummarizer:
+        """Rolling summary engine (see summarizer.py)."""
+        if self._summarizer is None:
+            self._summarizer = RollingSummarizer(
+                self.conn, default_summarizer(get_openai_client)
+            )
+        return self._summarizer
+    
+    def update_summaries(self, session_id: str = "main") -> Dict[str, int]:
+        """Summarise all messages not yet covered by a summary."""
+        return self.summarizer.update(session_id)
+    
+    def get_rolling_summary(self, session_id: str = "main",
+                            token_budget: int = ROLLING_SUMMARY_TOKENS) -> Optional[str]:
+        """
+        Get the rolling summary for a session: its newest open summaries that
+        fit in `token_budget`, oldest first.
+        """
+        kept = []
+        used = 0
+        for summary in reversed(self.summarizer.frontier(session_id)):
+            tokens = count_tokens(summary['content'])
+            if kept and used + tokens > token_budget:
+                break
+            kept.append(summary['content'])
+            used += tokens
+        if not kept:
+            return None
+        return "\n\n".join(reversed(kept))
     
-    def save_summary(self, session_id: str, start_id: int, end_id: int, content: str) -> int:
+    def recall_session(self, session_id: str = "main") -> Dict:
+        """Summaries covering a session plus its unsummarised recent messages."""
+        return self.summarizer.recall(session_id)
+    
+    def save_summary(self, session_id: str, start_id: int, end_id: int, content: str,
+                     level: int = 0) -> int:
         """Save a rolling summary."""
         token_count = estimate_tokens(content)
         cursor = self.conn.cursor()
         cursor.execute(
-            """INSERT INTO summaries (session_id, start_message_id, end_message_id, content, token_count)
-               VALUES (?, ?, ?, ?, ?)""",
-            (session_id, start_id, end_id, content, token_count)
+            """INSERT INTO summaries (session_id, start_message_id, end_message_id, content,
+                                      token_count, level)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (session_id, start_id, end_id, content, token_count, level)
         )
         self.conn.commit()
         return cursor.lastrowid
     
     # ==================== MIGRATION METHODS ====================
     
-    def migrate_memory_md(self):
-        """Migrate MEMORY.md content to facts table."""
+    def migrate_memory_md(self) -> Optional[Dict]:
+        """Migrate MEMORY.md content to facts table (one bulk transaction)."""
         if not MEMORY_MD.exists():
             print("[Memory] MEMORY.md not found, skipping migration")
-            return
+            return None
         
         content = MEMORY_MD.read_text()
         
         # Parse markdown sections as facts
         current_category = "general"
         current_subject = ""
+        facts = []
         
         for line in content.split('\n'):
             line = line.strip()
@@ -454,14 +725,18 @@ class AtlasMemory:
                 if len(parts) == 2:
                     subject = parts[0].strip()
                     fact_content = parts[1].strip()
-                    self.save_fact(current_category, subject, fact_content, "migration")
+                    facts.append((current_category, subject, fact_content))
             elif line.startswith('- ') and len(line) > 2:
                 # Format: - Content
                 fact_content = line[2:].strip()
                 if fact_content:
-                    self.save_fact(current_category, current_subject, fact_content, "migration")
+                    facts.append((current_category, current_subject, fact_content))
         
-        print(f"[Memory] Migrated MEMORY.md to facts table")
+        stats = self.ingest_facts(facts, source="migration")
+        print(f"[Memory] Migrated MEMORY.md to facts table: {stats['inserted']} new, "
+              f"{stats['updated']} updated, {stats['near_duplicates']} near-duplicates, "
+              f"{stats['flagged_duplicates']} flagged for dedupe ({stats['rows_per_second']} facts/s)")
+        return stats
     
     def migrate_soul_md(self):
         """Migrate SOUL.md to soul aspects."""
@@ -499,32 +774,54 @@ class AtlasMemory:
         
         print(f"[Memory] Migrated SOUL.md to soul aspects")
     
-    def sync_daily_logs(self):
-        """Sync daily log markdown files to database."""
+    def sync_daily_logs(self) -> Optional[Dict]:
+        """Sync changed daily log markdown files to the database (see markdown_sync.py)."""
         if not MEMORY_DIR.exists():
             print("[Memory] Memory directory not found")
-            return
+            return None
         
-        cursor = self.conn.cursor()
-        
-        for md_file in MEMORY_DIR.glob("*.md"):
-            if md_file.name.startswith("20"):  # Date-formatted files
-                date = md_file.stem
-                content = md_file.read_text()
-                
-                cursor.execute(
-                    """INSERT INTO daily_logs (date, file_path, content) VALUES (?, ?, ?)
-                       ON CONFLICT(date) DO UPDATE SET 
-                       content = excluded.content,
-                       updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')""",
-                    (date, str(md_file), content)
-                )
-        
-        self.conn.commit()
-        print(f"[Memory] Synced daily logs to database")
+        stats = sync_markdown(self.conn, markdown_files(MEMORY_DIR, daily_only=True))
+        for fact_id in stats['removed_fact_ids']:
+            self._engine_remove('facts', fact_id)
+        print(f"[Memory] Synced daily logs: {stats['changed']} changed, {stats['unchanged']} unchanged, "
+              f"{stats['removed']} removed, {stats['facts_added']} facts added, "
+              f"{stats['facts_removed']} removed ({stats['seconds'] * 1000:.1f} ms)")
+        return stats
+    
+    def watch_daily_logs(self, interval: float = WATCH_INTERVAL):
+        """Re-sync daily logs whenever memory/*.md changes (until interrupted)."""
+        self.sync_daily_logs()
+        watch(
+            lambda: sync_markdown(self.conn, markdown_files(MEMORY_DIR, daily_only=True)),
+            [MEMORY_DIR],
+            interval=interval,
+            on_sync=lambda stats: print(
+                f"[Memory] Re-synced {stats['changed']} changed / {stats['removed']} removed logs "
+                f"({stats['seconds'] * 1000:.1f} ms)"
+            )
+        )
+    
+    def search_daily_logs(self, query: str, limit: int = 5) -> List[Dict]:
+        """Search daily log chunks (FTS5, plus vectors once chunks are embedded)."""
+        embed = vector_search = None
+        if has_chunk_embeddings(self.conn):
+            embed = self._embed_detached
+            vector_search = lambda embedding, k: self._vector_engine('log_chunks').search(
+                embedding, k=k, min_score=MIN_SCORE_THRESHOLD
+            )
+        return search_log_chunks(
+            self.conn, query, limit, embed=embed, vector_search=vector_search,
+            min_vector_score=MIN_SCORE_THRESHOLD
+        )
     
     def close(self):
-        """Close database connection."""
+        """Wait for deferred embedding, persist pending index changes and close."""
+        for thread in self._background_embeds:
+            thread.join()
+        for name, (_, engine) in self._vector_engines.items():
+            self._persist_index(name, engine)
+        if self.embedding_cache.flush():
+            self.conn.commit()
         self.conn.close()
 
 
@@ -555,6 +852,17 @@ def main():
     
     fact_search = fact_sub.add_parser("search", help="Search facts")
     fact_search.add_argument("query")
+    fact_search.add_argument("--fusion", choices=retrieval.FUSIONS, default=retrieval.DEFAULT_FUSION)
+    fact_search.add_argument("--graph", action="store_true", default=None,
+                             help="Re-rank with link-graph centrality and links")
+    
+    fact_central = fact_sub.add_parser("central", help="Most central facts in the link graph")
+    fact_central.add_argument("--limit", type=int, default=10)
+    
+    fact_dedupe = fact_sub.add_parser("dedupe", help="Merge near-duplicate facts")
+    fact_dedupe.add_argument("--threshold", type=float, default=DUPLICATE_THRESHOLD,
+                             help="Estimated Jaccard similarity of duplicates")
+    fact_dedupe.add_argument("--dry-run", action="store_true", help="Only list the clusters")
     
     # Soul commands
     soul_parser = subparsers.add_parser("soul", help="Soul operations")
@@ -569,10 +877,69 @@ def main():
     
     soul_list = soul_sub.add_parser("list", help="List all soul aspects")
     
+    # Index commands
+    index_parser = subparsers.add_parser("index", help="Vector index operations")
+    index_sub = index_parser.add_subparsers(dest="index_cmd")
+    
+    index_rebuild = index_sub.add_parser("rebuild", help="Rebuild the ANN index")
+    index_rebuild.add_argument("name", nargs="?", choices=["facts", "messages"])
+    index_rebuild.add_argument("--nlist", type=int)
+    
+    index_check = index_sub.add_parser("check", help="Measure ANN recall@k against exact search")
+    index_check.add_argument("name", nargs="?", choices=["facts", "messages"])
+    index_check.add_argument("--k", type=int, default=10)
+    index_check.add_argument("--queries", type=int, default=200)
+    
+    # Embedding storage commands
+    emb_parser = subparsers.add_parser("embeddings", help="Embedding storage operations")
+    emb_sub = emb_parser.add_subparsers(dest="emb_cmd")
+    emb_compact = emb_sub.add_parser("compact", help="Rewrite stored embeddings in a storage dtype")
+    emb_compact.add_argument("--dtype", choices=["int8", "float16", "float32"], default="int8")
+    emb_check = emb_sub.add_parser("check", help="Measure compact-mode recall@k against float32")
+    emb_check.add_argument("name", nargs="?", choices=["facts", "messages"], default="facts")
+    emb_check.add_argument("--k", type=int, default=10)
+    emb_sub.add_parser("report", help="Show embedding storage sizes")
+    emb_switch = emb_sub.add_parser("switch", help="Re-embed everything with another provider")
+    emb_switch.add_argument("--provider", choices=list(PROVIDERS),
+                            help="Provider to switch to (default: ATLAS_EMBEDDING_PROVIDER)")
+    
+    # Cache commands
+    cache_parser = subparsers.add_parser("cache", help="Embedding cache operations")
+    cache_sub = cache_parser.add_subparsers(dest="cache_cmd")
+    cache_sub.add_parser("stats", help="Show hit/miss counters")
+    cache_sub.add_parser("clear", help="Empty the embedding cache")
+    
     # Search command
     search_parser = subparsers.add_parser("search", help="Search messages")
     search_parser.add_argument("query")
     
+    # Archive commands
+    archive_parser = subparsers.add_parser("archive", help="Message archive operations")
+    archive_sub = archive_parser.add_subparsers(dest="archive_cmd")
+    archive_run = archive_sub.add_parser("run", help="Move old summarised messages to monthly segments")
+    archive_run.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                             help="Archive messages older than this many days")
+    archive_sub.add_parser("list", help="List archived segments")
+    
+    # Summary commands
+    summary_parser = subparsers.add_parser("summaries", help="Rolling summary operations")
+    summary_sub = summary_parser.add_subparsers(dest="summary_cmd")
+    summary_update = summary_sub.add_parser("update", help="Summarise unsummarised messages")
+    summary_update.add_argument("--session", default="main")
+    summary_show = summary_sub.add_parser("show", help="Show a session's open summaries")
+    summary_show.add_argument("--session", default="main")
+    
+    # Daily log commands
+    logs_parser = subparsers.add_parser("logs", help="Daily log operations")
+    logs_sub = logs_parser.add_subparsers(dest="logs_cmd")
+    logs_sync = logs_sub.add_parser("sync", help="Sync changed memory/*.md into the database")
+    logs_sync.add_argument("--watch", action="store_true", help="Keep syncing on file changes")
+    logs_sync.add_argument("--interval", type=float, default=WATCH_INTERVAL,
+                           help="Poll interval when inotify is unavailable")
+    logs_search = logs_sub.add_parser("search", help="Search daily log chunks")
+    logs_search.add_argument("query")
+    logs_search.add_argument("--limit", type=int, default=5)
+    
     args = parser.parse_args()
     
     memory = AtlasMemory()
@@ -595,9 +962,15 @@ def main():
             for f in facts:
                 print(f"[{f['category']}] {f['subject']}: {f['content']}")
         elif args.fact_cmd == "search":
-            results = memory.search_facts_hybrid(args.query)
+            results = memory.search_facts_hybrid(args.query, fusion=args.fusion, graph=args.graph)
             for r in results:
-                print(f"[{r['combined_score']:.2f}] [{r['category']}] {r['subject']}: {r['content']}")
+                print(f"[{r['combined_score']:.4f}] [{r['category']}] {r['subject']}: {r['content']}")
+        elif args.fact_cmd == "central":
+            for f in memory.central_facts(args.limit):
+                print(f"[{f['pagerank']:.4f}] (degree {f['weighted_degree']:.2f}, "
+                      f"community {f['community']}) {f['subject']}")
+        elif args.fact_cmd == "dedupe":
+            print(json.dumps(memory.dedupe_facts(args.threshold, args.dry_run), indent=2))
     
     elif args.command == "soul":
         if args.soul_cmd == "set":
@@ -614,11 +987,67 @@ def main():
             for a in aspects:
                 print(f"- {a['aspect']}: {a['content'][:100]}...")
     
+    elif args.command == "index":
+        names = [args.name] if args.name else ["facts", "messages"]
+        for name in names:
+            if args.index_cmd == "rebuild":
+                index = memory.rebuild_vector_index(name, args.nlist)
+                print(f"Rebuilt {name} index: {len(index)} vectors in {index.nlist} lists")
+            elif args.index_cmd == "check":
+                print(json.dumps(memory.check_vector_index(name, args.k, args.queries)))
+    
+    elif args.command == "embeddings":
+        if args.emb_cmd == "compact":
+            counts = compact_storage(memory.conn, args.dtype)
+            print(f"Rewrote embeddings as {args.dtype}: {counts} (run VACUUM to reclaim space)")
+        elif args.emb_cmd == "check":
+            print(json.dumps(quantization_recall(memory.conn, args.name, args.k,
+                                                 dimensions=memory.provider.dimensions)))
+        elif args.emb_cmd == "report":
+            print(json.dumps(storage_report(memory.conn), indent=2))
+        elif args.emb_cmd == "switch":
+            result = memory.switch_embedding_model(get_provider(args.provider))
+            print(json.dumps(result, indent=2, default=str))
+    
+    elif args.command == "cache":
+        if args.cache_cmd == "stats":
+            print(json.dumps(memory.embedding_cache.stats(), indent=2))
+        elif args.cache_cmd == "clear":
+            memory.embedding_cache.clear()
+            memory.conn.commit()
+            print("Embedding cache cleared")
+    
     elif args.command == "search":
         results = memory.search_messages(args.query)
         for r in results:
             print(f"[{r['similarity']:.2f}] [{r['role']}] {r['content'][:100]}...")
     
+    elif args.command == "archive":
+        if args.archive_cmd == "run":
+            print(json.dumps(memory.archive_messages(args.days), indent=2))
+        elif args.archive_cmd == "list":
+            for s in memory.archive.segments():
+                print(f"{s['month']}: {s['message_count']} messages, {s['bytes'] / 1024:.1f} KB "
+                      f"({s['first_timestamp'][:10]} .. {s['last_timestamp'][:10]})")
+    
+    elif args.command == "summaries":
+        if args.summary_cmd == "update":
+            print(json.dumps(memory.update_summaries(args.session)))
+        elif args.summary_cmd == "show":
+            for s in memory.summarizer.frontier(args.session):
+                print(f"[L{s['level']} #{s['start_message_id']}-{s['end_message_id']}] {s['content']}")
+    
+    elif args.command == "logs":
+        if args.logs_cmd == "sync":
+            if args.watch:
+                memory.watch_daily_logs(args.interval)
+            else:
+                memory.sync_daily_logs()
+        elif args.logs_cmd == "search":
+            for r in memory.search_daily_logs(args.query, args.limit):
+                heading = f" / {r['heading']}" if r['heading'] else ""
+                print(f"[{r['score']:.4f}] {r['date']}{heading}: {r['snippet']}")
+    
     memory.close()
 
 
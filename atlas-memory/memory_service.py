@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Atlas Memory Service
+Resident process serving integration.py over line-delimited JSON-RPC.
+
+One AtlasMemory is opened at startup and kept for the life of the process:
+the SQLite connection (and its statement cache), the embedding cache, the
+fact/message vector matrices and the embedding provider all stay warm, so a
+lookup is a socket round trip instead of a full open/schema/close cycle.
+
+Usage:
+    python3 memory_service.py                  # listen on atlas_memory.sock
+    python3 memory_service.py --socket PATH
+    python3 memory_service.py --stdio          # serve one client on stdin/stdout
+
+Protocol (one JSON object per line):
+    -> {"jsonrpc": "2.0", "id": 1, "method": "fact_search", "params": {"query": "..."}}
+    <- {"jsonrpc": "2.0", "id": 1, "result": {"success": true, "results": [...]}}
+"""
+
+import inspect
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import connections
+import integration
+from memory_client import SOCKET_PATH
+from memory_manager import AtlasMemory
+
+DB_PATH = Path(__file__).parent / "atlas_memory.db"
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+class RequestError(Exception):
+    """A request the service refuses, answered with its JSON-RPC error code."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class MemoryService:
+    """One warm AtlasMemory behind a request lock."""
+
+    def __init__(self, db_path: Path = DB_PATH):
+        self.memory = AtlasMemory(str(db_path), check_same_thread=False)
+        # SQLite connections are not safe for concurrent use; requests run one at a time
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        integration.set_resident_memory(self.memory)
+
+    def warm(self):
+        """Load the vector matrices and embedding provider before the first request."""
+        with self.lock:
+            self.memory.fact_vectors
+            self.memory.message_vectors
+            try:
+                self.memory.provider.warm()
+            except ValueError as e:
+                print(f"[Memory] Service starting without embeddings: {e}", file=sys.stderr)
+
+    def stats(self) -> Dict[str, Any]:
+        """Uptime, request counters and database contention metrics."""
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(1000 * self.busy_seconds / self.requests, 3) if self.requests else 0.0,
+            "pid": os.getpid(),
+            "db": connections.metrics(),
+        }
+
+    def handle(self, request: Any) -> Optional[Dict[str, Any]]:
+        """Answer one JSON-RPC request (None for notifications)."""
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return _error(None, INVALID_REQUEST, "Invalid request")
+        request_id = request.get("id")
+        method = request["method"]
+        params = request.get("params") or {}
+        if not isinstance(params, dict):
+            return _error(request_id, INVALID_PARAMS, "params must be an object")
+
+        started = time.perf_counter()
+        with self.lock:
+            try:
+                result = self._call(method, params)
+            except Exception as e:
+                self.errors += 1
+                # Leave the shared connection usable for the next request
+                if self.memory.conn.in_transaction:
+                    self.memory.conn.rollback()
+                if isinstance(e, RequestError):
+                    return _error(request_id, e.code, e.message)
+                return _error(request_id, SERVER_ERROR, f"{type(e).__name__}: {e}")
+            finally:
+                self.requests += 1
+                self.busy_seconds += time.perf_counter() - started
+
+        if "id" not in request:
+            return None
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def _call(self, method: str, params: Dict[str, Any]) -> Any:
+        """Run one method, checking its params against the function signature first."""
+        if method == "ping":
+            return {"success": True}
+        if method == "stats":
+            return self.stats()
+        if method not in integration.METHODS:
+            raise RequestError(METHOD_NOT_FOUND, f"Unknown method: {method}")
+        try:
+            inspect.signature(integration.METHODS[method]).bind(**params)
+        except TypeError as e:
+            raise RequestError(INVALID_PARAMS, str(e))
+        return integration.dispatch(method, params)
+
+    def handle_line(self, line: bytes) -> Optional[bytes]:
+        """Decode a request line and encode its response line."""
+        if not line.strip():
+            return None
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = _error(None, PARSE_ERROR, f"Parse error: {e}")
+        else:
+            response = self.handle(request)
+        if response is None:
+            return None
+        return json.dumps(response, default=str).encode("utf-8") + b"\n"
+
+    def close(self):
+        integration.set_resident_memory(None)
+        with self.lock:
+            self.memory.close()
+
+
+def _error(request_id, code: int, message: str) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+# ==================== TRANSPORTS ====================
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Serve requests from one client connection until it disconnects."""
+
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            response = service.handle_line(line)
+            if response is not None:
+                self.wfile.write(response)
+                self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def _claim_socket(path: Path):
+    """Remove a stale socket file, refusing if a live service owns it."""
+    if not path.exists():
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+    except OSError:
+        path.unlink()
+    else:
+        raise SystemExit(f"Memory service already running on {path}")
+    finally:
+        probe.close()
+
+
+def serve_socket(service: MemoryService, path: Path = SOCKET_PATH):
+    """Listen on a Unix socket until SIGTERM/SIGINT."""
+    path = Path(path)
+    _claim_socket(path)
+    server = _Server(str(path), _Handler)
+    server.service = service
+    os.chmod(path, 0o600)
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"[Memory] Service listening on {path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if path.exists():
+            path.unlink()
+
+
+def serve_stdio(service: MemoryService):
+    """Serve requests from stdin, answering on stdout, until EOF."""
+    for line in sys.stdin.buffer:
+        response = service.handle_line(line)
+        if response is not None:
+            sys.stdout.buffer.write(response)
+            sys.stdout.buffer.flush()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Atlas Memory Service")
+    parser.add_argument("--socket", type=Path, default=SOCKET_PATH, help="Unix socket path")
+    parser.add_argument("--stdio", action="store_true", help="Serve JSON-RPC on stdin/stdout")
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="Database path")
+    args = parser.parse_args()
+
+    service = MemoryService(args.db)
+    try:
+        service.warm()
+        if args.stdio:
+            serve_stdio(service)
+        else:
+            serve_socket(service, args.socket)
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,23 @@
 """
 Migrate all markdown memory files into the SQLite database.
 """
-import sqlite3
 import os
 import re
 from pathlib import Path
 from datetime import datetime
 import json
 
+from connections import connect
+from embedding_store import ensure_storage_schema
+from ingest import bulk_pragmas
+from near_duplicates import ensure_dedupe_schema
+
 DB_PATH = Path(__file__).parent / "atlas_memory.db"
 MEMORY_DIR = Path(__file__).parent.parent / "memory"
 MEMORY_MD = Path(__file__).parent.parent / "MEMORY.md"
 
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    return connect(DB_PATH)
 
 def parse_memory_md(content: str) -> list[dict]:
     """Extract facts from MEMORY.md structured content."""
@@ -110,64 +114,27 @@ def extract_facts_from_daily(content: str, date: str) -> list[dict]:
     return facts
 
 def migrate():
-    conn = get_conn()
-    cur = conn.cursor()
+    from markdown_sync import ensure_sync_schema, markdown_files, sync_markdown
     
-    migrated = {'facts': 0, 'daily_logs': 0}
-    
-    # 1. Migrate MEMORY.md
-    if MEMORY_MD.exists():
-        print(f"Migrating {MEMORY_MD}...")
-        content = MEMORY_MD.read_text()
-        facts = parse_memory_md(content)
-        
-        for fact in facts:
-            try:
-                cur.execute("""
-                    INSERT INTO facts (category, subject, content, source)
-                    VALUES (?, ?, ?, ?)
-                """, (fact['category'], fact['subject'], fact['content'], fact['source']))
-                migrated['facts'] += 1
-            except sqlite3.IntegrityError:
-                pass  # Skip duplicates
-        
-        # Also store the full content as a daily log entry
-        cur.execute("""
-            INSERT OR REPLACE INTO daily_logs (date, file_path, content)
-            VALUES (?, ?, ?)
-        """, ('MEMORY', str(MEMORY_MD), content))
-    
-    # 2. Migrate daily log files
-    if MEMORY_DIR.exists():
-        for filepath in sorted(MEMORY_DIR.glob('*.md')):
-            print(f"Migrating {filepath.name}...")
-            log = parse_daily_log(filepath)
-            
-            # Store full content
-            cur.execute("""
-                INSERT OR REPLACE INTO daily_logs (date, file_path, content)
-                VALUES (?, ?, ?)
-            """, (log['date'], log['file_path'], log['content']))
-            migrated['daily_logs'] += 1
-            
-            # Extract and store facts
-            facts = extract_facts_from_daily(log['content'], log['date'])
-            for fact in facts:
-                try:
-                    cur.execute("""
-                        INSERT INTO facts (category, subject, content, source)
-                        VALUES (?, ?, ?, ?)
-                    """, (fact['category'], fact['subject'], fact['content'], fact['source']))
-                    migrated['facts'] += 1
-                except:
-                    pass
+    conn = get_conn()
+    ensure_storage_schema(conn)
+    ensure_sync_schema(conn)
+    ensure_dedupe_schema(conn)
     
-    conn.commit()
+    # MEMORY.md and every memory/*.md; files unchanged since the last run
+    # are skipped, and only new sections of changed files are re-extracted
+    files = markdown_files(MEMORY_DIR, MEMORY_MD)
+    with bulk_pragmas(conn):
+        stats = sync_markdown(conn, files)
     conn.close()
     
+    migrated = {'facts': stats['facts_added'], 'daily_logs': stats['changed']}
     print(f"\n✅ Migration complete:")
-    print(f"   - {migrated['facts']} facts extracted")
-    print(f"   - {migrated['daily_logs']} daily logs indexed")
+    print(f"   - {stats['changed']} files changed, {stats['unchanged']} unchanged, {stats['removed']} removed")
+    print(f"   - {stats['facts_added']} facts extracted, {stats['facts_removed']} stale facts removed")
+    print(f"   - {stats['seconds'] * 1000:.1f} ms")
+    if stats['facts_added']:
+        print("   Run generate_embeddings.py to embed the new facts")
     
     return migrated
 
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Atlas Near-Duplicate Facts
+MinHash signatures and an LSH band index over fact content.
+
+Every fact gets a NUM_PERM-value MinHash signature of the character
+shingles of its normalised content (fact_signatures), cut into BANDS bands
+whose hashes are indexed in fact_signature_bands. Two facts land in a
+common bucket with high probability once their Jaccard similarity passes
+~(1 / BANDS) ** (1 / rows per band), so a lookup is BANDS primary-key
+probes plus a signature comparison per candidate, whatever the corpus size.
+
+Writers index facts as they store them (index_fact); triggers drop the
+signature of a fact whose content changes or that is deleted, and
+sync_signatures() fills in whatever is missing (facts written by other
+tools). Near-duplicates a writer keeps as separate facts are recorded in
+fact_duplicates (record_duplicates). dedupe() merges stored duplicates of
+the same subject into one fact, carrying over their memory links,
+evolution history, markdown sources and, where the survivor has none, its
+embedding; duplicates across subjects are only recorded.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from connections import apply_schema
+from embedding_store import delete_embeddings, has_table
+
+SHINGLE_CHARS = 4
+NUM_PERM = 120
+BANDS = 20  # 6 rows per band: pairs at Jaccard 0.75 share a bucket 98% of the time, at 0.5 27%
+# Estimated Jaccard similarity from which two facts count as the same fact
+DUPLICATE_THRESHOLD = 0.75
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Multiply-shift hash family; fixed seed because signatures are persisted
+_rng = np.random.default_rng(0x6D696E68)
+_MULTIPLIERS = _rng.integers(0, 2 ** 64, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_OFFSETS = _rng.integers(0, 2 ** 64, NUM_PERM, dtype=np.uint64)
+
+
+def ensure_dedupe_schema(conn: sqlite3.Connection):
+    """Create the signature tables and triggers (see schema.sql) on older databases."""
+    apply_schema(conn)
+
+
+# ==================== SIGNATURES ====================
+
+def shingles(text: str) -> np.ndarray:
+    """Hashes of the distinct SHINGLE_CHARS-grams of the normalised text."""
+    normalized = ' '.join(_WORD_RE.findall(text.lower()))
+    if len(normalized) <= SHINGLE_CHARS:
+        grams = {normalized}
+    else:
+        grams = {normalized[i:i + SHINGLE_CHARS] for i in range(len(normalized) - SHINGLE_CHARS + 1)}
+    return np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def signature(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) of `text`."""
+    hashes = shingles(text)[:, None] * _MULTIPLIERS + _OFFSETS  # wraps mod 2^64
+    return (hashes >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+
+def band_keys(sig: np.ndarray) -> List[int]:
+    """One signed 64-bit bucket key per band."""
+    rows = NUM_PERM // BANDS
+    return [
+        int.from_bytes(hashlib.blake2b(sig[b * rows:(b + 1) * rows].tobytes(), digest_size=8).digest(),
+                       'little', signed=True)
+        for b in range(BANDS)
+    ]
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+def _to_signature(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.uint32)
+
+
+def index_fact(conn: sqlite3.Connection, fact_id: int, content: str,
+               sig: Optional[np.ndarray] = None):
+    """Store the signature and band buckets of a fact (no commit)."""
+    sig = signature(content) if sig is None else sig
+    conn.execute("DELETE FROM fact_signatures WHERE fact_id = ?", (fact_id,))
+    conn.execute("INSERT INTO fact_signatures (fact_id, signature) VALUES (?, ?)",
+                 (fact_id, sig.tobytes()))
+    conn.executemany(
+        "INSERT OR IGNORE INTO fact_signature_bands (band, bucket, fact_id) VALUES (?, ?, ?)",
+        [(band, key, fact_id) for band, key in enumerate(band_keys(sig))]
+    )
+
+
+def sync_signatures(conn: sqlite3.Connection) -> int:
+    """Index every fact without a signature (no commit). Returns facts indexed."""
+    rows = conn.execute("""
+        SELECT f.id, f.content FROM facts f
+        WHERE NOT EXISTS (SELECT 1 FROM fact_signatures s WHERE s.fact_id = f.id)
+    """).fetchall()
+    for fact_id, content in rows:
+        index_fact(conn, fact_id, content)
+    return len(rows)
+
+
+# ==================== LOOKUP ====================
+
+def find_near_duplicates(conn: sqlite3.Connection, content: str, category: Optional[str] = None,
+                         threshold: float = DUPLICATE_THRESHOLD, exclude_id: Optional[int] = None,
+                         sig: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+    """
+    Indexed facts whose content is a near-duplicate of `content` (optionally
+    only within `category`), as (fact id, similarity), most similar first.
+    """
+    sig = signature(content) if sig is None else sig
+    keys = band_keys(sig)
+    candidates = [row[0] for row in conn.execute(
+        "SELECT DISTINCT fact_id FROM fact_signature_bands WHERE "
+        + ' OR '.join(['(band = ? AND bucket = ?)'] * len(keys)),
+        [v for band, key in enumerate(keys) for v in (band, key)]
+    ) if row[0] != exclude_id]
+    if not candidates:
+        return []
+
+    placeholders = ','.join('?' * len(candidates))
+    sql = f"""
+        SELECT s.fact_id, s.signature FROM fact_signatures s
+        JOIN facts f ON f.id = s.fact_id
+        WHERE s.fact_id IN ({placeholders})
+    """
+    if category is not None:
+        sql += " AND f.category = ?"
+        candidates.append(category)
+    rows = conn.execute(sql, candidates).fetchall()
+    if not rows:
+        return []
+    signatures = np.frombuffer(b''.join(blob for _, blob in rows), dtype=np.uint32).reshape(len(rows), -1)
+    scores = (signatures == sig).mean(axis=1)
+    matches = [(rows[i][0], float(scores[i])) for i in np.flatnonzero(scores >= threshold)]
+    return sorted(matches, key=lambda m: (-m[1], m[0]))
+
+
+def find_duplicate_pairs(conn: sqlite3.Connection,
+                         threshold: float = DUPLICATE_THRESHOLD) -> Dict[Tuple[int, int], float]:
+    """{(smaller id, larger id): similarity} of indexed near-duplicate facts in the same category."""
+    buckets = conn.execute("""
+        SELECT group_concat(fact_id) FROM fact_signature_bands
+        GROUP BY band, bucket HAVING COUNT(*) > 1
+    """).fetchall()
+    pairs: Dict[Tuple[int, int], float] = {}
+    checked = set()
+    cache: Dict[int, Tuple[str, np.ndarray]] = {}
+    for (members,) in buckets:
+        ids = sorted(int(i) for i in members.split(','))
+        missing = [i for i in ids if i not in cache]
+        if missing:
+            placeholders = ','.join('?' * len(missing))
+            for fact_id, blob, category in conn.execute(f"""
+                SELECT s.fact_id, s.signature, f.category FROM fact_signatures s
+                JOIN facts f ON f.id = s.fact_id WHERE s.fact_id IN ({placeholders})
+            """, missing):
+                cache[fact_id] = (category, _to_signature(blob))
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:]:
+                if (a, b) in checked or a not in cache or b not in cache:
+                    continue
+                checked.add((a, b))
+                if cache[a][0] != cache[b][0]:
+                    continue
+                score = similarity(cache[a][1], cache[b][1])
+                if score >= threshold:
+                    pairs[(a, b)] = score
+    return pairs
+
+
+def subject_key(subject: Optional[str]) -> str:
+    """A subject compared up to case and spacing."""
+    return ' '.join((subject or '').lower().split())
+
+
+def same_subject_duplicate(conn: sqlite3.Connection, subject: str,
+                           matches: Sequence[Tuple[int, float]]) -> Optional[int]:
+    """
+    The most similar of the (fact id, similarity) `matches` whose subject is
+    `subject`: the same fact restated. None if only other subjects match.
+    """
+    if not matches:
+        return None
+    placeholders = ','.join('?' * len(matches))
+    subjects = dict(conn.execute(
+        f"SELECT id, subject FROM facts WHERE id IN ({placeholders})", [m[0] for m in matches]
+    ).fetchall())
+    key = subject_key(subject)
+    return next((fact_id for fact_id, _ in matches if subject_key(subjects.get(fact_id)) == key), None)
+
+
+def record_duplicates(conn: sqlite3.Connection, fact_id: int, matches: Sequence[Tuple[int, float]]):
+    """Remember that `fact_id` near-duplicates the (fact id, similarity) `matches` (no commit)."""
+    conn.executemany(
+        """INSERT INTO fact_duplicates (fact_id, duplicate_of, similarity) VALUES (?, ?, ?)
+           ON CONFLICT(fact_id, duplicate_of) DO UPDATE SET similarity = excluded.similarity""",
+        [(fact_id, other, score) for other, score in matches if other != fact_id]
+    )
+
+
+def recorded_duplicates(conn: sqlite3.Connection) -> List[Tuple[int, int, float]]:
+    """(fact id, duplicate of, similarity) of the recorded pairs still unmerged."""
+    return conn.execute(
+        "SELECT fact_id, duplicate_of, similarity FROM fact_duplicates ORDER BY fact_id, duplicate_of"
+    ).fetchall()
+
+
+# ==================== MERGING ====================
+
+def merge_into(conn: sqlite3.Connection, keep_id: int, duplicate_ids: Sequence[int]):
+    """
+    Fold `duplicate_ids` into `keep_id` and delete them (no commit). Links,
+    evolution history and markdown sources move to the survivor; it also
+    adopts a duplicate's embedding (and chunks) if it has none of its own.
+    """
+    duplicate_ids = [d for d in duplicate_ids if d != keep_id]
+    if not duplicate_ids:
+        return
+    placeholders = ','.join('?' * len(duplicate_ids))
+
+    if has_table(conn, 'memory_links'):
+        for column in ('source_fact_id', 'target_fact_id'):
+            conn.execute(
+                f"UPDATE OR IGNORE memory_links SET {column} = ? WHERE {column} IN ({placeholders})",
+                [keep_id] + duplicate_ids
+            )
+        # Links that already existed on the survivor, and links between duplicates
+        conn.execute(f"""
+            DELETE FROM memory_links
+            WHERE source_fact_id IN ({placeholders}) OR target_fact_id IN ({placeholders})
+               OR source_fact_id = target_fact_id
+        """, duplicate_ids * 2)
+    if has_table(conn, 'memory_evolutions'):
+        conn.execute(f"UPDATE memory_evolutions SET fact_id = ? WHERE fact_id IN ({placeholders})",
+                     [keep_id] + duplicate_ids)
+    if has_table(conn, 'markdown_fact_sources'):
+        conn.execute(f"""
+            INSERT OR IGNORE INTO markdown_fact_sources (path, chunk_hash, fact_id)
+            SELECT path, chunk_hash, ? FROM markdown_fact_sources WHERE fact_id IN ({placeholders})
+        """, [keep_id] + duplicate_ids)
+
+    has_vector = conn.execute(
+        "SELECT 1 FROM fact_embeddings WHERE fact_id = ?", (keep_id,)
+    ).fetchone()
+    if not has_vector:
+        donor = conn.execute(
+            f"SELECT MIN(fact_id) FROM fact_embeddings WHERE fact_id IN ({placeholders})", duplicate_ids
+        ).fetchone()[0]
+        if donor is not None:
+            # Near-identical text: the duplicate's vector stands in for the survivor's
+            for table in ('fact_embeddings', 'fact_embeddings_exact', 'fact_chunks'):
+                if has_table(conn, table):
+                    conn.execute(f"UPDATE {table} SET fact_id = ? WHERE fact_id = ?", (keep_id, donor))
+
+    delete_embeddings(conn, 'facts', duplicate_ids)
+    conn.execute(f"DELETE FROM facts WHERE id IN ({placeholders})", duplicate_ids)
+
+
+def dedupe(conn: sqlite3.Connection, threshold: float = DUPLICATE_THRESHOLD,
+           dry_run: bool = False) -> Dict:
+    """
+    Merge near-duplicate facts that restate one fact (same category and
+    subject key) into their most recently updated member, in one
+    transaction. Only members that are near-duplicates of that survivor
+    themselves are merged, so a chain A~B~C never folds A into C.
+    Near-duplicates under different subjects are recorded in fact_duplicates
+    for review instead. A dry run changes nothing.
+    """
+    conn.execute("SAVEPOINT dedupe")
+    try:
+        indexed = sync_signatures(conn)
+        pairs = find_duplicate_pairs(conn, threshold)
+        ids = sorted({fact_id for pair in pairs for fact_id in pair})
+        facts = {
+            fact_id: (subject_key(subject), updated_at or '')
+            for fact_id, subject, updated_at in conn.execute(
+                "SELECT id, subject, updated_at FROM facts WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(ids),)
+            )
+        }
+
+        parent: Dict[int, int] = {}
+
+        def find(x: int) -> int:
+            while parent.setdefault(x, x) != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b in pairs:
+            if facts[a][0] == facts[b][0]:
+                parent[find(b)] = find(a)
+            else:
+                record_duplicates(conn, b, [(a, pairs[(a, b)])])
+
+        groups: Dict[int, List[int]] = {}
+        for fact_id in parent:
+            groups.setdefault(find(fact_id), []).append(fact_id)
+        merged = []
+        removed: List[int] = []
+        for group in sorted((sorted(g) for g in groups.values() if len(g) > 1), key=lambda g: g[0]):
+            # Most recently updated, then oldest id
+            keep_id = max(group, key=lambda fact_id: (facts[fact_id][1], -fact_id))
+            duplicates = [
+                fact_id for fact_id in group
+                if fact_id != keep_id and (min(fact_id, keep_id), max(fact_id, keep_id)) in pairs
+            ]
+            if not duplicates:
+                continue
+            merge_into(conn, keep_id, duplicates)
+            merged.append({'keep': keep_id, 'merged': duplicates})
+            removed.extend(duplicates)
+        recorded = recorded_duplicates(conn)
+    except BaseException:
+        conn.execute("ROLLBACK TO dedupe")
+        conn.execute("RELEASE dedupe")
+        raise
+    if dry_run:
+        conn.execute("ROLLBACK TO dedupe")
+    # Outside a caller's transaction this commits
+    conn.execute("RELEASE dedupe")
+    return {
+        'indexed': indexed,
+        'clusters': len(merged),
+        'removed': len(removed),
+        'removed_ids': removed,
+        'groups': merged,
+        'recorded_pairs': [
+            {'fact_id': a, 'duplicate_of': b, 'similarity': round(score, 3)} for a, b, score in recorded
+        ],
+        'dry_run': dry_run,
+    }
+
@@ -4,52 +4,44 @@ Query the atlas memory database.
 This is the primary interface for memory recall.
 """
 import sqlite3
-import os
 import struct
 import sys
 from pathlib import Path
 
+import embeddings
+import retrieval
+from ann_index import open_vector_index
+from chunked_embeddings import CHUNKED_SOURCES, has_chunks, max_sim_search
+from connections import connect
+from embedding_providers import get_provider
+from embedding_store import embedding_model, ensure_storage_schema, matches_embedding_model
+from log_chunks import ensure_chunk_schema, has_chunk_embeddings, search_log_chunks
+
 DB_PATH = Path(__file__).parent / "atlas_memory.db"
 
 def get_embedding(text: str) -> list[float]:
-    """Get embedding from OpenAI API."""
-    import urllib.request
-    import json
-    
-    api_key = os.environ.get('OPENAI_API_KEY')
-    if not api_key:
-        env_file = Path.home() / '.clawdbot' / '.env'
-        if env_file.exists():
-            for line in env_file.read_text().split('\n'):
-                if line.startswith('OPENAI_API_KEY='):
-                    api_key = line.split('=', 1)[1].strip().strip('"\'')
-                    break
-    
-    if not api_key:
-        raise ValueError("No OPENAI_API_KEY found")
-    
-    data = json.dumps({
-        "model": "text-embedding-3-small",
-        "input": text[:8000]
-    }).encode()
-    
-    req = urllib.request.Request(
-        "https://api.openai.com/v1/embeddings",
-        data=data,
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-    )
-    
-    with urllib.request.urlopen(req) as resp:
-        result = json.loads(resp.read())
-        return result['data'][0]['embedding']
+    """Embed with the configured provider (through the shared embedding cache)."""
+    return embeddings.get_embedding(text, db_path=DB_PATH)
 
 def blob_to_embedding(blob: bytes) -> list[float]:
     n = len(blob) // 4
     return list(struct.unpack(f'{n}f', blob))
 
+def nearest_items(conn: sqlite3.Connection, name: str, query_emb: list[float],
+                  k: int, min_score: float) -> list[tuple[int, float]]:
+    """Nearest items of `name`, scoring long items by their best chunk."""
+    provider = get_provider()
+    ensure_storage_schema(conn)
+    if not matches_embedding_model(conn, provider.tag):
+        print(f"[Memory] Stored vectors are {embedding_model(conn)}, not {provider.tag}; "
+              f"skipping vector search")
+        return []
+    chunk_index = None
+    if has_chunks(conn, name):
+        chunk_index = open_vector_index(conn, DB_PATH, CHUNKED_SOURCES[name][2], provider.dimensions)
+    return max_sim_search(conn, name, open_vector_index(conn, DB_PATH, name, provider.dimensions),
+                          chunk_index, query_emb, k=k, min_score=min_score)
+
 def cosine_similarity(a: list[float], b: list[float]) -> float:
     dot = sum(x*y for x, y in zip(a, b))
     norm_a = sum(x*x for x in a) ** 0.5
@@ -58,61 +50,68 @@ def cosine_similarity(a: list[float], b: list[float]) -> float:
 
 def semantic_search(query: str, limit: int = 10, min_score: float = 0.3) -> list[dict]:
     """Search facts by semantic similarity."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     cur = conn.cursor()
     
     # Get query embedding
     query_emb = get_embedding(query)
     
-    # Get all facts with embeddings
-    cur.execute("""
-        SELECT f.id, f.category, f.subject, f.content, f.source, fe.embedding
-        FROM facts f
-        JOIN fact_embeddings fe ON f.id = fe.fact_id
-    """)
+    # Nearest neighbours from the vector index (exact matrix or IVF)
+    hits = nearest_items(conn, 'facts', query_emb, limit, min_score)
+    if not hits:
+        conn.close()
+        return []
+    
+    scores = dict(hits)
+    placeholders = ','.join('?' * len(hits))
+    cur.execute(f"""
+        SELECT id, category, subject, content, source
+        FROM facts
+        WHERE id IN ({placeholders})
+    """, list(scores))
     
     results = []
-    for fact_id, category, subject, content, source, emb_blob in cur.fetchall():
-        fact_emb = blob_to_embedding(emb_blob)
-        score = cosine_similarity(query_emb, fact_emb)
-        
-        if score >= min_score:
-            results.append({
-                'id': fact_id,
-                'category': category,
-                'subject': subject,
-                'content': content,
-                'source': source,
-                'score': score
-            })
+    for fact_id, category, subject, content, source in cur.fetchall():
+        results.append({
+            'id': fact_id,
+            'category': category,
+            'subject': subject,
+            'content': content,
+            'source': source,
+            'score': scores[fact_id]
+        })
     
     conn.close()
     
     # Sort by score descending
     results.sort(key=lambda x: x['score'], reverse=True)
-    return results[:limit]
+    return results
 
 def keyword_search(query: str, limit: int = 10) -> list[dict]:
-    """Search facts by keyword (FTS5)."""
-    conn = sqlite3.connect(DB_PATH)
+    """Search facts by keyword (FTS5, any term, ranked by bm25)."""
+    match = retrieval.fts_query(query)
+    if match is None:
+        return []
+    conn = connect(DB_PATH)
     cur = conn.cursor()
     
-    # Escape special FTS5 characters and wrap in quotes
-    safe_query = '"' + query.replace('"', '""') + '"'
-    
-    # Use FTS5 match
     try:
-        cur.execute("""
-            SELECT f.id, f.category, f.subject, f.content, f.source
-            FROM facts f
-            JOIN facts_fts fts ON f.id = fts.rowid
-            WHERE facts_fts MATCH ?
-            LIMIT ?
-        """, (safe_query, limit))
+        hits = retrieval.keyword_page(conn, match, 0, limit)
     except sqlite3.OperationalError:
         # FTS query failed, return empty
         conn.close()
         return []
+    if not hits:
+        conn.close()
+        return []
+    
+    scores = dict(hits)
+    placeholders = ','.join('?' * len(hits))
+    cur.execute(f"""
+        SELECT id, category, subject, content, source
+        FROM facts
+        WHERE id IN ({placeholders})
+    """, list(scores))
     
     results = []
     for fact_id, category, subject, content, source in cur.fetchall():
@@ -122,73 +121,88 @@ def keyword_search(query: str, limit: int = 10) -> list[dict]:
             'subject': subject,
             'content': content,
             'source': source,
-            'score': 1.0  # FTS doesn't give similarity scores
+            'score': scores[fact_id]  # -bm25, higher is better
         })
     
     conn.close()
+    results.sort(key=lambda x: x['score'], reverse=True)
     return results
 
 def search_daily_logs(query: str, limit: int = 5) -> list[dict]:
-    """Search daily log content."""
-    conn = sqlite3.connect(DB_PATH)
+    """Search daily log chunks (FTS5 with highlighted snippets)."""
+    conn = connect(DB_PATH)
+    try:
+        ensure_chunk_schema(conn)
+        ensure_storage_schema(conn)
+        embed = vector_search = None
+        provider = get_provider()
+        if has_chunk_embeddings(conn):
+            if matches_embedding_model(conn, provider.tag):
+                embed = get_embedding
+                vector_search = lambda emb, k: open_vector_index(
+                    conn, DB_PATH, 'log_chunks', provider.dimensions
+                ).search(emb, k=k)
+            else:
+                print(f"[Memory] Stored vectors are {embedding_model(conn)}, not {provider.tag}; "
+                      f"searching log chunks by keyword only")
+        return search_log_chunks(conn, query, limit, embed=embed, vector_search=vector_search)
+    finally:
+        conn.close()
+
+def hybrid_search(query: str, limit: int = 10, fusion: str = retrieval.DEFAULT_FUSION,
+                  min_score: float = 0.3) -> list[dict]:
+    """Combine semantic and keyword search (shared planner in retrieval.py)."""
+    conn = connect(DB_PATH)
     cur = conn.cursor()
     
-    # Simple LIKE search
-    cur.execute("""
-        SELECT date, file_path, content
-        FROM daily_logs
-        WHERE content LIKE ?
-        ORDER BY date DESC
-        LIMIT ?
-    """, (f'%{query}%', limit))
+    hits = retrieval.hybrid_search(
+        conn, query, limit,
+        embed=get_embedding,
+        vector_search=lambda emb, k: nearest_items(conn, 'facts', emb, k, min_score),
+        fusion=fusion,
+        min_vector_score=min_score
+    )
+    if not hits:
+        conn.close()
+        return []
+    
+    fused = {h['id']: h for h in hits}
+    placeholders = ','.join('?' * len(hits))
+    cur.execute(f"""
+        SELECT id, category, subject, content, source
+        FROM facts
+        WHERE id IN ({placeholders})
+    """, list(fused))
     
     results = []
-    for date, path, content in cur.fetchall():
-        # Extract relevant snippet
-        idx = content.lower().find(query.lower())
-        start = max(0, idx - 100)
-        end = min(len(content), idx + len(query) + 100)
-        snippet = content[start:end]
-        
+    for fact_id, category, subject, content, source in cur.fetchall():
+        hit = fused[fact_id]
         results.append({
-            'date': date,
-            'path': path,
-            'snippet': f"...{snippet}..."
+            'id': fact_id,
+            'category': category,
+            'subject': subject,
+            'content': content,
+            'source': source,
+            'score': hit['combined_score'],
+            'vector_score': hit['vector_score'],
+            'keyword_score': hit['keyword_score']
         })
     
     conn.close()
+    results.sort(key=lambda x: x['score'], reverse=True)
     return results
 
-def hybrid_search(query: str, limit: int = 10) -> list[dict]:
-    """Combine semantic and keyword search."""
-    semantic = semantic_search(query, limit=limit)
-    keyword = keyword_search(query, limit=limit)
-    
-    # Merge results, preferring semantic
-    seen_ids = set()
-    results = []
-    
-    for r in semantic:
-        results.append(r)
-        seen_ids.add(r['id'])
-    
-    for r in keyword:
-        if r['id'] not in seen_ids:
-            r['score'] = 0.5  # Lower score for keyword-only
-            results.append(r)
-    
-    return results[:limit]
-
 def main():
     import json
     
     if len(sys.argv) < 2:
-        print("Usage: query.py <search_query> [--limit N] [--mode semantic|keyword|hybrid]")
+        print("Usage: query.py <search_query> [--limit N] [--mode semantic|keyword|hybrid|logs] [--fusion rrf|minmax]")
         sys.exit(1)
     
     query = sys.argv[1]
     limit = 10
     mode = 'hybrid'
+    fusion = retrieval.DEFAULT_FUSION
     
     # Parse args
     i = 2
@@ -199,6 +213,9 @@ def main():
         elif sys.argv[i] == '--mode' and i+1 < len(sys.argv):
             mode = sys.argv[i+1]
             i += 2
+        elif sys.argv[i] == '--fusion' and i+1 < len(sys.argv):
+            fusion = sys.argv[i+1]
+            i += 2
         else:
             i += 1
     
@@ -206,8 +223,10 @@ def main():
         results = semantic_search(query, limit)
     elif mode == 'keyword':
         results = keyword_search(query, limit)
+    elif mode == 'logs':
+        results = search_daily_logs(query, limit)
     else:
-        results = hybrid_search(query, limit)
+        results = hybrid_search(query, limit, fusion)
     
     print(json.dumps(results, indent=2))
 
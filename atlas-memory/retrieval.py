@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Atlas Retrieval
+Hybrid keyword + vector retrieval planner.
+
+Shared by AtlasMemory.search_facts_hybrid and query.hybrid_search:
+
+1. The query is tokenised into an FTS5 expression: every term quoted (so
+   punctuation and FTS operators are literal), OR-ed together so partial
+   matches still qualify, and the last term used as a prefix.
+2. The query embedding is computed in a worker thread while the first
+   keyword page (ordered by bm25) is read on the caller's connection.
+3. The two ranked lists are fused with reciprocal-rank fusion (default) or
+   min-max-normalised weighted scores.
+4. With RRF, further keyword pages are read only until no unseen keyword
+   hit could still enter the top-k (threshold-algorithm stopping rule);
+   vector hits that do not match the keyword query at all are settled up
+   front with one rowid-restricted MATCH.
+"""
+
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+FUSIONS = ('rrf', 'minmax')
+DEFAULT_FUSION = 'rrf'
+
+# Standard RRF damping constant
+RRF_K = 60
+# Weights of the vector and keyword lists (both fusion modes)
+VECTOR_WEIGHT = 0.7
+KEYWORD_WEIGHT = 0.3
+
+KEYWORD_PAGE_MIN = 10
+# Vector candidates fetched per requested result
+VECTOR_DEPTH_FACTOR = 2
+# Never read keyword hits deeper than limit * this
+MAX_KEYWORD_DEPTH_FACTOR = 10
+# Shortest final term that is expanded as a prefix
+PREFIX_MIN_CHARS = 3
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+_executor = None
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='atlas-embed')
+    return _executor
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Build an OR-of-terms FTS5 expression (last term as prefix), or None if no terms."""
+    terms = list(dict.fromkeys(t.lower() for t in _TERM_RE.findall(text or '')))
+    if not terms:
+        return None
+    parts = [f'"{t}"' for t in terms]
+    if len(terms[-1]) >= PREFIX_MIN_CHARS:
+        parts[-1] += '*'
+    return ' OR '.join(parts)
+
+
+def keyword_page(conn: sqlite3.Connection, match: str, offset: int, size: int,
+                 fts_table: str = 'facts_fts') -> List[Tuple[int, float]]:
+    """One page of (rowid, score) keyword hits, best first (score = -bm25)."""
+    rows = conn.execute(
+        f"""SELECT rowid, bm25({fts_table}) FROM {fts_table}
+            WHERE {fts_table} MATCH ?
+            ORDER BY bm25({fts_table})
+            LIMIT ? OFFSET ?""",
+        (match, size, offset)
+    ).fetchall()
+    return [(row[0], -row[1]) for row in rows]
+
+
+def keyword_matches(conn: sqlite3.Connection, match: str, item_ids: Sequence[int],
+                    fts_table: str = 'facts_fts') -> set:
+    """Which of `item_ids` match the FTS5 expression at all."""
+    if not item_ids:
+        return set()
+    placeholders = ','.join('?' * len(item_ids))
+    return {
+        row[0] for row in conn.execute(
+            f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH ? AND rowid IN ({placeholders})",
+            [match, *item_ids]
+        )
+    }
+
+
+# ==================== FUSION ====================
+
+def _rrf_scores(keyword: Sequence[Tuple[int, float]],
+                vector: Sequence[Tuple[int, float]]) -> Dict[int, Dict]:
+    fused = {}
+    for rank, (item_id, score) in enumerate(vector, 1):
+        fused[item_id] = {
+            'id': item_id, 'combined_score': VECTOR_WEIGHT / (RRF_K + rank),
+            'vector_score': score, 'vector_rank': rank,
+            'keyword_score': 0.0, 'keyword_rank': None,
+        }
+    for rank, (item_id, score) in enumerate(keyword, 1):
+        hit = fused.setdefault(item_id, {
+            'id': item_id, 'combined_score': 0.0,
+            'vector_score': 0.0, 'vector_rank': None,
+        })
+        hit['combined_score'] += KEYWORD_WEIGHT / (RRF_K + rank)
+        hit['keyword_score'] = score
+        hit['keyword_rank'] = rank
+    return fused
+
+
+def _rrf_settled(fused: Dict[int, Dict], keyword_seen: int, limit: int,
+                 final: set) -> bool:
+    """
+    True once no hit from later keyword pages can change the top-k set.
+    `final` holds ids known not to match the keyword query at all.
+    """
+    if len(fused) < limit:
+        return False
+    ranked = sorted(fused.values(), key=lambda h: h['combined_score'], reverse=True)
+    kth = ranked[limit - 1]['combined_score']
+    # Best contribution any later keyword hit can still receive
+    next_gain = KEYWORD_WEIGHT / (RRF_K + keyword_seen + 1)
+    bound = next_gain
+    for hit in ranked[limit:]:
+        if hit['keyword_rank'] is None and hit['id'] not in final:
+            bound = max(bound, hit['combined_score'] + next_gain)
+    return kth >= bound
+
+
+def _minmax(hits: Sequence[Tuple[int, float]]) -> Dict[int, float]:
+    if not hits:
+        return {}
+    scores = [s for _, s in hits]
+    low, high = min(scores), max(scores)
+    span = high - low
+    return {i: (s - low) / span if span else 1.0 for i, s in hits}
+
+
+def _minmax_scores(keyword: Sequence[Tuple[int, float]],
+                   vector: Sequence[Tuple[int, float]]) -> Dict[int, Dict]:
+    keyword_norm = _minmax(keyword)
+    vector_norm = _minmax(vector)
+    raw_keyword = dict(keyword)
+    raw_vector = dict(vector)
+    keyword_ranks = {i: r for r, (i, _) in enumerate(keyword, 1)}
+    vector_ranks = {i: r for r, (i, _) in enumerate(vector, 1)}
+    fused = {}
+    for item_id in list(vector_norm) + [i for i in keyword_norm if i not in vector_norm]:
+        fused[item_id] = {
+            'id': item_id,
+            'combined_score': (
+                VECTOR_WEIGHT * vector_norm.get(item_id, 0.0) +
+                KEYWORD_WEIGHT * keyword_norm.get(item_id, 0.0)
+            ),
+            'vector_score': raw_vector.get(item_id, 0.0),
+            'vector_rank': vector_ranks.get(item_id),
+            'keyword_score': raw_keyword.get(item_id, 0.0),
+            'keyword_rank': keyword_ranks.get(item_id),
+        }
+    return fused
+
+
+# ==================== PLANNER ====================
+
+def hybrid_search(conn: sqlite3.Connection, query: str, limit: int = 10,
+                  embed: Optional[Callable[[str], List[float]]] = None,
+                  vector_search: Optional[Callable[[List[float], int], List[Tuple[int, float]]]] = None,
+                  fusion: str = DEFAULT_FUSION,
+                  fts_table: str = 'facts_fts',
+                  min_vector_score: float = 0.0) -> List[Dict]:
+    """
+    Rank item ids for `query` from keyword and vector evidence.
+
+    `embed` runs in a worker thread, so it must not use `conn`;
+    `vector_search(embedding, k)` runs on the caller's thread.
+    Returns up to `limit` dicts (id, combined_score, keyword/vector score
+    and rank), best first. Callers fetch the rows themselves.
+    """
+    if fusion not in FUSIONS:
+        raise ValueError(f"Unknown fusion: {fusion}")
+    if limit <= 0:
+        return []
+
+    pending = None
+    if embed is not None and vector_search is not None:
+        pending = _pool().submit(embed, query)
+
+    match = fts_query(query)
+    page_size = max(limit, KEYWORD_PAGE_MIN)
+    keyword = []
+    exhausted = match is None
+
+    def read_page():
+        nonlocal exhausted
+        try:
+            page = keyword_page(conn, match, len(keyword), page_size, fts_table)
+        except sqlite3.OperationalError as e:
+            print(f"[Memory] Keyword search failed: {e}")
+            page = []
+        keyword.extend(page)
+        exhausted = len(page) < page_size
+
+    if not exhausted:
+        read_page()
+
+    vector = []
+    if pending is not None:
+        try:
+            hits = vector_search(pending.result(), limit * VECTOR_DEPTH_FACTOR)
+            vector = [(i, s) for i, s in hits if s > min_vector_score]
+        except Exception as e:
+            print(f"[Memory] Vector search failed: {e}")
+
+    if fusion == 'minmax':
+        fused = _minmax_scores(keyword, vector)
+    else:
+        max_depth = limit * MAX_KEYWORD_DEPTH_FACTOR
+        fused = _rrf_scores(keyword, vector)
+        final = set()
+        if not exhausted and vector:
+            # Vector hits with no keyword match can never gain keyword credit
+            vector_ids = [i for i, _ in vector]
+            try:
+                final = set(vector_ids) - keyword_matches(conn, match, vector_ids, fts_table)
+            except sqlite3.OperationalError:
+                pass
+        while not exhausted and len(keyword) < max_depth and not _rrf_settled(fused, len(keyword), limit, final):
+            read_page()
+            fused = _rrf_scores(keyword, vector)
+
+    ranked = sorted(fused.values(), key=lambda h: h['combined_score'], reverse=True)
+    return ranked[:limit]
@@ -17,10 +17,18 @@ CREATE TABLE IF NOT EXISTS fact_embeddings (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     fact_id INTEGER NOT NULL UNIQUE,
     embedding BLOB NOT NULL,
+    dtype TEXT NOT NULL DEFAULT 'float32',  -- 'float32', 'float16', 'int8'
+    scale REAL,  -- int8 dequantisation scale
     created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
     FOREIGN KEY (fact_id) REFERENCES facts(id) ON DELETE CASCADE
 );
 
+-- Full-precision fact vectors for re-ranking when fact_embeddings is compact
+CREATE TABLE IF NOT EXISTS fact_embeddings_exact (
+    fact_id INTEGER PRIMARY KEY,
+    embedding BLOB NOT NULL
+);
+
 -- Soul aspects (agent's evolving identity)
 CREATE TABLE IF NOT EXISTS soul (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -45,11 +53,20 @@ CREATE TABLE IF NOT EXISTS message_embeddings (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     message_id INTEGER NOT NULL UNIQUE,
     embedding BLOB NOT NULL,
+    dtype TEXT NOT NULL DEFAULT 'float32',
+    scale REAL,
     created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
     FOREIGN KEY (message_id) REFERENCES messages(id) ON DELETE CASCADE
 );
 
--- Rolling summaries for context efficiency
+-- Full-precision message vectors for re-ranking when message_embeddings is compact
+CREATE TABLE IF NOT EXISTS message_embeddings_exact (
+    message_id INTEGER PRIMARY KEY,
+    embedding BLOB NOT NULL
+);
+
+-- Rolling summaries for context efficiency (a tree per session, see summarizer.py):
+-- level 0 summarises messages, level n+1 folds level-n summaries (parent_id)
 CREATE TABLE IF NOT EXISTS summaries (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     session_id TEXT DEFAULT 'main',
@@ -57,9 +74,30 @@ CREATE TABLE IF NOT EXISTS summaries (
     end_message_id INTEGER NOT NULL,
     content TEXT NOT NULL,
     token_count INTEGER,
+    level INTEGER NOT NULL DEFAULT 0,
+    parent_id INTEGER,
     created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
 );
 
+-- Compressed soul aspects for context packing (see context_packer.py)
+CREATE TABLE IF NOT EXISTS soul_summaries (
+    aspect TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    token_count INTEGER NOT NULL,
+    tokenizer TEXT NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS soul_summaries_ad AFTER DELETE ON soul BEGIN
+    DELETE FROM soul_summaries WHERE aspect = old.aspect;
+END;
+
+-- Database-level settings (e.g. embedding_storage mode)
+CREATE TABLE IF NOT EXISTS atlas_settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
 -- Daily logs index (synced from markdown files)
 CREATE TABLE IF NOT EXISTS daily_logs (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -72,8 +110,10 @@ CREATE TABLE IF NOT EXISTS daily_logs (
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_facts_category ON facts(category);
 CREATE INDEX IF NOT EXISTS idx_facts_subject ON facts(subject);
+CREATE INDEX IF NOT EXISTS idx_facts_category_subject ON facts(category, subject);
 CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, timestamp);
 CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, id);
 CREATE INDEX IF NOT EXISTS idx_summaries_session ON summaries(session_id, end_message_id);
 CREATE INDEX IF NOT EXISTS idx_soul_aspect ON soul(aspect);
 CREATE INDEX IF NOT EXISTS idx_daily_logs_date ON daily_logs(date);
@@ -104,3 +144,364 @@ CREATE TRIGGER IF NOT EXISTS facts_au AFTER UPDATE ON facts BEGIN
     INSERT INTO facts_fts(rowid, category, subject, content)
     VALUES (new.id, new.category, new.subject, new.content);
 END;
+
+-- Daily logs split at markdown headings (see log_chunks.py)
+CREATE TABLE IF NOT EXISTS daily_log_chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    log_date TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    heading TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_daily_log_chunks_date ON daily_log_chunks(log_date, position);
+
+-- Optional log chunk embeddings (generate_embeddings.py --target log_chunks)
+CREATE TABLE IF NOT EXISTS log_chunk_embeddings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chunk_id INTEGER NOT NULL UNIQUE,
+    embedding BLOB NOT NULL,
+    dtype TEXT NOT NULL DEFAULT 'float32',
+    scale REAL,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    FOREIGN KEY (chunk_id) REFERENCES daily_log_chunks(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS log_chunk_embeddings_exact (
+    chunk_id INTEGER PRIMARY KEY,
+    embedding BLOB NOT NULL
+);
+
+-- FTS5 for keyword search on log chunks
+CREATE VIRTUAL TABLE IF NOT EXISTS daily_log_chunks_fts USING fts5(
+    heading,
+    content,
+    content='daily_log_chunks',
+    content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS daily_log_chunks_ai AFTER INSERT ON daily_log_chunks BEGIN
+    INSERT INTO daily_log_chunks_fts(rowid, heading, content)
+    VALUES (new.id, new.heading, new.content);
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_log_chunks_ad AFTER DELETE ON daily_log_chunks BEGIN
+    INSERT INTO daily_log_chunks_fts(daily_log_chunks_fts, rowid, heading, content)
+    VALUES ('delete', old.id, old.heading, old.content);
+    DELETE FROM log_chunk_embeddings WHERE chunk_id = old.id;
+    DELETE FROM log_chunk_embeddings_exact WHERE chunk_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_log_chunks_au AFTER UPDATE ON daily_log_chunks BEGIN
+    INSERT INTO daily_log_chunks_fts(daily_log_chunks_fts, rowid, heading, content)
+    VALUES ('delete', old.id, old.heading, old.content);
+    INSERT INTO daily_log_chunks_fts(rowid, heading, content)
+    VALUES (new.id, new.heading, new.content);
+END;
+
+-- A changed log loses its chunks; refresh_log_chunks() rebuilds them
+CREATE TRIGGER IF NOT EXISTS daily_logs_chunks_ai AFTER INSERT ON daily_logs BEGIN
+    DELETE FROM daily_log_chunks WHERE log_date = new.date;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_logs_chunks_au AFTER UPDATE OF date, content ON daily_logs BEGIN
+    DELETE FROM daily_log_chunks WHERE log_date IN (old.date, new.date);
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_logs_chunks_ad AFTER DELETE ON daily_logs BEGIN
+    DELETE FROM daily_log_chunks WHERE log_date = old.date;
+END;
+
+-- Long facts/messages split into token windows (see chunked_embeddings.py);
+-- the item embedding is the mean of its chunk embeddings
+CREATE TABLE IF NOT EXISTS fact_chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fact_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fact_chunks_fact ON fact_chunks(fact_id, position);
+
+CREATE TABLE IF NOT EXISTS fact_chunk_embeddings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chunk_id INTEGER NOT NULL UNIQUE,
+    embedding BLOB NOT NULL,
+    dtype TEXT NOT NULL DEFAULT 'float32',
+    scale REAL,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    FOREIGN KEY (chunk_id) REFERENCES fact_chunks(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS fact_chunk_embeddings_exact (
+    chunk_id INTEGER PRIMARY KEY,
+    embedding BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS message_chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_message_chunks_message ON message_chunks(message_id, position);
+
+CREATE TABLE IF NOT EXISTS message_chunk_embeddings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chunk_id INTEGER NOT NULL UNIQUE,
+    embedding BLOB NOT NULL,
+    dtype TEXT NOT NULL DEFAULT 'float32',
+    scale REAL,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    FOREIGN KEY (chunk_id) REFERENCES message_chunks(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS message_chunk_embeddings_exact (
+    chunk_id INTEGER PRIMARY KEY,
+    embedding BLOB NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS fact_chunks_ad AFTER DELETE ON fact_chunks BEGIN
+    DELETE FROM fact_chunk_embeddings WHERE chunk_id = old.id;
+    DELETE FROM fact_chunk_embeddings_exact WHERE chunk_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS message_chunks_ad AFTER DELETE ON message_chunks BEGIN
+    DELETE FROM message_chunk_embeddings WHERE chunk_id = old.id;
+    DELETE FROM message_chunk_embeddings_exact WHERE chunk_id = old.id;
+END;
+
+-- Changed or deleted items lose their chunks
+CREATE TRIGGER IF NOT EXISTS facts_chunks_au AFTER UPDATE OF category, subject, content ON facts BEGIN
+    DELETE FROM fact_chunks WHERE fact_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS facts_chunks_ad AFTER DELETE ON facts BEGIN
+    DELETE FROM fact_chunks WHERE fact_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_chunks_au AFTER UPDATE OF content ON messages BEGIN
+    DELETE FROM message_chunks WHERE message_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_chunks_ad AFTER DELETE ON messages BEGIN
+    DELETE FROM message_chunks WHERE message_id = old.id;
+END;
+
+-- Markdown sync manifest (see markdown_sync.py): per-file stat/hash, per-chunk
+-- hashes, and which facts each chunk produced
+CREATE TABLE IF NOT EXISTS markdown_manifest (
+    path TEXT PRIMARY KEY,
+    log_date TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    synced_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS markdown_chunks (
+    path TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    PRIMARY KEY (path, chunk_hash)
+);
+
+CREATE TABLE IF NOT EXISTS markdown_fact_sources (
+    path TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    fact_id INTEGER NOT NULL,
+    PRIMARY KEY (path, chunk_hash, fact_id)
+);
+CREATE INDEX IF NOT EXISTS idx_markdown_fact_sources_fact ON markdown_fact_sources(fact_id);
+
+CREATE TRIGGER IF NOT EXISTS facts_markdown_sources_ad AFTER DELETE ON facts BEGIN
+    DELETE FROM markdown_fact_sources WHERE fact_id = old.id;
+END;
+
+-- Write generation: bumped by every change that can alter recall results,
+-- so cached context (context_cache.py) is invalidated by a single read
+CREATE TABLE IF NOT EXISTS write_generation (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO write_generation (id, generation) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS facts_generation_ai AFTER INSERT ON facts BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS facts_generation_au AFTER UPDATE ON facts BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS facts_generation_ad AFTER DELETE ON facts BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS soul_generation_ai AFTER INSERT ON soul BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS soul_generation_au AFTER UPDATE ON soul BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS soul_generation_ad AFTER DELETE ON soul BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_generation_ai AFTER INSERT ON messages BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_generation_au AFTER UPDATE ON messages BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_generation_ad AFTER DELETE ON messages BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS fact_embeddings_generation_ai AFTER INSERT ON fact_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS fact_embeddings_generation_au AFTER UPDATE ON fact_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS fact_embeddings_generation_ad AFTER DELETE ON fact_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS message_embeddings_generation_ai AFTER INSERT ON message_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS message_embeddings_generation_au AFTER UPDATE ON message_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS message_embeddings_generation_ad AFTER DELETE ON message_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS fact_chunk_embeddings_generation_ai AFTER INSERT ON fact_chunk_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS fact_chunk_embeddings_generation_au AFTER UPDATE ON fact_chunk_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS fact_chunk_embeddings_generation_ad AFTER DELETE ON fact_chunk_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS message_chunk_embeddings_generation_ai AFTER INSERT ON message_chunk_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS message_chunk_embeddings_generation_au AFTER UPDATE ON message_chunk_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS message_chunk_embeddings_generation_ad AFTER DELETE ON message_chunk_embeddings BEGIN
+    UPDATE write_generation SET generation = generation + 1 WHERE id = 1;
+END;
+
+-- Near-duplicate index (see near_duplicates.py): MinHash signature per fact
+-- and its LSH band buckets
+CREATE TABLE IF NOT EXISTS fact_signatures (
+    fact_id INTEGER PRIMARY KEY,
+    signature BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS fact_signature_bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    fact_id INTEGER NOT NULL,
+    PRIMARY KEY (band, bucket, fact_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_fact_signature_bands_fact ON fact_signature_bands(fact_id);
+
+CREATE TRIGGER IF NOT EXISTS fact_signatures_ad AFTER DELETE ON fact_signatures BEGIN
+    DELETE FROM fact_signature_bands WHERE fact_id = old.fact_id;
+END;
+
+-- Signatures go stale with the content they were computed from
+CREATE TRIGGER IF NOT EXISTS facts_signatures_au AFTER UPDATE OF content ON facts BEGIN
+    DELETE FROM fact_signatures WHERE fact_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS facts_signatures_ad AFTER DELETE ON facts BEGIN
+    DELETE FROM fact_signatures WHERE fact_id = old.id;
+END;
+
+-- Near-duplicates save_fact stored side by side because their subjects
+-- differ, kept for review before `fact dedupe` merges them
+CREATE TABLE IF NOT EXISTS fact_duplicates (
+    fact_id INTEGER NOT NULL,
+    duplicate_of INTEGER NOT NULL,
+    similarity REAL NOT NULL,
+    detected_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    PRIMARY KEY (fact_id, duplicate_of)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_fact_duplicates_of ON fact_duplicates(duplicate_of);
+
+CREATE TRIGGER IF NOT EXISTS facts_duplicates_ad AFTER DELETE ON facts BEGIN
+    DELETE FROM fact_duplicates WHERE fact_id = old.id OR duplicate_of = old.id;
+END;
+
+-- Archived message segments (see archive.py): one compressed JSONL file and
+-- vector array per month, with centroids to prune segments at query time
+CREATE TABLE IF NOT EXISTS message_segments (
+    month TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    vectors_path TEXT NOT NULL,
+    message_count INTEGER NOT NULL,
+    first_message_id INTEGER,
+    last_message_id INTEGER,
+    first_timestamp TEXT,
+    last_timestamp TEXT,
+    sessions TEXT NOT NULL DEFAULT '[]',
+    embedding_model TEXT,
+    centroids BLOB,
+    min_similarities BLOB,
+    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+-- Vectors that left an embedding source (their row or their parent was
+-- deleted), so saved IVF indexes (see ann_index.py) drop them without
+-- rescanning every live id
+CREATE TABLE IF NOT EXISTS vector_removals (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    item_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_vector_removals_source ON vector_removals(source, seq);
+
+CREATE TRIGGER IF NOT EXISTS fact_embeddings_removals_ad AFTER DELETE ON fact_embeddings BEGIN
+    INSERT INTO vector_removals (source, item_id) VALUES ('facts', old.fact_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS facts_removals_ad AFTER DELETE ON facts BEGIN
+    INSERT INTO vector_removals (source, item_id) VALUES ('facts', old.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS message_embeddings_removals_ad AFTER DELETE ON message_embeddings BEGIN
+    INSERT INTO vector_removals (source, item_id) VALUES ('messages', old.message_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_removals_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO vector_removals (source, item_id) VALUES ('messages', old.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS log_chunk_embeddings_removals_ad AFTER DELETE ON log_chunk_embeddings BEGIN
+    INSERT INTO vector_removals (source, item_id) VALUES ('log_chunks', old.chunk_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS fact_chunk_embeddings_removals_ad AFTER DELETE ON fact_chunk_embeddings BEGIN
+    INSERT INTO vector_removals (source, item_id) VALUES ('fact_chunks', old.chunk_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS message_chunk_embeddings_removals_ad AFTER DELETE ON message_chunk_embeddings BEGIN
+    INSERT INTO vector_removals (source, item_id) VALUES ('message_chunks', old.chunk_id);
+END;
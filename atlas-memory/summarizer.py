@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Atlas Rolling Summarizer
+Incremental, hierarchical summaries of each session's messages.
+
+Messages after a session's last level-0 summary are folded into a new
+level-0 summary once they add up to SUMMARY_TRIGGER_TOKENS. Whenever
+SUMMARY_FANOUT summaries at one level are still open (no parent yet), they
+are folded into one summary a level up and point to it via parent_id.
+
+The open summaries form the frontier of that tree: a handful of rows that
+together cover every summarised message, oldest first. Recall reads the
+frontier plus the short unsummarised tail instead of the raw history.
+
+The summarise step is pluggable: any callable (texts, max_tokens) -> str.
+extractive_summary() is the deterministic local default; set
+ATLAS_SUMMARY_MODEL (e.g. gpt-4o-mini) to summarise with an OpenAI model.
+It always runs outside a transaction; only the finished rows are written
+under the write lock.
+"""
+
+import math
+import os
+import re
+import sqlite3
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from context_packer import count_tokens
+
+SUMMARY_TRIGGER_TOKENS = 2000
+SUMMARY_FANOUT = 4
+SUMMARY_MAX_TOKENS = 300
+# Budget for the rolling summary text (newest frontier summaries first)
+ROLLING_SUMMARY_TOKENS = 1200
+SUMMARY_MODEL = os.environ.get("ATLAS_SUMMARY_MODEL")
+
+Summarize = Callable[[Sequence[str], int], str]
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+_TERM_RE = re.compile(r'\w{3,}', re.UNICODE)
+
+
+def ensure_summary_schema(conn: sqlite3.Connection):
+    """Add level/parent_id to summaries on older databases."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(summaries)")}
+    if 'level' not in columns:
+        conn.execute("ALTER TABLE summaries ADD COLUMN level INTEGER NOT NULL DEFAULT 0")
+    if 'parent_id' not in columns:
+        conn.execute("ALTER TABLE summaries ADD COLUMN parent_id INTEGER")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_summaries_open
+        ON summaries(session_id, parent_id, level, start_message_id)
+    """)
+    conn.commit()
+
+
+# ==================== SUMMARISERS ====================
+
+def extractive_summary(texts: Sequence[str], max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """
+    Deterministic summary: the sentences with the most frequent terms,
+    in their original order, up to `max_tokens`.
+    """
+    sentences = []
+    for text in texts:
+        sentences.extend(s.strip() for s in _SENTENCE_RE.split(text) if s.strip())
+    if not sentences:
+        return ''
+    terms = [set(_TERM_RE.findall(s.lower())) for s in sentences]
+    frequency = Counter(t for sentence_terms in terms for t in sentence_terms)
+
+    def score(i: int) -> float:
+        if not terms[i]:
+            return 0.0
+        return sum(frequency[t] for t in terms[i]) / math.sqrt(len(terms[i]))
+
+    ranked = sorted(range(len(sentences)), key=lambda i: (-score(i), i))
+    chosen = []
+    used = 0
+    for i in ranked:
+        tokens = count_tokens(sentences[i])
+        if used + tokens > max_tokens:
+            continue
+        chosen.append(i)
+        used += tokens
+    if not chosen:
+        return sentences[ranked[0]][:max_tokens * 4]
+    return ' '.join(sentences[i] for i in sorted(chosen))
+
+
+def openai_summarizer(client, model: str) -> Summarize:
+    """Summarise with an OpenAI chat model, falling back to extractive on errors."""
+    def summarize(texts: Sequence[str], max_tokens: int) -> str:
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                max_tokens=max_tokens,
+                messages=[
+                    {"role": "system", "content": (
+                        "Summarise this conversation excerpt for long-term memory. "
+                        "Keep decisions, facts, names, open tasks and preferences. "
+                        f"Plain prose, under {max_tokens} tokens."
+                    )},
+                    {"role": "user", "content": "\n\n".join(texts)},
+                ],
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"[Memory] Summary model failed, using extractive summary: {e}")
+            return extractive_summary(texts, max_tokens)
+    return summarize
+
+
+# ==================== ROLLING SUMMARIES ====================
+
+class RollingSummarizer:
+    """Maintains the per-session summary tree in the `summaries` table."""
+
+    def __init__(self, conn: sqlite3.Connection, summarize: Optional[Summarize] = None,
+                 trigger_tokens: int = SUMMARY_TRIGGER_TOKENS, fanout: int = SUMMARY_FANOUT,
+                 max_tokens: int = SUMMARY_MAX_TOKENS):
+        self.conn = conn
+        self.summarize = summarize or extractive_summary
+        self.trigger_tokens = trigger_tokens
+        self.fanout = fanout
+        self.max_tokens = max_tokens
+
+    def last_summarized(self, session_id: str) -> int:
+        """Highest message id already covered by a level-0 summary."""
+        row = self.conn.execute(
+            "SELECT MAX(end_message_id) FROM summaries WHERE session_id = ? AND level = 0",
+            (session_id,)
+        ).fetchone()
+        return row[0] or 0
+
+    def pending_tokens(self, session_id: str) -> int:
+        """Tokens in messages not yet covered by a summary."""
+        row = self.conn.execute(
+            """SELECT COALESCE(SUM(COALESCE(token_count, LENGTH(content) / 4)), 0)
+               FROM messages WHERE session_id = ? AND id > ?""",
+            (session_id, self.last_summarized(session_id))
+        ).fetchone()
+        return row[0]
+
+    def _insert(self, session_id: str, level: int, start_id: int, end_id: int, content: str) -> int:
+        cursor = self.conn.execute(
+            """INSERT INTO summaries (session_id, level, start_message_id, end_message_id,
+                                      content, token_count)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (session_id, level, start_id, end_id, content, count_tokens(content))
+        )
+        return cursor.lastrowid
+
+    def _message_windows(self, session_id: str, after: int) -> List[Tuple[int, int, List[str]]]:
+        """Full windows of messages after `after` as (start_id, end_id, texts)."""
+        rows = self.conn.execute(
+            """SELECT id, role, content, COALESCE(token_count, LENGTH(content) / 4)
+               FROM messages WHERE session_id = ? AND id > ? ORDER BY id""",
+            (session_id, after)
+        ).fetchall()
+        windows = []
+        window = []
+        tokens = 0
+        for message_id, role, content, message_tokens in rows:
+            speaker = "User" if role == 'user' else "Atlas"
+            window.append((message_id, f"{speaker}: {content}"))
+            tokens += message_tokens
+            if tokens >= self.trigger_tokens:
+                windows.append((window[0][0], window[-1][0], [text for _, text in window]))
+                window = []
+                tokens = 0
+        return windows
+
+    def _write(self, apply: Callable[[], int]) -> int:
+        """Run `apply` in its own short write transaction."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            written = apply()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        return written
+
+    def _summarize_messages(self, session_id: str) -> int:
+        """Write level-0 summaries for every full window of new messages."""
+        after = self.last_summarized(session_id)
+        summaries = [
+            (start_id, end_id, self.summarize(texts, self.max_tokens))
+            for start_id, end_id, texts in self._message_windows(session_id, after)
+        ]
+        if not summaries:
+            return 0
+
+        def write() -> int:
+            # Another writer summarised these messages while we were busy
+            if self.last_summarized(session_id) != after:
+                return 0
+            for start_id, end_id, summary in summaries:
+                self._insert(session_id, 0, start_id, end_id, summary)
+            return len(summaries)
+
+        return self._write(write)
+
+    def _fold(self, session_id: str) -> int:
+        """
+        Fold full groups of open summaries into the level above. Only level 0
+        gains rows between calls, so the cascade stops at the first level
+        that is not full.
+        """
+        written = 0
+        level = 0
+        while True:
+            rows = self.conn.execute(
+                """SELECT id, start_message_id, end_message_id, content FROM summaries
+                   WHERE session_id = ? AND parent_id IS NULL AND level = ?
+                   ORDER BY start_message_id""",
+                (session_id, level)
+            ).fetchall()
+            if len(rows) < self.fanout:
+                return written
+            parents = []
+            for start in range(0, len(rows) - self.fanout + 1, self.fanout):
+                group = rows[start:start + self.fanout]
+                parents.append((group, self.summarize([r[3] for r in group], self.max_tokens)))
+            written += self._write(lambda: self._write_parents(session_id, level, parents))
+            level += 1
+
+    def _write_parents(self, session_id: str, level: int, parents: List[Tuple[List, str]]) -> int:
+        """Insert folded summaries whose children are all still open."""
+        written = 0
+        for group, summary in parents:
+            ids = [r[0] for r in group]
+            still_open = self.conn.execute(
+                f"""SELECT COUNT(*) FROM summaries
+                    WHERE id IN ({','.join('?' * len(ids))}) AND parent_id IS NULL""",
+                ids
+            ).fetchone()[0]
+            if still_open != len(ids):
+                continue
+            parent_id = self._insert(session_id, level + 1, group[0][1], group[-1][2], summary)
+            self.conn.executemany(
+                "UPDATE summaries SET parent_id = ? WHERE id = ?",
+                [(parent_id, child_id) for child_id in ids]
+            )
+            written += 1
+        return written
+
+    def update(self, session_id: str = "main") -> Dict[str, int]:
+        """
+        Summarise new messages and fold full levels. Summaries are built with
+        no transaction open and each batch is written in a short one, so a
+        slow summary model never holds the write lock.
+        """
+        if self.conn.in_transaction:
+            self.conn.commit()
+        leaves = self._summarize_messages(session_id)
+        folded = self._fold(session_id) if leaves else 0
+        return {'summaries': leaves, 'folded': folded}
+
+    def maybe_update(self, session_id: str = "main") -> Optional[Dict[str, int]]:
+        """update() only once the unsummarised tail crosses the trigger."""
+        if self.pending_tokens(session_id) < self.trigger_tokens:
+            return None
+        return self.update(session_id)
+
+    def frontier(self, session_id: str = "main") -> List[Dict]:
+        """Open summaries of a session, oldest first (they cover all summarised messages)."""
+        rows = self.conn.execute(
+            """SELECT id, level, start_message_id, end_message_id, content, token_count
+               FROM summaries WHERE session_id = ? AND parent_id IS NULL
+               ORDER BY start_message_id""",
+            (session_id,)
+        ).fetchall()
+        return [
+            {'id': r[0], 'level': r[1], 'start_message_id': r[2],
+             'end_message_id': r[3], 'content': r[4], 'token_count': r[5]}
+            for r in rows
+        ]
+
+    def recall(self, session_id: str = "main") -> Dict:
+        """Frontier summaries plus the unsummarised tail of the session."""
+        summaries = self.frontier(session_id)
+        tail = self.conn.execute(
+            """SELECT id, role, content, timestamp FROM messages
+               WHERE session_id = ? AND id > ? ORDER BY id""",
+            (session_id, self.last_summarized(session_id))
+        ).fetchall()
+        return {
+            'session_id': session_id,
+            'summaries': summaries,
+            'messages': [
+                {'id': r[0], 'role': r[1], 'content': r[2], 'timestamp': r[3]} for r in tail
+            ],
+        }
+
+
+def default_summarizer(client_factory: Optional[Callable] = None) -> Summarize:
+    """OpenAI summaries when ATLAS_SUMMARY_MODEL is set, extractive otherwise."""
+    if SUMMARY_MODEL and client_factory is not None:
+        try:
+            return openai_summarizer(client_factory(), SUMMARY_MODEL)
+        except Exception as e:
+            print(f"[Memory] Summary model unavailable, using extractive summaries: {e}")
+    return extractive_summary
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Atlas Vector Engine
+Resident, pre-normalised embedding matrix for fast semantic recall.
+
+All embeddings of one table live in a single matrix (one row per item,
+L2-normalised at load time) next to an int64 id array. A query is scored
+with one matrix-vector product and the top-k is selected with argpartition,
+so recall no longer walks every BLOB in Python.
+
+The matrix can be held as float32, float16 or int8 (per-row scale). Compact
+matrices score candidates approximately; the top `k * rerank_factor` are then
+re-scored against full-precision vectors fetched through the `rerank` hook.
+"""
+
+import sqlite3
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+STORAGE_DTYPES = ('float32', 'float16', 'int8')
+# Candidates re-scored exactly per requested result in compact modes
+RERANK_FACTOR = 4
+# Rows dequantised at a time while scoring compact matrices
+SCORE_BLOCK_ROWS = 8192
+
+
+def blob_to_vector(data: bytes) -> np.ndarray:
+    """View a float32 embedding BLOB as a numpy array (no copy)."""
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def normalize(vector) -> np.ndarray:
+    """Return a float32 unit vector (zero vectors stay zero)."""
+    v = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else v
+
+
+def quantize(vector: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[float]]:
+    """Encode a float32 vector as `dtype`. int8 uses a symmetric per-vector scale."""
+    if dtype == 'float32':
+        return np.asarray(vector, dtype=np.float32), None
+    if dtype == 'float16':
+        return np.asarray(vector, dtype=np.float16), None
+    if dtype == 'int8':
+        peak = float(np.max(np.abs(vector))) if len(vector) else 0.0
+        scale = peak / 127.0 if peak else 1.0
+        return np.clip(np.rint(vector / scale), -127, 127).astype(np.int8), scale
+    raise ValueError(f"Unknown embedding dtype: {dtype}")
+
+
+def decode_vector(data: bytes, dtype: str = 'float32', scale: Optional[float] = None) -> np.ndarray:
+    """Decode a stored embedding BLOB of any storage dtype to float32."""
+    if dtype in (None, 'float32'):
+        return blob_to_vector(data)
+    if dtype == 'float16':
+        return np.frombuffer(data, dtype=np.float16).astype(np.float32)
+    if dtype == 'int8':
+        return np.frombuffer(data, dtype=np.int8).astype(np.float32) * np.float32(scale or 1.0)
+    raise ValueError(f"Unknown embedding dtype: {dtype}")
+
+
+class VectorEngine:
+    """In-memory matrix of unit-length embeddings keyed by row id."""
+
+    def __init__(self, dimensions: int = 1536, dtype: str = 'float32',
+                 rerank: Optional[Callable[[List[int]], Dict[int, np.ndarray]]] = None,
+                 rerank_factor: int = RERANK_FACTOR):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown embedding dtype: {dtype}")
+        self.dimensions = dimensions
+        self.dtype = dtype
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+        self._size = 0
+        self._ids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, dimensions), dtype=dtype)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._positions: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, item_id: int) -> bool:
+        return int(item_id) in self._positions
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Ids of the stored vectors, aligned with `matrix` rows."""
+        return self._ids[:self._size]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The (n, dimensions) matrix of unit vectors, as float32."""
+        matrix = self._matrix[:self._size]
+        if self.dtype == 'float32':
+            return matrix
+        if self.dtype == 'int8':
+            return matrix.astype(np.float32) * self._scales[:self._size, None]
+        return matrix.astype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        """Resident size of the vector matrix."""
+        return int(self._matrix[:self._size].nbytes + self._scales[:self._size].nbytes)
+
+    @classmethod
+    def from_query(cls, conn: sqlite3.Connection, sql: str,
+                   dimensions: int = 1536, **kwargs) -> "VectorEngine":
+        """
+        Build an engine from a query returning (id, embedding) or
+        (id, embedding, dtype, scale) rows.
+        """
+        engine = cls(dimensions, **kwargs)
+        engine.load(conn.execute(sql).fetchall())
+        return engine
+
+    def load(self, rows: Iterable[tuple]):
+        """Replace the engine contents with (id, BLOB[, dtype, scale]) rows."""
+        ids = []
+        vectors = []
+        scales = []
+        for item_id, blob, *fmt in rows:
+            row_dtype = (fmt[0] if fmt else None) or 'float32'
+            row_scale = fmt[1] if len(fmt) > 1 else None
+            if len(blob) != self.dimensions * np.dtype(row_dtype).itemsize:
+                continue
+            if row_dtype == self.dtype == 'float32':
+                vectors.append(blob_to_vector(blob))
+                scales.append(1.0)
+            elif row_dtype == self.dtype:
+                # Stored compact rows are already unit vectors in our format
+                vectors.append(np.frombuffer(blob, dtype=row_dtype))
+                scales.append(row_scale if row_scale is not None else 1.0)
+            else:
+                vector, scale = quantize(normalize(decode_vector(blob, row_dtype, row_scale)), self.dtype)
+                vectors.append(vector)
+                scales.append(scale if scale is not None else 1.0)
+            ids.append(item_id)
+
+        if vectors:
+            matrix = np.vstack(vectors)
+            if self.dtype == 'float32':
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                matrix /= norms
+        else:
+            matrix = np.empty((0, self.dimensions), dtype=self.dtype)
+
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._matrix = matrix
+        self._scales = np.asarray(scales, dtype=np.float32)
+        self._size = len(ids)
+        self._positions = {int(i): pos for pos, i in enumerate(self._ids)}
+
+    def _reserve(self, capacity: int):
+        """Grow the backing arrays geometrically so appends are amortised O(1)."""
+        if capacity <= len(self._ids):
+            return
+        capacity = max(capacity, 2 * len(self._ids), 64)
+        ids = np.empty(capacity, dtype=np.int64)
+        matrix = np.empty((capacity, self.dimensions), dtype=self.dtype)
+        scales = np.ones(capacity, dtype=np.float32)
+        ids[:self._size] = self._ids[:self._size]
+        matrix[:self._size] = self._matrix[:self._size]
+        scales[:self._size] = self._scales[:self._size]
+        self._ids = ids
+        self._matrix = matrix
+        self._scales = scales
+
+    def upsert(self, item_id: int, embedding):
+        """Insert or replace the vector for `item_id`."""
+        vector = normalize(embedding)
+        if len(vector) != self.dimensions:
+            return
+        stored, scale = quantize(vector, self.dtype)
+        item_id = int(item_id)
+        pos = self._positions.get(item_id)
+        if pos is None:
+            self._reserve(self._size + 1)
+            pos = self._size
+            self._ids[pos] = item_id
+            self._positions[item_id] = pos
+            self._size += 1
+        self._matrix[pos] = stored
+        self._scales[pos] = scale if scale is not None else 1.0
+
+    def remove(self, item_id: int) -> bool:
+        """Drop `item_id` from the engine. Returns True if it was present."""
+        pos = self._positions.pop(int(item_id), None)
+        if pos is None:
+            return False
+        # Swap the last row into the hole so removal stays O(dimensions)
+        last = self._size - 1
+        if pos != last:
+            self._ids[pos] = self._ids[last]
+            self._matrix[pos] = self._matrix[last]
+            self._scales[pos] = self._scales[last]
+            self._positions[int(self._ids[pos])] = pos
+        self._size = last
+        return True
+
+    def get(self, item_id: int) -> Optional[np.ndarray]:
+        """Return the stored unit vector for `item_id` (float32), if any."""
+        pos = self._positions.get(int(item_id))
+        if pos is None:
+            return None
+        vector = self._matrix[pos].astype(np.float32)
+        return vector * self._scales[pos] if self.dtype == 'int8' else vector
+
+    def _exact_vectors(self, item_ids: List[int]) -> Dict[int, np.ndarray]:
+        """Full-precision unit vectors for re-ranking (compact modes only)."""
+        if self.rerank is None or self.dtype == 'float32' or not item_ids:
+            return {}
+        return {i: normalize(v) for i, v in self.rerank(item_ids).items()}
+
+    def similarities(self, query, item_ids: Iterable[int]) -> Dict[int, float]:
+        """Cosine similarity of `query` against just the given ids."""
+        present = [int(i) for i in item_ids if int(i) in self._positions]
+        if not present:
+            return {}
+        q = normalize(query)
+        exact = self._exact_vectors(present)
+        out = {}
+        for item_id in present:
+            vector = exact.get(item_id)
+            if vector is None:
+                vector = self.get(item_id)
+            out[item_id] = float(vector @ q)
+        return out
+
+    def scores(self, query) -> np.ndarray:
+        """Cosine similarity of `query` against every stored vector."""
+        q = normalize(query)
+        if self.dtype == 'float32':
+            return self._matrix[:self._size] @ q
+        out = np.empty(self._size, dtype=np.float32)
+        for start in range(0, self._size, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, self._size)
+            out[start:end] = self._matrix[start:end].astype(np.float32) @ q
+        if self.dtype == 'int8':
+            out *= self._scales[:self._size]
+        return out
+
+    def search(self, query, k: int = 10, min_score: float = -1.0,
+               candidates: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Return up to `k` (id, similarity) pairs, best first.
+        If `candidates` is given, only those ids are eligible.
+        """
+        if self._size == 0 or k <= 0:
+            return []
+
+        scores = self.scores(query)
+        if candidates is not None:
+            mask = np.isin(self.ids, np.fromiter(candidates, dtype=np.int64))
+            scores = np.where(mask, scores, -np.inf)
+
+        compact = self.dtype != 'float32' and self.rerank is not None
+        fetch = min(k * self.rerank_factor if compact else k, len(scores))
+        top = np.argpartition(-scores, fetch - 1)[:fetch]
+        top = top[np.isfinite(scores[top])]
+
+        if compact:
+            exact = self.similarities(query, self.ids[top].tolist())
+            ranked = sorted(exact.items(), key=lambda x: x[1], reverse=True)[:k]
+            return [(i, s) for i, s in ranked if s >= min_score]
+
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(self.ids[pos]), float(scores[pos]))
+            for pos in top
+            if scores[pos] >= min_score
+        ]
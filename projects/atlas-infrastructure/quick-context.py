@@ -15,7 +15,6 @@ Run at session start to reduce ramp-up time.
 import os
 import sys
 import json
-import sqlite3
 from datetime import datetime, timedelta
 from pathlib import Path
 
@@ -24,6 +23,9 @@ MEMORY_DIR = CLAWD_ROOT / "memory"
 ATLAS_MEMORY_DB = CLAWD_ROOT / "atlas-memory" / "atlas_memory.db"
 LEARNINGS_DIR = CLAWD_ROOT / ".learnings"
 
+sys.path.insert(0, str(ATLAS_MEMORY_DB.parent))
+from connections import connect
+
 def get_recent_memory_files(days=3):
     """Get memory files from the last N days."""
     files = []
@@ -55,7 +57,7 @@ def get_soul_summary():
     if not ATLAS_MEMORY_DB.exists():
         return {}
     
-    conn = sqlite3.connect(ATLAS_MEMORY_DB)
+    conn = connect(ATLAS_MEMORY_DB)
     cur = conn.cursor()
     aspects = {}
     for row in cur.execute('SELECT aspect, substr(content, 1, 150) FROM soul'):
@@ -68,7 +70,7 @@ def get_recent_facts(limit=5):
     if not ATLAS_MEMORY_DB.exists():
         return []
     
-    conn = sqlite3.connect(ATLAS_MEMORY_DB)
+    conn = connect(ATLAS_MEMORY_DB)
     cur = conn.cursor()
     facts = []
     for row in cur.execute('''
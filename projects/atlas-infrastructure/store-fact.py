@@ -14,34 +14,40 @@ Examples:
 """
 
 import sys
-import sqlite3
 from datetime import datetime
 from pathlib import Path
 
 ATLAS_MEMORY_DB = Path.home() / "clawd" / "atlas-memory" / "atlas_memory.db"
 
+sys.path.insert(0, str(ATLAS_MEMORY_DB.parent))
+from connections import connect
+from near_duplicates import (
+    ensure_dedupe_schema, find_near_duplicates, index_fact, record_duplicates,
+    same_subject_duplicate, sync_signatures
+)
+
 def store_fact(category: str, subject: str, content: str, source: str = "manual"):
     """Store a fact in the atlas-memory database."""
     if not ATLAS_MEMORY_DB.exists():
         print(f"Error: Database not found at {ATLAS_MEMORY_DB}")
         return False
     
-    conn = sqlite3.connect(ATLAS_MEMORY_DB)
+    conn = connect(ATLAS_MEMORY_DB)
     cur = conn.cursor()
     
-    # Check for duplicates (same category + subject + similar content)
-    cur.execute('''
-        SELECT id, content FROM facts 
-        WHERE category = ? AND subject = ?
-    ''', (category, subject))
-    
-    existing = cur.fetchall()
-    for row in existing:
-        if content.lower() in row[1].lower() or row[1].lower() in content.lower():
-            print(f"⚠️  Similar fact already exists (id={row[0]})")
-            print(f"   Existing: {row[1][:80]}...")
-            conn.close()
-            return False
+    # Check for near-duplicates of the same subject (MinHash/LSH index lookup)
+    ensure_dedupe_schema(conn)
+    sync_signatures(conn)
+    duplicates = find_near_duplicates(conn, content, category=category)
+    fact_id = same_subject_duplicate(conn, subject, duplicates)
+    if fact_id is not None:
+        score = dict(duplicates)[fact_id]
+        existing = cur.execute("SELECT content FROM facts WHERE id = ?", (fact_id,)).fetchone()[0]
+        print(f"⚠️  Similar fact already exists (id={fact_id}, similarity={score:.2f})")
+        print(f"   Existing: {existing[:80]}...")
+        conn.commit()
+        conn.close()
+        return False
     
     # Insert new fact
     cur.execute('''
@@ -50,6 +56,10 @@ def store_fact(category: str, subject: str, content: str, source: str = "manual"
     ''', (category, subject, content, source))
     
     fact_id = cur.lastrowid
+    if duplicates:
+        # Similar wording under another subject; left to `fact dedupe` for review
+        record_duplicates(conn, fact_id, duplicates)
+    index_fact(conn, fact_id, content)
     conn.commit()
     conn.close()
     
@@ -65,7 +75,7 @@ def list_categories():
     if not ATLAS_MEMORY_DB.exists():
         return []
     
-    conn = sqlite3.connect(ATLAS_MEMORY_DB)
+    conn = connect(ATLAS_MEMORY_DB)
     cur = conn.cursor()
     categories = [row[0] for row in cur.execute('SELECT DISTINCT category FROM facts')]
     conn.close()
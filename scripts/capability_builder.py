@@ -8,10 +8,10 @@ Based on:
 - CASCADE skill acquisition pattern
 """
 
-import sqlite3
 import json
 import os
 import subprocess
+import sys
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, Dict, List, Any
@@ -21,6 +21,9 @@ DB_PATH = CLAWD_DIR / "atlas-memory" / "atlas_memory.db"
 SKILLS_DIR = CLAWD_DIR / "skills"
 SCRIPTS_DIR = CLAWD_DIR / "scripts"
 
+sys.path.insert(0, str(CLAWD_DIR / "atlas-memory"))
+from connections import connect
+
 
 class CapabilityBuilder:
     """
@@ -44,7 +47,7 @@ class CapabilityBuilder:
     
     def _ensure_tables(self):
         """Create necessary database tables."""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         cur.execute("""
@@ -160,7 +163,7 @@ class CapabilityBuilder:
     
     def _log_gap(self, gap: Dict) -> int:
         """Log a capability gap to the database."""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         cur.execute("""
@@ -488,7 +491,7 @@ if __name__ == "__main__":
     
     def _register_capability(self, build_result: Dict, gap: Dict):
         """Register the new capability in the system."""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         # Add to built_capabilities
@@ -556,7 +559,7 @@ if __name__ == "__main__":
     
     def get_open_gaps(self) -> List[Dict]:
         """Get all unresolved capability gaps."""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         cur.execute("""
@@ -583,7 +586,7 @@ if __name__ == "__main__":
     
     def get_built_capabilities(self) -> List[Dict]:
         """Get all capabilities we've built."""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         cur.execute("""
@@ -13,6 +13,7 @@ import sqlite3
 import json
 import os
 import shutil
+import sys
 import hashlib
 from pathlib import Path
 from datetime import datetime
@@ -23,6 +24,9 @@ CLAWD_DIR = Path(__file__).parent.parent
 DB_PATH = CLAWD_DIR / "atlas-memory" / "atlas_memory.db"
 ROLLBACK_DIR = CLAWD_DIR / ".rollback"
 
+sys.path.insert(0, str(CLAWD_DIR / "atlas-memory"))
+from connections import connect
+
 # Confidence thresholds
 THRESHOLD_LOG_ONLY = 0.5
 THRESHOLD_REVIEW = 0.7
@@ -65,7 +69,7 @@ class GodelAgent:
     
     def _ensure_tables(self):
         """Create necessary database tables."""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         # Self-improvements tracking
@@ -172,7 +176,7 @@ class GodelAgent:
     
     def _get_improvement_stats(self) -> Dict[str, Any]:
         """Get statistics on self-improvements."""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         stats = {}
@@ -335,7 +339,7 @@ class GodelAgent:
     
     def _log_improvement(self, **kwargs):
         """Log an improvement to the database."""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         cur.execute("""
@@ -516,7 +520,7 @@ class GodelAgent:
             'metrics': {}
         }
         
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         # Analyze recent improvements
@@ -559,7 +563,7 @@ class GodelAgent:
     
     def _adjust_threshold(self, metric: str, new_value: float, reason: str):
         """Log a meta-improvement adjustment."""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         cur.execute("""
@@ -10,16 +10,33 @@ Based on:
 
 import sqlite3
 import json
-import os
 import struct
+import sys
+import threading
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, Dict, List, Any, Tuple
-import urllib.request
+
+import numpy as np
 
 CLAWD_DIR = Path(__file__).parent.parent
 DB_PATH = CLAWD_DIR / "atlas-memory" / "atlas_memory.db"
 
+sys.path.insert(0, str(CLAWD_DIR / "atlas-memory"))
+import embeddings
+from ann_index import IVFIndex, open_vector_index, sync_index
+from connections import connect, get_database
+from context_cache import write_generation
+from embedding_providers import get_provider
+from link_graph import cached_graph, ensure_link_graph_schema, fact_texts, traverse_sql
+from link_stats import ensure_link_stats_schema, link_type_counts, orphan_facts, top_hubs
+from embedding_store import (
+    delete_embeddings, ensure_storage_schema, load_engine, matches_embedding_model,
+    use_embedding_model, write_embeddings
+)
+from knn_links import KNN_NEIGHBORS, KNN_THRESHOLD, knn_pairs, relink_watermark, set_relink_watermark
+from near_duplicates import ensure_dedupe_schema, index_fact
+
 # Link types (inspired by Zettelkasten)
 LINK_TYPES = {
     'related': 'Loosely related concepts',
@@ -31,6 +48,9 @@ LINK_TYPES = {
     'example': 'Is an example of'
 }
 
+# Source words that make a link 'contradicts' when the target shares its opening words
+CONTRADICTION_WORDS = ['however', 'but', 'contrary', 'unlike', 'opposite']
+
 
 class MemoryEvolution:
     """
@@ -45,11 +65,17 @@ class MemoryEvolution:
     
     def __init__(self, db_path: Path = DB_PATH):
         self.db_path = Path(db_path)
+        # Pooled readers and the process-wide group-committing writer
+        self.db = get_database(self.db_path)
+        # Resident fact vector index and the write generation it reflects
+        self._fact_index = None
+        self._fact_index_generation = None
+        self._fact_index_lock = threading.Lock()
         self._ensure_tables()
     
     def _ensure_tables(self):
         """Create necessary database tables."""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         # Memory links table
@@ -92,42 +118,23 @@ class MemoryEvolution:
             ON memory_links(target_fact_id)
         """)
         
+        # Embedding dtype/scale columns used by write_embeddings
+        ensure_storage_schema(conn)
+        # Near-duplicate index kept in step with the facts we write
+        ensure_dedupe_schema(conn)
+        # Link generation counter that keeps graph snapshots fresh
+        ensure_link_graph_schema(conn)
+        # Degree and link-type counters behind get_graph_stats / prune_obsolete
+        ensure_link_stats_schema(conn)
+        
         conn.commit()
         conn.close()
     
     # ==================== EMBEDDING UTILITIES ====================
     
-    def _get_embedding(self, text: str) -> List[float]:
-        """Get embedding from OpenAI API."""
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            env_file = Path.home() / '.clawdbot' / '.env'
-            if env_file.exists():
-                for line in env_file.read_text().split('\n'):
-                    if line.startswith('OPENAI_API_KEY='):
-                        api_key = line.split('=', 1)[1].strip().strip('"\'')
-                        break
-        
-        if not api_key:
-            raise ValueError("No OPENAI_API_KEY found")
-        
-        data = json.dumps({
-            "model": "text-embedding-3-small",
-            "input": text[:8000]
-        }).encode()
-        
-        req = urllib.request.Request(
-            "https://api.openai.com/v1/embeddings",
-            data=data,
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-        )
-        
-        with urllib.request.urlopen(req) as resp:
-            result = json.loads(resp.read())
-            return result['data'][0]['embedding']
+    def _get_embedding(self, text: str, conn: Optional[sqlite3.Connection] = None) -> List[float]:
+        """Embed with the configured provider (through the shared embedding cache)."""
+        return embeddings.get_embedding(text, conn=conn, db_path=self.db_path)
     
     def _embedding_to_blob(self, embedding: List[float]) -> bytes:
         """Convert embedding list to bytes for storage."""
@@ -138,6 +145,23 @@ class MemoryEvolution:
         n = len(blob) // 4
         return list(struct.unpack(f'{n}f', blob))
     
+    def _fact_vectors(self, conn: sqlite3.Connection, dimensions: int):
+        """
+        The resident fact vector index (exact matrix or IVF), reloaded, or
+        synced for IVF, only when the write generation has moved (caller holds
+        _fact_index_lock).
+        """
+        generation = write_generation(conn)
+        if (self._fact_index is not None and generation is not None
+                and generation == self._fact_index_generation):
+            return self._fact_index
+        if isinstance(self._fact_index, IVFIndex):
+            sync_index(conn, self._fact_index, 'facts')
+        else:
+            self._fact_index = open_vector_index(conn, self.db_path, 'facts', dimensions)
+        self._fact_index_generation = generation
+        return self._fact_index
+    
     def _cosine_similarity(self, a: List[float], b: List[float]) -> float:
         """Calculate cosine similarity between two embeddings."""
         dot = sum(x*y for x, y in zip(a, b))
@@ -167,8 +191,17 @@ class MemoryEvolution:
             'related_facts': []
         }
         
-        conn = sqlite3.connect(self.db_path)
+        # Generate the embedding before taking the write lock
+        try:
+            embedding = self._get_embedding(f"{subject}: {content}")
+        except Exception as e:
+            print(f"Warning: Could not generate embedding: {e}")
+            embedding = None
+        
+        conn = connect(self.db_path)
         cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        generation = write_generation(conn)
         
         # Add the fact
         cur.execute("""
@@ -178,22 +211,28 @@ class MemoryEvolution:
         
         fact_id = cur.lastrowid
         result['fact_id'] = fact_id
-        
-        # Generate and store embedding
-        try:
-            embedding = self._get_embedding(f"{subject}: {content}")
-            emb_blob = self._embedding_to_blob(embedding)
-            
-            cur.execute("""
-                INSERT INTO fact_embeddings (fact_id, embedding)
-                VALUES (?, ?)
-            """, (fact_id, emb_blob))
-        except Exception as e:
-            print(f"Warning: Could not generate embedding: {e}")
-            embedding = None
-        
+        index_fact(conn, fact_id, content)
+        
+        # Store the embedding
+        if embedding:
+            try:
+                use_embedding_model(conn, get_provider().tag)
+                write_embeddings(conn, 'facts', [(fact_id, embedding)])
+            except Exception as e:
+                print(f"Warning: Could not store embedding: {e}")
+                embedding = None
+        
+        written = write_generation(conn)
         conn.commit()
         
+        # Nobody else wrote in between: apply our row to the resident index
+        if embedding:
+            with self._fact_index_lock:
+                if (self._fact_index is not None and generation is not None
+                        and generation == self._fact_index_generation):
+                    self._fact_index.upsert(fact_id, embedding)
+                    self._fact_index_generation = written
+        
         # Auto-link to related facts
         if auto_link and embedding:
             related = self._find_related_facts_by_embedding(
@@ -204,14 +243,17 @@ class MemoryEvolution:
             )
             result['related_facts'] = related
             
+            # Queue every link before waiting so they share one group commit
+            pending = []
             for rel in related:
                 link_type = self._determine_link_type(content, rel['content'])
-                link = self.create_link(
-                    fact_id, 
-                    rel['id'], 
-                    link_type,
-                    strength=rel['similarity']
-                )
+                pending.append(self.db.submit(
+                    lambda c, rel=rel, link_type=link_type: self._write_link(
+                        c, fact_id, rel['id'], link_type, rel['similarity'], True
+                    )
+                ))
+            for future in pending:
+                link = future.result()
                 if link:
                     result['links_created'].append(link)
         
@@ -226,32 +268,36 @@ class MemoryEvolution:
         limit: int = 10
     ) -> List[Dict]:
         """Find facts similar to the query embedding."""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
-        # Get all facts with embeddings
-        cur.execute("""
-            SELECT f.id, f.category, f.subject, f.content, fe.embedding
-            FROM facts f
-            JOIN fact_embeddings fe ON f.id = fe.fact_id
-            WHERE f.id != ?
-        """, (exclude_id or -1,))
-        
-        results = []
-        for fact_id, category, subject, content, emb_blob in cur.fetchall():
-            fact_emb = self._blob_to_embedding(emb_blob)
-            similarity = self._cosine_similarity(query_embedding, fact_emb)
+        with self.db.reader() as conn:
+            cur = conn.cursor()
             
-            if similarity >= threshold:
-                results.append({
-                    'id': fact_id,
-                    'category': category,
-                    'subject': subject,
-                    'content': content,
-                    'similarity': similarity
-                })
-        
-        conn.close()
+            # Nearest neighbours from the vector index (exact matrix or IVF)
+            provider = get_provider()
+            hits = []
+            if matches_embedding_model(conn, provider.tag):
+                with self._fact_index_lock:
+                    hits = self._fact_vectors(conn, provider.dimensions).search(
+                        query_embedding, k=limit + 1, min_score=threshold
+                    )
+            scores = {fact_id: sim for fact_id, sim in hits if fact_id != exclude_id}
+            
+            results = []
+            if scores:
+                placeholders = ','.join('?' * len(scores))
+                cur.execute(f"""
+                    SELECT id, category, subject, content
+                    FROM facts
+                    WHERE id IN ({placeholders})
+                """, list(scores))
+                
+                for fact_id, category, subject, content in cur.fetchall():
+                    results.append({
+                        'id': fact_id,
+                        'category': category,
+                        'subject': subject,
+                        'content': content,
+                        'similarity': scores[fact_id]
+                    })
         
         # Sort by similarity
         results.sort(key=lambda x: x['similarity'], reverse=True)
@@ -270,8 +316,7 @@ class MemoryEvolution:
         target_lower = target_content.lower()
         
         # Check for contradiction indicators
-        contradiction_words = ['however', 'but', 'contrary', 'unlike', 'opposite']
-        if any(w in source_lower for w in contradiction_words):
+        if any(w in source_lower for w in CONTRADICTION_WORDS):
             if any(word in target_lower for word in source_lower.split()[:5]):
                 return 'contradicts'
         
@@ -298,6 +343,99 @@ class MemoryEvolution:
         # Default to related
         return 'related'
     
+    def _link_types(self, pairs: List[Tuple[int, int]], contents: Dict[int, str]) -> List[str]:
+        """_determine_link_type for many (source, target) pairs, classifying each source once."""
+        by_source = {}
+        types = []
+        for source_id, target_id in pairs:
+            if source_id not in by_source:
+                source = contents[source_id]
+                # Only the contradiction check depends on the target
+                if any(w in source.lower() for w in CONTRADICTION_WORDS):
+                    by_source[source_id] = None
+                else:
+                    by_source[source_id] = self._determine_link_type(source, '')
+            types.append(
+                by_source[source_id]
+                or self._determine_link_type(contents[source_id], contents[target_id])
+            )
+        return types
+    
+    # ==================== BULK LINKING ====================
+    
+    def relink(
+        self,
+        incremental: bool = True,
+        k: int = KNN_NEIGHBORS,
+        threshold: float = KNN_THRESHOLD
+    ) -> Dict[str, Any]:
+        """
+        Link facts to their k nearest neighbours in one pass (see knn_links.py).
+        Incremental runs only query facts embedded since the last relink; the
+        first run, or incremental=False, covers every fact. Links are upserted
+        in one transaction: a pair already linked either way is left alone
+        unless the new similarity is stronger.
+        """
+        provider = get_provider()
+        with self.db.reader() as conn:
+            if not matches_embedding_model(conn, provider.tag):
+                return {'error': f"Stored fact embeddings are not {provider.tag}"}
+            
+            conn.execute("BEGIN")
+            watermark = relink_watermark(conn) if incremental else None
+            max_rowid = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM fact_embeddings"
+            ).fetchone()[0]
+            engine = load_engine(conn, 'facts', provider.dimensions, dtype='float32')
+            ids = engine.ids
+            if watermark is None:
+                queries = np.arange(len(ids))
+            else:
+                changed = [row[0] for row in conn.execute(
+                    "SELECT fact_id FROM fact_embeddings WHERE id > ?", (watermark,)
+                )]
+                queries = np.flatnonzero(np.isin(ids, changed))
+            sources, targets, sims = knn_pairs(ids, engine.matrix, queries, k, threshold)
+            texts = fact_texts(conn, np.union1d(sources, targets).tolist())
+            conn.rollback()
+        
+        pairs = list(zip(sources.tolist(), targets.tolist()))
+        types = self._link_types(pairs, {fact_id: text[1] for fact_id, text in texts.items()})
+        rows = [
+            (source_id, target_id, link_type, round(float(sim), 4))
+            for (source_id, target_id), link_type, sim in zip(pairs, types, sims)
+        ]
+        
+        def write(conn: sqlite3.Connection) -> Dict[str, int]:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM memory_links").fetchone()[0]
+            changed = conn.executemany("""
+                INSERT INTO memory_links
+                (source_fact_id, target_fact_id, link_type, strength, bidirectional)
+                SELECT ?1, ?2, ?3, ?4, 1
+                WHERE NOT EXISTS (SELECT 1 FROM memory_links
+                                  WHERE source_fact_id = ?2 AND target_fact_id = ?1)
+                  AND NOT EXISTS (SELECT 1 FROM memory_links
+                                  WHERE source_fact_id = ?1 AND target_fact_id = ?2
+                                    AND link_type != ?3)
+                ON CONFLICT(source_fact_id, target_fact_id, link_type) DO UPDATE
+                SET strength = excluded.strength,
+                    last_strengthened = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+                WHERE excluded.strength > memory_links.strength
+            """, rows).rowcount
+            created = conn.execute(
+                "SELECT COUNT(*) FROM memory_links WHERE id > ?", (last_id,)
+            ).fetchone()[0]
+            set_relink_watermark(conn, max_rowid)
+            return {'links_created': created, 'links_strengthened': max(changed, 0) - created}
+        
+        result = {
+            'mode': 'full' if watermark is None else 'incremental',
+            'facts_queried': len(queries),
+            'candidate_pairs': len(rows)
+        }
+        result.update(self.db.write(write))
+        return result
+    
     # ==================== LINK MANAGEMENT ====================
     
     def create_link(
@@ -308,11 +446,24 @@ class MemoryEvolution:
         strength: float = 0.5,
         bidirectional: bool = True
     ) -> Optional[Dict]:
-        """Create a link between two facts."""
+        """Create a link between two facts (committed by the shared writer thread)."""
         if link_type not in LINK_TYPES:
             return None
         
-        conn = sqlite3.connect(self.db_path)
+        return self.db.write(
+            lambda conn: self._write_link(conn, source_id, target_id, link_type, strength, bidirectional)
+        )
+    
+    def _write_link(
+        self,
+        conn: sqlite3.Connection,
+        source_id: int,
+        target_id: int,
+        link_type: str,
+        strength: float,
+        bidirectional: bool
+    ) -> Optional[Dict]:
+        """Insert a link, or strengthen it if it already exists (no commit)."""
         cur = conn.cursor()
         
         try:
@@ -322,17 +473,6 @@ class MemoryEvolution:
                 VALUES (?, ?, ?, ?, ?)
             """, (source_id, target_id, link_type, strength, int(bidirectional)))
             
-            link_id = cur.lastrowid
-            conn.commit()
-            
-            return {
-                'id': link_id,
-                'source': source_id,
-                'target': target_id,
-                'type': link_type,
-                'strength': strength
-            }
-            
         except sqlite3.IntegrityError:
             # Link already exists, strengthen it
             cur.execute("""
@@ -341,60 +481,63 @@ class MemoryEvolution:
                     last_strengthened = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
                 WHERE source_fact_id = ? AND target_fact_id = ? AND link_type = ?
             """, (source_id, target_id, link_type))
-            conn.commit()
             return None
         
-        finally:
-            conn.close()
+        return {
+            'id': cur.lastrowid,
+            'source': source_id,
+            'target': target_id,
+            'type': link_type,
+            'strength': strength
+        }
     
     def get_links(self, fact_id: int, direction: str = 'both') -> List[Dict]:
         """Get all links for a fact."""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
-        links = []
-        
-        if direction in ('both', 'outgoing'):
-            cur.execute("""
-                SELECT ml.id, ml.target_fact_id, ml.link_type, ml.strength,
-                       f.subject, f.content
-                FROM memory_links ml
-                JOIN facts f ON ml.target_fact_id = f.id
-                WHERE ml.source_fact_id = ?
-            """, (fact_id,))
+        with self.db.reader() as conn:
+            cur = conn.cursor()
             
-            for row in cur.fetchall():
-                links.append({
-                    'link_id': row[0],
-                    'direction': 'outgoing',
-                    'fact_id': row[1],
-                    'type': row[2],
-                    'strength': row[3],
-                    'subject': row[4],
-                    'content': row[5][:200]
-                })
-        
-        if direction in ('both', 'incoming'):
-            cur.execute("""
-                SELECT ml.id, ml.source_fact_id, ml.link_type, ml.strength,
-                       f.subject, f.content, ml.bidirectional
-                FROM memory_links ml
-                JOIN facts f ON ml.source_fact_id = f.id
-                WHERE ml.target_fact_id = ? AND ml.bidirectional = 1
-            """, (fact_id,))
+            links = []
+            
+            if direction in ('both', 'outgoing'):
+                cur.execute("""
+                    SELECT ml.id, ml.target_fact_id, ml.link_type, ml.strength,
+                           f.subject, f.content
+                    FROM memory_links ml
+                    JOIN facts f ON ml.target_fact_id = f.id
+                    WHERE ml.source_fact_id = ?
+                """, (fact_id,))
+                
+                for row in cur.fetchall():
+                    links.append({
+                        'link_id': row[0],
+                        'direction': 'outgoing',
+                        'fact_id': row[1],
+                        'type': row[2],
+                        'strength': row[3],
+                        'subject': row[4],
+                        'content': row[5][:200]
+                    })
             
-            for row in cur.fetchall():
-                links.append({
-                    'link_id': row[0],
-                    'direction': 'incoming',
-                    'fact_id': row[1],
-                    'type': row[2],
-                    'strength': row[3],
-                    'subject': row[4],
-                    'content': row[5][:200]
-                })
+            if direction in ('both', 'incoming'):
+                cur.execute("""
+                    SELECT ml.id, ml.source_fact_id, ml.link_type, ml.strength,
+                           f.subject, f.content, ml.bidirectional
+                    FROM memory_links ml
+                    JOIN facts f ON ml.source_fact_id = f.id
+                    WHERE ml.target_fact_id = ? AND ml.bidirectional = 1
+                """, (fact_id,))
+                
+                for row in cur.fetchall():
+                    links.append({
+                        'link_id': row[0],
+                        'direction': 'incoming',
+                        'fact_id': row[1],
+                        'type': row[2],
+                        'strength': row[3],
+                        'subject': row[4],
+                        'content': row[5][:200]
+                    })
         
-        conn.close()
         return links
     
     # ==================== MEMORY EVOLUTION ====================
@@ -407,64 +550,145 @@ class MemoryEvolution:
     ) -> Dict[str, Any]:
         """
         Update existing memories when new information arrives.
-        The A-Mem evolution pattern.
+        The A-Mem evolution pattern (a batch of one, see evolve_batch).
+        """
+        return self.evolve_batch([new_info], context, update_threshold)
+    
+    def evolve_batch(
+        self,
+        learnings: List[str],
+        context: str = "",
+        update_threshold: float = 0.6,
+        limit: int = 10
+    ) -> Dict[str, Any]:
+        """
+        Evolve memories with several pieces of new information at once.
+        
+        All learnings are embedded in one request and searched against the
+        resident fact index (exact matrix or IVF). Merges are applied in order
+        in a single transaction, so a later learning sees earlier merges. The
+        changed facts are then re-embedded in one request; their old vectors
+        stay in place until the new ones are written.
         """
         result = {
             'affected_memories': [],
             'updated': [],
-            'new_links': []
+            'new_links': [],
+            'reembedded': [],
+            'reembed_queued': []
         }
+        learnings = [learning for learning in learnings if learning]
+        if not learnings:
+            return result
         
         # Find memories that might be affected
         try:
-            new_embedding = self._get_embedding(new_info)
+            queries = np.asarray(
+                embeddings.get_embeddings(learnings, db_path=self.db_path), dtype=np.float32
+            )
         except Exception as e:
             return {'error': str(e)}
-        
-        affected = self._find_related_facts_by_embedding(
-            new_embedding,
-            threshold=update_threshold,
-            limit=10
-        )
-        result['affected_memories'] = affected
-        
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
-        for memory in affected:
-            # Check if this new info should update the memory
-            if self._should_update(memory['content'], new_info):
-                # Merge information
-                updated_content = self._merge_information(
-                    memory['content'],
-                    new_info,
-                    context
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        
+        provider = get_provider()
+        with self.db.reader() as conn:
+            if not matches_embedding_model(conn, provider.tag):
+                return result
+            with self._fact_index_lock:
+                facts = self._fact_vectors(conn, provider.dimensions)
+                matches = [
+                    facts.search(query, k=limit, min_score=update_threshold) for query in queries
+                ]
+        if not any(matches):
+            return result
+        
+        def apply(conn: sqlite3.Connection) -> Tuple[List[Dict], List[Dict], List[int]]:
+            ids = sorted({fact_id for hits in matches for fact_id, _ in hits})
+            current = {
+                row[0]: {'id': row[0], 'category': row[1], 'subject': row[2], 'content': row[3]}
+                for row in conn.execute(
+                    "SELECT id, category, subject, content FROM facts "
+                    "WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(ids),)
                 )
-                
-                # Log evolution
-                cur.execute("""
-                    INSERT INTO memory_evolutions 
-                    (fact_id, old_content, new_content, trigger)
-                    VALUES (?, ?, ?, ?)
-                """, (memory['id'], memory['content'], updated_content, new_info[:500]))
-                
-                # Update the fact
-                cur.execute("""
-                    UPDATE facts SET content = ? WHERE id = ?
-                """, (updated_content, memory['id']))
-                
-                result['updated'].append({
-                    'id': memory['id'],
-                    'subject': memory['subject'],
-                    'old': memory['content'][:200],
-                    'new': updated_content[:200]
-                })
-        
-        conn.commit()
-        conn.close()
+            }
+            affected, updated, changed = [], [], []
+            for n, (learning, hits) in enumerate(zip(learnings, matches)):
+                for fact_id, similarity in hits:
+                    memory = current.get(fact_id)
+                    if memory is None:
+                        continue
+                    affected.append(dict(memory, similarity=similarity, learning=n))
+                    
+                    # Check if this new info should update the memory
+                    if not self._should_update(memory['content'], learning):
+                        continue
+                    updated_content = self._merge_information(memory['content'], learning, context)
+                    
+                    # Log evolution
+                    conn.execute("""
+                        INSERT INTO memory_evolutions 
+                        (fact_id, old_content, new_content, trigger)
+                        VALUES (?, ?, ?, ?)
+                    """, (fact_id, memory['content'], updated_content, learning[:500]))
+                    
+                    updated.append({
+                        'id': fact_id,
+                        'subject': memory['subject'],
+                        'old': memory['content'][:200],
+                        'new': updated_content[:200],
+                        'learning': n
+                    })
+                    memory['content'] = updated_content
+                    if fact_id not in changed:
+                        changed.append(fact_id)
+            
+            # Update the facts (re-embedded below, once this commits)
+            conn.executemany(
+                "UPDATE facts SET content = ? WHERE id = ?",
+                [(current[fact_id]['content'], fact_id) for fact_id in changed]
+            )
+            for fact_id in changed:
+                index_fact(conn, fact_id, current[fact_id]['content'])
+            return affected, updated, [current[fact_id] for fact_id in changed]
         
+        affected, updated, changed = self.db.write(apply)
+        result['affected_memories'] = affected
+        result['updated'] = updated
+        if changed:
+            result.update(self._reembed_facts(changed, provider))
         return result
     
+    def _reembed_facts(self, facts: List[Dict], provider) -> Dict[str, List[int]]:
+        """
+        Replace the embeddings of edited facts ({id, subject, content}) with one
+        embedding request. If that fails the stale vectors are dropped instead,
+        which queues the facts for the backfill.
+        """
+        ids = [fact['id'] for fact in facts]
+        try:
+            vectors = embeddings.get_embeddings(
+                [f"{fact['subject']}: {fact['content']}" for fact in facts],
+                db_path=self.db_path, provider=provider
+            )
+        except Exception as e:
+            print(f"[Memory] Re-embedding {len(ids)} facts failed ({e}); left to the backfill")
+            self.db.write(lambda conn: delete_embeddings(conn, 'facts', ids))
+            return {'reembed_queued': ids}
+        
+        def write(conn: sqlite3.Connection) -> List[int]:
+            # Facts edited again (or deleted) since keep their vectors for that writer
+            current = dict(conn.execute(
+                "SELECT id, content FROM facts WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(ids),)
+            ).fetchall())
+            rows = [(fact['id'], vector) for fact, vector in zip(facts, vectors)
+                    if current.get(fact['id']) == fact['content']]
+            write_embeddings(conn, 'facts', rows)
+            return [fact_id for fact_id, _ in rows]
+        
+        return {'reembedded': self.db.write(write)}
+    
     def _should_update(self, existing: str, new_info: str) -> bool:
         """Determine if new info should update existing memory."""
         # Don't update if new info is too short
@@ -516,74 +740,31 @@ class MemoryEvolution:
     ) -> List[Dict]:
         """
         Discover all connected facts (multi-hop traversal).
-        BFS through the knowledge graph.
+        BFS over the cached link graph snapshot (see link_graph.py), or a
+        recursive CTE while the snapshot is being built.
         """
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
+        with self.db.reader() as conn:
+            graph = cached_graph(conn, self.db_path)
+            if graph is not None:
+                reached = graph.traverse(fact_id, max_hops, min_strength)
+            else:
+                reached = traverse_sql(conn, fact_id, max_hops, min_strength)
+            texts = fact_texts(conn, [r[0] for r in reached], max_chars=200)
         
-        visited = {fact_id}
-        to_visit = [(fact_id, 0)]  # (fact_id, hops)
         connections = []
-        
-        while to_visit:
-            current_id, hops = to_visit.pop(0)
-            
-            if hops >= max_hops:
+        for target_id, hops, path_from, link_type, strength in reached:
+            if target_id not in texts:
                 continue
-            
-            # Get direct links
-            cur.execute("""
-                SELECT ml.target_fact_id, ml.link_type, ml.strength,
-                       f.subject, f.content
-                FROM memory_links ml
-                JOIN facts f ON ml.target_fact_id = f.id
-                WHERE ml.source_fact_id = ? AND ml.strength >= ?
-            """, (current_id, min_strength))
-            
-            for target_id, link_type, strength, subject, content in cur.fetchall():
-                if target_id not in visited:
-                    visited.add(target_id)
-                    
-                    connections.append({
-                        'fact_id': target_id,
-                        'subject': subject,
-                        'content': content[:200],
-                        'link_type': link_type,
-                        'strength': strength,
-                        'hops': hops + 1,
-                        'path_from': current_id
-                    })
-                    
-                    to_visit.append((target_id, hops + 1))
-            
-            # Also check bidirectional incoming links
-            cur.execute("""
-                SELECT ml.source_fact_id, ml.link_type, ml.strength,
-                       f.subject, f.content
-                FROM memory_links ml
-                JOIN facts f ON ml.source_fact_id = f.id
-                WHERE ml.target_fact_id = ? 
-                  AND ml.bidirectional = 1 
-                  AND ml.strength >= ?
-            """, (current_id, min_strength))
-            
-            for source_id, link_type, strength, subject, content in cur.fetchall():
-                if source_id not in visited:
-                    visited.add(source_id)
-                    
-                    connections.append({
-                        'fact_id': source_id,
-                        'subject': subject,
-                        'content': content[:200],
-                        'link_type': f"{link_type} (reverse)",
-                        'strength': strength,
-                        'hops': hops + 1,
-                        'path_from': current_id
-                    })
-                    
-                    to_visit.append((source_id, hops + 1))
-        
-        conn.close()
+            subject, content = texts[target_id]
+            connections.append({
+                'fact_id': target_id,
+                'subject': subject,
+                'content': content,
+                'link_type': link_type,
+                'strength': strength,
+                'hops': hops,
+                'path_from': path_from
+            })
         
         # Sort by hops, then strength
         connections.sort(key=lambda x: (x['hops'], -x['strength']))
@@ -598,7 +779,7 @@ class MemoryEvolution:
             'orphan_facts_flagged': 0
         }
         
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cur = conn.cursor()
         
         # Remove weak links that haven't been strengthened recently
@@ -613,16 +794,7 @@ class MemoryEvolution:
         
         # Find orphan facts (no links, no recent access)
         # Don't delete, just flag for review
-        cur.execute("""
-            SELECT f.id, f.subject
-            FROM facts f
-            LEFT JOIN memory_links ml1 ON f.id = ml1.source_fact_id
-            LEFT JOIN memory_links ml2 ON f.id = ml2.target_fact_id
-            WHERE ml1.id IS NULL AND ml2.id IS NULL
-              AND f.created_at < datetime('now', ?)
-        """, (f'-{days_old} days',))
-        
-        orphans = cur.fetchall()
+        orphans = orphan_facts(conn, f'-{days_old} days')
         result['orphan_facts_flagged'] = len(orphans)
         result['orphans'] = [{'id': o[0], 'subject': o[1]} for o in orphans[:10]]
         
@@ -634,47 +806,38 @@ class MemoryEvolution:
     # ==================== STATISTICS ====================
     
     def get_graph_stats(self) -> Dict[str, Any]:
-        """Get statistics about the knowledge graph."""
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        
-        stats = {}
-        
-        cur.execute("SELECT COUNT(*) FROM facts")
-        stats['total_facts'] = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM memory_links")
-        stats['total_links'] = cur.fetchone()[0]
-        
-        cur.execute("""
-            SELECT link_type, COUNT(*) 
-            FROM memory_links 
-            GROUP BY link_type
-        """)
-        stats['links_by_type'] = dict(cur.fetchall())
-        
-        cur.execute("SELECT AVG(strength) FROM memory_links")
-        stats['avg_link_strength'] = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM memory_evolutions")
-        stats['total_evolutions'] = cur.fetchone()[0]
-        
-        # Most connected facts
-        cur.execute("""
-            SELECT f.id, f.subject, COUNT(ml.id) as link_count
-            FROM facts f
-            LEFT JOIN memory_links ml ON f.id = ml.source_fact_id 
-                                      OR f.id = ml.target_fact_id
-            GROUP BY f.id
-            ORDER BY link_count DESC
-            LIMIT 5
-        """)
-        stats['most_connected'] = [
-            {'id': r[0], 'subject': r[1], 'links': r[2]}
-            for r in cur.fetchall()
-        ]
+        """
+        Get statistics about the knowledge graph.
+        Link figures come from the trigger-maintained counters (see
+        link_stats.py), so this never scans memory_links.
+        """
+        with self.db.reader() as conn:
+            cur = conn.cursor()
+            
+            stats = {}
+            
+            cur.execute("SELECT COUNT(*) FROM facts")
+            stats['total_facts'] = cur.fetchone()[0]
+            
+            counts = link_type_counts(conn)
+            stats['total_links'] = sum(links for links, _ in counts.values())
+            stats['links_by_type'] = {
+                link_type: counts[link_type][0] for link_type in sorted(counts)
+            }
+            total_strength = sum(strength for _, strength in counts.values())
+            stats['avg_link_strength'] = (
+                total_strength / stats['total_links'] if stats['total_links'] else None
+            )
+            
+            cur.execute("SELECT COUNT(*) FROM memory_evolutions")
+            stats['total_evolutions'] = cur.fetchone()[0]
+            
+            # Most connected facts
+            stats['most_connected'] = [
+                {'id': fact_id, 'subject': subject, 'links': degree}
+                for fact_id, subject, degree in top_hubs(conn, 5)
+            ]
         
-        conn.close()
         return stats
 
 
@@ -694,6 +857,7 @@ def main():
         print("  connections <fact_id> [max_hops]   - Find all connections")
         print("  evolve <new_info> [context]        - Evolve affected memories")
         print("  prune [days]                       - Prune old weak links")
+        print("  relink [--full]                    - k-NN link facts embedded since last run")
         print("  stats                              - Show graph statistics")
         return
     
@@ -726,6 +890,10 @@ def main():
         result = mem.prune_obsolete(days)
         print(json.dumps(result, indent=2))
     
+    elif cmd == 'relink':
+        result = mem.relink(incremental='--full' not in sys.argv[2:])
+        print(json.dumps(result, indent=2))
+    
     elif cmd == 'stats':
         stats = mem.get_graph_stats()
         print(json.dumps(stats, indent=2))
@@ -16,7 +16,6 @@ Usage:
     python3 self_improve.py stats
 """
 
-import sqlite3
 import json
 import os
 import sys
@@ -31,6 +30,7 @@ sys.path.insert(0, str(CLAWD_DIR / "scripts"))
 from godel_core import GodelAgent
 from capability_builder import CapabilityBuilder
 from memory_evolution import MemoryEvolution
+from connections import connect
 
 DB_PATH = CLAWD_DIR / "atlas-memory" / "atlas_memory.db"
 
@@ -93,16 +93,11 @@ class SelfImprovementEngine:
             else:
                 output['improvements_pending'].append(improvement)
         
-        # 3. Evolve memories with learnings
-        for learning in reflection.get('learnings', []):
-            content = learning.get('content', '')
-            if content:
-                evolution = self.memory.evolve_memories(
-                    content,
-                    context=task_description
-                )
-                if evolution.get('updated'):
-                    output['memory_evolutions'].extend(evolution['updated'])
+        # 3. Evolve memories with learnings (one embedding request for all)
+        learnings = [learning.get('content', '') for learning in reflection.get('learnings', [])]
+        evolution = self.memory.evolve_batch(learnings, context=task_description)
+        if evolution.get('updated'):
+            output['memory_evolutions'].extend(evolution['updated'])
         
         # 4. Detect capability gaps from errors
         if result.get('errors'):
@@ -215,14 +210,17 @@ class SelfImprovementEngine:
         # 1. Run Gödel meta-improvement
         output['godel_meta'] = self.godel.meta_improve()
         
-        # 2. Get memory graph stats
+        # 2. Link facts embedded since the last run
+        output['relinked'] = self.memory.relink()
+        
+        # 3. Get memory graph stats
         output['graph_stats'] = self.memory.get_graph_stats()
         
-        # 3. Prune old weak links
+        # 4. Prune old weak links
         prune_result = self.memory.prune_obsolete(days_old=60)
         output['pruned'] = prune_result
         
-        # 4. Generate recommendations
+        # 5. Generate recommendations
         stats = output['graph_stats']
         
         if stats.get('total_links', 0) < stats.get('total_facts', 1) * 0.5:
@@ -281,7 +279,7 @@ class SelfImprovementEngine:
 # Keep old function signatures for existing code
 
 def get_db():
-    return sqlite3.connect(DB_PATH)
+    return connect(DB_PATH)
 
 def log_improvement(category: str, trigger: str, before: str, after: str, confidence: float):
     """Log a self-improvement action to the database."""